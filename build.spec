@@ -10,6 +10,7 @@ a = Analysis(
     hiddenimports=[
         'socketio',
         'engineio',
+        'aiohttp',
         'pywinauto',
         'PyQt5',
     ],
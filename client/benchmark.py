@@ -0,0 +1,692 @@
+"""Воспроизводимые замеры производительности клиента
+
+Запуск:
+    python -m client.benchmark run -o results.json [--quick] [-k compress]
+    python -m client.benchmark compare base.json results.json [--threshold 0.1]
+
+Все сценарии работают на синтетическом рабочем столе (FakeBackend) с
+фиксированным seed, диспетчеризация socket.io - через локальный сервер
+в том же процессе; сценарии import - холодный старт в отдельном
+процессе. compare завершается с кодом 1, если найдены регрессии.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+import threading
+import tracemalloc
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import psutil
+from client.config import Config
+from client.ui_capture import UITreeCapture
+from client.ui_fake import FakeBackend, generate_desktop
+from client.ui_hash import HashIndex
+from client.compression import CODECS, PRESET_DICTIONARY_ID, make_codec
+from client.ui_snapshot import Snapshot
+from client.ui_paths import PathResolver
+from client.ui_signature import ScreenSignatures
+from client.command_executor import CommandExecutor
+
+logger = logging.getLogger(__name__)
+
+# Метрики для сравнения: (ключ, больше - лучше)
+COMPARED = (
+    ('throughput', True),
+    ('latency_ms.p50', False),
+    ('latency_ms.p95', False),
+    ('peak_rss_mb', False),
+)
+
+
+def percentile(sorted_samples, q):
+    """Квантиль по отсортированной выборке (линейная интерполяция)"""
+    if not sorted_samples:
+        return 0.0
+    pos = (len(sorted_samples) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (pos - lower)
+
+
+class RssSampler:
+    """Пиковый RSS процесса за время блока (опрос в фоновом потоке)"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._done.clear()
+        self._thread = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def summarize(samples, wall, peak_rss, **extra):
+    """Результат сценария: пропускная способность, квантили задержки, пиковый RSS"""
+    ordered = sorted(samples)
+    result = {
+        'iterations': len(samples),
+        'wall_s': round(wall, 4),
+        'throughput': round(len(samples) / wall, 3) if wall else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(ordered, 0.50) * 1000, 3),
+            'p95': round(percentile(ordered, 0.95) * 1000, 3),
+            'p99': round(percentile(ordered, 0.99) * 1000, 3),
+            'mean': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+            'max': round(ordered[-1] * 1000, 3) if ordered else 0.0
+        },
+        'peak_rss_mb': round(peak_rss / 2 ** 20, 2)
+    }
+    result.update(extra)
+    return result
+
+
+def measure(func, iterations, concurrency=1, warmup=1, **extra):
+    """Замер func() заданное число раз (при concurrency > 1 - из пула потоков)"""
+    for _ in range(warmup):
+        func()
+    gc.collect()
+
+    samples = []
+
+    def timed(_):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(timed, range(iterations)))
+        else:
+            for i in range(iterations):
+                timed(i)
+        wall = time.perf_counter() - started
+
+    return summarize(samples, wall, rss.peak, **extra)
+
+
+IMPORT_PROBE = '''
+import sys, time, json
+started = time.perf_counter()
+module = __import__(sys.argv[1])
+elapsed = time.perf_counter() - started
+if sys.argv[2]:
+    import os
+    from client.config import Config
+    from client.connection import ClientConnection
+    ClientConnection('http://127.0.0.1:1', config=Config(os.devnull))
+import psutil
+print(json.dumps({'elapsed': elapsed, 'rss': psutil.Process().memory_info().rss,
+                  'modules': sorted(sys.modules)}))
+'''
+
+
+def count_nodes(tree):
+    stack = [tree]
+    count = 0
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get('children') or [])
+    return count
+
+
+def scenario_name(kind, **params):
+    return f"{kind}[{','.join(f'{key}={value}' for key, value in params.items())}]"
+
+
+def bench_element_to_dict(depth, fanout, iterations, batched=False):
+    """Обход синтетического дерева в словари (живой или пакетный)"""
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    capture = UITreeCapture(backend=backend, batched=batched, max_children=fanout)
+    root = backend.root()
+
+    if batched:
+        func = lambda: capture._capture_subtree(root)
+    else:
+        func = lambda: capture._element_to_dict(root)
+
+    return measure(func, iterations, nodes=count_nodes(func()))
+
+
+def bench_compress(depth, fanout, level, iterations):
+    """Сериализация и сжатие готового дерева"""
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    capture = UITreeCapture(backend=backend, max_children=fanout, compression_level=level)
+    tree = capture._element_to_dict(backend.root())
+
+    raw = len(json.dumps(tree, ensure_ascii=False).encode('utf-8'))
+    compressed = len(capture.compress(tree))
+    return measure(lambda: capture.compress(tree), iterations,
+                   raw_bytes=raw, compressed_bytes=compressed,
+                   ratio=round(compressed / raw, 4))
+
+
+def bench_codec(name, level, dictionary, depth, fanout, iterations):
+    """Сжатие дерева выбранным кодеком (с пресетным словарем или без)"""
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    capture = UITreeCapture(backend=backend, max_children=fanout)
+    capture.codec = make_codec(name, level, dictionary)
+    tree = capture._element_to_dict(backend.root())
+
+    raw = len(json.dumps(tree, ensure_ascii=False).encode('utf-8'))
+    compressed = len(capture.compress(tree))
+    return measure(lambda: capture.compress(tree), iterations,
+                   raw_bytes=raw, compressed_bytes=compressed,
+                   ratio=round(compressed / raw, 4))
+
+
+def bench_dedup(depth, fanout, iterations):
+    """Хэширование и сжатие повторно отправляемого дерева (все поддеревья известны)"""
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    capture = UITreeCapture(backend=backend, max_children=fanout)
+    capture.hash_index = HashIndex()
+    tree = capture._element_to_dict(backend.root())
+
+    first = len(capture.compress(capture.dedup(tree)))
+    repeat = len(capture.compress(capture.dedup(tree)))
+    return measure(lambda: capture.compress(capture.dedup(tree)), iterations,
+                   first_bytes=first, repeat_bytes=repeat)
+
+
+def retained_bytes(build):
+    """Объем памяти, которую удерживает результат build()"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_snapshot(depth, fanout, iterations):
+    """Построение компактного снимка и память, которую он удерживает, против словарей"""
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    capture = UITreeCapture(backend=backend, max_children=fanout)
+    tree = capture._element_to_dict(backend.root())
+
+    dict_bytes = retained_bytes(lambda: capture._element_to_dict(backend.root()))
+    snapshot_bytes = retained_bytes(lambda: Snapshot(tree))
+    return measure(lambda: Snapshot(tree), iterations,
+                   nodes=count_nodes(tree), dict_bytes=dict_bytes, snapshot_bytes=snapshot_bytes)
+
+
+def bench_query(depth, fanout, query, iterations):
+    """Поиск по индексу последнего снимка (без обхода UI)"""
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    capture = UITreeCapture(backend=backend, max_children=fanout)
+    capture.capture(full=True)
+    total = capture.query(query)['total']
+    return measure(lambda: capture.query(query), iterations, matches=total)
+
+
+def bench_resolve(depth, fanout, mode, iterations):
+    """Поиск элемента на глубине depth по пути или по ручке из результата поиска
+
+    mode: walk - путь по живым детям (без событий UI), tracking - путь из
+    кэша с проверкой через parent, handle - ручка с верным путем,
+    handle_moved - путь ручки устарел, окно обходится в ширину.
+    """
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    resolver = PathResolver(backend)
+    resolver.tracking = mode == 'tracking'
+    indices = [i % fanout for i in range(depth)]
+    path = '.'.join(map(str, indices))
+
+    element = backend.root()
+    for i in indices:
+        element = element.children[i]
+    window = backend.root().children[indices[0]]
+    handle = {
+        'window': window.uid,
+        'path': '.'.join(map(str, indices[1:])),
+        'control_type': element.props['control_type'],
+        'name': element.props['name'],
+        'automation_id': element.props['automation_id']
+    }
+    if mode == 'handle_moved':
+        # Соседи на пути переставлены - ручка указывает на другой элемент
+        window.children.reverse()
+
+    if mode.startswith('handle'):
+        nodes = sum(1 for _ in backend.elements())
+        func = lambda: resolver.resolve_handle(handle, max_nodes=nodes)
+    else:
+        func = lambda: resolver.resolve(path)
+    if func() is not element:
+        raise RuntimeError(f'{mode} resolved a different element')
+
+    backend.calls.clear()
+    func()
+    return measure(func, iterations, children_calls=backend.calls['children'],
+                   properties_calls=backend.calls['properties'], parent_calls=backend.calls['parent'])
+
+
+def bench_idle_capture(depth, fanout, signatures, iterations):
+    """Повторный захват рабочего стола без изменений (с подписями окон или без)"""
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    capture = UITreeCapture(backend=backend, max_children=fanout)
+    if signatures:
+        capture.signatures = ScreenSignatures()
+        backend.render_frame()
+    capture.capture_delta()
+
+    backend.calls.clear()
+    capture.capture_delta()
+    return measure(capture.capture_delta, iterations, properties_calls=backend.calls['properties'])
+
+
+def bench_import(module, iterations, construct=False):
+    """Холодный импорт в отдельном процессе: время импорта, RSS и число модулей
+
+    construct=True - еще и создание ClientConnection без подключения (простой клиента).
+    Отсутствие тяжелых модулей проверяет tests/test_imports.py.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+    peak_rss = 0
+    loaded = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE, module, '1' if construct else ''],
+            cwd=root, capture_output=True, text=True, check=True
+        ).stdout
+        probe = json.loads(output.splitlines()[-1])
+        samples.append(probe['elapsed'])
+        peak_rss = max(peak_rss, probe['rss'])
+        loaded = probe['modules']
+    wall = time.perf_counter() - started
+    return summarize(samples, wall, peak_rss, modules=len(loaded))
+
+
+def bench_execute(concurrency, iterations):
+    """Выполнение короткой команды оболочки"""
+    executor = CommandExecutor()
+    return measure(lambda: executor.execute('echo benchmark'), iterations,
+                   concurrency=concurrency)
+
+
+def bench_execute_output(megabytes, iterations):
+    """Команда с большим выводом: пиковый RSS должен оставаться ограниченным"""
+    executor = CommandExecutor()
+    command = (f'"{sys.executable}" -c "import sys; '
+               f'sys.stdout.write((\'x\' * 1023 + \'\\n\') * 1024 * {megabytes})"')
+    return measure(lambda: executor.execute(command, timeout=120), iterations, warmup=0,
+                   output_bytes=megabytes * 2 ** 20)
+
+
+class StandInServer:
+    """Локальный заменитель сервера socket.io для замера диспетчеризации
+
+    Отправляет клиенту события и меряет время до ответа (command_result или
+    ui_tree_update). Ответы сопоставляются с запросами по controller_sid,
+    а если его нет в ответе - по порядку отправки.
+    """
+
+    def __init__(self, host='127.0.0.1'):
+        # Серверная часть socket.io нужна только бенчмарку
+        import socketio
+        from aiohttp import web
+
+        self.host = host
+        self.port = None
+        self.sio = socketio.AsyncServer(async_mode='aiohttp')
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.loop = None
+        self.client_sid = None
+        self.registered = threading.Event()
+        self._started = threading.Event()
+        self._stop = None
+        self._thread = None
+        self._pending = {}
+
+        self.sio.on('register_client', self._on_register)
+        self.sio.on('command_result', self._on_response)
+        self.sio.on('ui_tree_update', self._on_response)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()),
+                                        name='standin-server', daemon=True)
+        self._thread.start()
+        self._started.wait(timeout=10)
+
+    def stop(self):
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    async def _serve(self):
+        from aiohttp import web
+
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, 0)
+        await site.start()
+        self.port = runner.addresses[0][1]
+        self._started.set()
+        try:
+            await self._stop.wait()
+        finally:
+            await runner.cleanup()
+
+    async def _on_register(self, sid, data):
+        self.client_sid = sid
+        await self.sio.emit('registered', {'client_id': 'benchmark', 'capabilities': []}, to=sid)
+        self.registered.set()
+
+    async def _on_response(self, sid, data):
+        request_id = data.get('controller_sid') if isinstance(data, dict) else None
+        future = self._pending.pop(request_id, None)
+        if future is None and self._pending:
+            future = self._pending.pop(next(iter(self._pending)))
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    async def _request(self, event, data, request_id):
+        future = self.loop.create_future()
+        self._pending[request_id] = future
+        started = time.perf_counter()
+        await self.sio.emit(event, dict(data, controller_sid=request_id), to=self.client_sid)
+        return await asyncio.wait_for(future, timeout=60) - started
+
+    async def _run(self, event, data, count, inflight):
+        limit = asyncio.Semaphore(inflight)
+
+        async def one(i):
+            async with limit:
+                return await self._request(event, data, f"bench-{i}")
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(i) for i in range(count)))
+        return samples, time.perf_counter() - started
+
+    def run(self, event, data, count, inflight=1):
+        """Отправка count событий не более чем по inflight одновременно: (задержки, время)"""
+        future = asyncio.run_coroutine_threadsafe(self._run(event, data, count, inflight), self.loop)
+        return future.result()
+
+
+def bench_dispatch(event, data, iterations, inflight=1, depth=3, fanout=5):
+    """Полный цикл: сервер -> обработчик клиента -> ответ серверу"""
+    # Импорт здесь: без сценария диспетчеризации socket.io не нужен
+    from client.connection import ClientConnection
+
+    server = StandInServer()
+    server.start()
+
+    # Пустая конфигурация, чтобы не зависеть от config.json в текущем каталоге
+    config = Config(os.devnull)
+    config.set('metrics_interval', 3600)
+    backend = FakeBackend(generate_desktop(depth=depth, fanout=fanout))
+    client = ClientConnection(server.url, config=config, ui_backend=backend)
+    thread = threading.Thread(target=lambda: asyncio.run(client.run()),
+                              name='benchmark-client', daemon=True)
+    thread.start()
+
+    try:
+        if not server.registered.wait(timeout=30):
+            raise RuntimeError('Client did not register with the stand-in server')
+
+        server.run(event, data, min(inflight, iterations), inflight)  # прогрев
+        gc.collect()
+        with RssSampler() as rss:
+            samples, wall = server.run(event, data, iterations, inflight)
+        return summarize(samples, wall, rss.peak, inflight=inflight)
+    finally:
+        client.stop()
+        thread.join(timeout=10)
+        server.stop()
+
+
+def build_scenarios(quick=False):
+    """Список сценариев: (имя, функция без аргументов)"""
+    def n(iterations):
+        return max(iterations // 5, 3) if quick else iterations
+
+    scenarios = [
+        (scenario_name('import', module='client.headless'),
+         lambda: bench_import('client.headless', n(10))),
+        (scenario_name('import', module='client.headless', construct=True),
+         lambda: bench_import('client.headless', n(10), construct=True)),
+    ]
+    # Большие рабочие столы: ~10 тыс. (4, 10) и ~100 тыс. (5, 10) элементов
+    large = {(4, 10): 10, (5, 10): 3}
+
+    for depth, fanout in ((3, 5), (4, 5), (4, 8), (5, 5), *large):
+        for batched in (False, True):
+            kind = 'element_to_dict_batched' if batched else 'element_to_dict'
+            scenarios.append((
+                scenario_name(kind, depth=depth, fanout=fanout),
+                lambda d=depth, f=fanout, b=batched, i=large.get((depth, fanout), 20):
+                    bench_element_to_dict(d, f, n(i), b)
+            ))
+
+    for depth, fanout in ((4, 5), (5, 5)):
+        for level in (1, 6, 9):
+            scenarios.append((
+                scenario_name('compress', depth=depth, fanout=fanout, level=level),
+                lambda d=depth, f=fanout, l=level: bench_compress(d, f, l, n(20))
+            ))
+    for (depth, fanout), iterations in large.items():
+        scenarios.append((
+            scenario_name('compress', depth=depth, fanout=fanout, level=6),
+            lambda d=depth, f=fanout, i=iterations: bench_compress(d, f, 6, n(i))
+        ))
+
+    # Кодеки, установленные в этом окружении, на уровнях из середины диапазона
+    for name, codec in CODECS.items():
+        for dictionary in ((None, PRESET_DICTIONARY_ID) if name != 'lz4' else (None,)):
+            level = codec.levels[len(codec.levels) // 2]
+            scenarios.append((
+                scenario_name('codec', name=name, level=level, dictionary=dictionary),
+                lambda c=name, l=level, d=dictionary: bench_codec(c, l, d, 4, 5, n(20))
+            ))
+
+    for depth, fanout in ((4, 5), (5, 5), *large):
+        scenarios.append((
+            scenario_name('snapshot', depth=depth, fanout=fanout),
+            lambda d=depth, f=fanout, i=large.get((depth, fanout), 20): bench_snapshot(d, f, n(i))
+        ))
+
+    for depth, fanout in ((4, 5), (5, 5)):
+        scenarios.append((
+            scenario_name('dedup', depth=depth, fanout=fanout),
+            lambda d=depth, f=fanout: bench_dedup(d, f, n(20))
+        ))
+
+    queries = {
+        'exact': {'control_type': 'Button'},
+        'wildcard': {'name': '*1?3*', 'ancestor': {'control_type': 'Window'}},
+    }
+    for match, query in queries.items():
+        scenarios.append((
+            scenario_name('query', match=match, depth=5, fanout=5),
+            lambda q=query: bench_query(5, 5, q, n(100))
+        ))
+
+    for mode in ('walk', 'tracking', 'handle', 'handle_moved'):
+        for depth, fanout in ((5, 5), (5, 10)):
+            scenarios.append((
+                scenario_name('resolve', mode=mode, depth=depth, fanout=fanout),
+                lambda m=mode, d=depth, f=fanout: bench_resolve(d, f, m, n(200))
+            ))
+
+    for signatures in (False, True):
+        scenarios.append((
+            scenario_name('idle_capture', signatures=signatures, depth=5, fanout=5),
+            lambda sig=signatures: bench_idle_capture(5, 5, sig, n(20))
+        ))
+
+    for concurrency in (1, 4, 8):
+        scenarios.append((
+            scenario_name('execute', concurrency=concurrency),
+            lambda c=concurrency: bench_execute(c, n(40))
+        ))
+
+    scenarios.append((
+        scenario_name('execute_output', mb=64),
+        lambda: bench_execute_output(64, n(5))
+    ))
+
+    click = {'element_path': '0.1', 'action': 'click', 'params': {}}
+    for inflight in (1, 16):
+        scenarios.append((
+            scenario_name('dispatch', event='ui_interact', inflight=inflight),
+            lambda i=inflight: bench_dispatch('ui_interact', click, n(500), inflight=i)
+        ))
+    scenarios.append((
+        scenario_name('dispatch', event='capture_ui_tree', depth=4, fanout=5),
+        lambda: bench_dispatch('capture_ui_tree', {'full': True}, n(20), depth=4, fanout=5)
+    ))
+    return scenarios
+
+
+def run(output=None, quick=False, select=None):
+    """Прогон сценариев, результаты - словарь для сохранения в JSON"""
+    results = {}
+    for name, func in build_scenarios(quick):
+        if select and not any(pattern in name for pattern in select):
+            continue
+        print(f"{name} ...", end=' ', flush=True)
+        try:
+            results[name] = func()
+        except Exception as e:
+            logger.error(f"Scenario {name} failed: {e}")
+            results[name] = {'error': str(e)}
+            print('FAILED')
+            continue
+        result = results[name]
+        print(f"{result['throughput']:.1f} ops/s, p50 {result['latency_ms']['p50']} ms, "
+              f"p95 {result['latency_ms']['p95']} ms, rss {result['peak_rss_mb']} MB")
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': quick
+        },
+        'results': results
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def _lookup(result, key):
+    value = result
+    for part in key.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(base, new, threshold=0.10):
+    """Сравнение двух прогонов: список строк с признаком регрессии
+
+    Регрессия - ухудшение метрики больше чем на threshold (доля).
+    """
+    rows = []
+    base_results = base.get('results', {})
+    new_results = new.get('results', {})
+    for name in base_results:
+        if name not in new_results:
+            continue
+        for key, higher_is_better in COMPARED:
+            old_value = _lookup(base_results[name], key)
+            new_value = _lookup(new_results[name], key)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            worse = -change if higher_is_better else change
+            rows.append({
+                'scenario': name,
+                'metric': key,
+                'base': old_value,
+                'new': new_value,
+                'change': round(change, 4),
+                'regression': worse > threshold
+            })
+    return rows
+
+
+def print_comparison(rows):
+    for row in rows:
+        mark = 'REGRESSION' if row['regression'] else ''
+        print(f"{row['scenario']:<60} {row['metric']:<16} {row['base']:>12} -> "
+              f"{row['new']:>12} {row['change'] * 100:+7.1f}% {mark}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Remote Access Client benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run scenarios')
+    run_parser.add_argument('-o', '--output', help='write results to JSON file')
+    run_parser.add_argument('--quick', action='store_true', help='fewer iterations')
+    run_parser.add_argument('-k', dest='select', action='append',
+                            help='run only scenarios containing this substring')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='allowed relative slowdown (default 0.10)')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == 'run':
+        run(args.output, args.quick, args.select)
+        return 0
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = compare(base, new, args.threshold)
+    print_comparison(rows)
+    regressions = sum(row['regression'] for row in rows)
+    print(f"{regressions} regression(s) over {args.threshold * 100:.0f}% threshold")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
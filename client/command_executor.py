@@ -1,40 +1,294 @@
-import subprocess
-import logging
-
-logger = logging.getLogger(__name__)
-
-
-class CommandExecutor:
-    def execute(self, command, timeout=30):
-        """Выполнение команды"""
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=timeout
-            )
-            
-            output = result.stdout + result.stderr
-            success = result.returncode == 0
-            
-            return {
-                'output': output,
-                'error': None if success else f"Exit code: {result.returncode}",
-                'success': success
-            }
-            
-        except subprocess.TimeoutExpired:
-            return {
-                'output': '',
-                'error': f'Command timeout ({timeout}s)',
-                'success': False
-            }
-        except Exception as e:
-            logger.error(f"Command execution error: {e}")
-            return {
-                'output': '',
-                'error': str(e),
-                'success': False
-            }
+import subprocess
+import threading
+import locale
+import codecs
+import uuid
+import sys
+import os
+import signal
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from client.metrics import metrics
+from client.output_buffer import OutputBuffer
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_STREAMS = ('stdout', 'stderr')
+MAX_PAGE_BYTES = 2 ** 20
+
+
+def output_result(buffers, error, success):
+    """Результат команды: вывод (с усечением) по потокам и вместе"""
+    stdout = buffers['stdout'].text()
+    stderr = buffers['stderr'].text()
+    return {
+        'output': stdout + stderr,
+        'stdout': stdout,
+        'stderr': stderr,
+        'truncated': any(buffer.truncated for buffer in buffers.values()),
+        'output_bytes': {name: buffer.total for name, buffer in buffers.items()},
+        'error': error,
+        'success': success
+    }
+
+
+class CommandExecutor:
+    def __init__(self, **limits):
+        self.limits = limits  # head_bytes, tail_bytes, max_spill_bytes для OutputBuffer
+    
+    def execute(self, command, timeout=30):
+        """Выполнение команды (вывод в памяти ограничен, как у заданий)"""
+        buffers = {name: OutputBuffer(**self.limits) for name in OUTPUT_STREAMS}
+        try:
+            with metrics.timer('subprocess'):
+                process = subprocess.Popen(
+                    command,
+                    shell=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    start_new_session=sys.platform != 'win32'
+                )
+                readers = start_readers(process, buffers)
+                try:
+                    process.wait(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    kill_process(process)
+                    process.wait()
+                    for reader in readers:
+                        reader.join()
+                    return output_result(buffers, f'Command timeout ({timeout}s)', False)
+                for reader in readers:
+                    reader.join()
+            
+            success = process.returncode == 0
+            return output_result(buffers, None if success else f"Exit code: {process.returncode}",
+                                 success)
+            
+        except Exception as e:
+            logger.error(f"Command execution error: {e}")
+            return {
+                'output': '',
+                'error': str(e),
+                'success': False
+            }
+        finally:
+            for buffer in buffers.values():
+                buffer.close()
+
+
+def start_readers(process, buffers, on_text=None):
+    """Потоки чтения stdout и stderr процесса в буферы; on_text(stream, text)"""
+    readers = [
+        threading.Thread(target=read_stream, daemon=True,
+                         args=(getattr(process, name), buffers[name], name, on_text))
+        for name in OUTPUT_STREAMS
+    ]
+    for reader in readers:
+        reader.start()
+    return readers
+
+
+def read_stream(stream, buffer, name, on_text=None):
+    """Чтение вывода процесса по мере появления"""
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace')
+    try:
+        while True:
+            data = stream.read1(4096)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                buffer.write(text)
+                if on_text:
+                    on_text(name, text)
+        text = decoder.decode(b'', final=True)
+        if text:
+            buffer.write(text)
+            if on_text:
+                on_text(name, text)
+    except Exception as e:
+        logger.error(f"Command output read error: {e}")
+    finally:
+        stream.close()
+
+
+def kill_process(process):
+    """Завершение процесса вместе с дочерними (shell=True)"""
+    try:
+        if sys.platform == 'win32':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except Exception as e:
+        logger.error(f"Failed to kill process {process.pid}: {e}")
+
+
+class CommandJobExecutor:
+    """Фоновое выполнение команд в пуле потоков с потоковым выводом и отменой
+    
+    Полный вывод усеченных заданий хранится (во временных файлах) для
+    постраничного чтения read_output(), не больше retain последних заданий.
+    """
+    
+    def __init__(self, max_workers=4, timeout=30, retain=16, **limits):
+        self.timeout = timeout
+        self.retain = retain
+        self.limits = limits  # head_bytes, tail_bytes, max_spill_bytes для OutputBuffer
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='command')
+        self._jobs = {}
+        self._outputs = OrderedDict()  # job_id -> буферы завершенных усеченных заданий
+        self._lock = threading.Lock()
+    
+    def submit(self, command, on_output=None, on_done=None, job_id=None, timeout=None):
+        """Постановка команды в очередь, возвращает идентификатор задания
+        
+        on_output(job_id, stream, text) вызывается по мере появления вывода,
+        on_done(job_id, result) - по завершении (результат как у CommandExecutor).
+        """
+        job_id = job_id or uuid.uuid4().hex
+        job = {
+            'command': command,
+            'process': None,
+            'cancelled': False,
+            'on_output': on_output,
+            'on_done': on_done,
+            'buffers': {name: OutputBuffer(**self.limits) for name in OUTPUT_STREAMS}
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        job['future'] = self.pool.submit(self._run, job_id, job, timeout or self.timeout)
+        return job_id
+    
+    def cancel(self, job_id):
+        """Отмена задания (в очереди или уже выполняющегося)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return False
+            # Флаг и процесс - под одной блокировкой с _run: процесс, запущенный
+            # после отмены, _run завершит сам
+            job['cancelled'] = True
+            process = job['process']
+        
+        future = job.get('future')  # еще нет, если _run начался раньше возврата из submit
+        if future is not None and future.cancel():
+            # Задание еще не начиналось - завершаем его сами
+            self._finish(job_id, job, {'output': '', 'error': 'Cancelled', 'success': False})
+        elif process and process.poll() is None:
+            kill_process(process)
+        return True
+    
+    def active_jobs(self):
+        """Идентификаторы незавершенных заданий"""
+        with self._lock:
+            return list(self._jobs)
+    
+    def read_output(self, job_id, stream='stdout', offset=0, limit=256 * 1024):
+        """Страница полного вывода задания (выполняющегося или сохраненного) или None"""
+        if stream not in OUTPUT_STREAMS:
+            raise ValueError(f'Unknown stream: {stream}')
+        with self._lock:
+            job = self._jobs.get(job_id)
+            buffers = job['buffers'] if job else self._outputs.get(job_id)
+        if buffers is None:
+            return None
+        return buffers[stream].read(max(offset, 0), min(max(limit, 1), MAX_PAGE_BYTES))
+    
+    def release_output(self, job_id):
+        """Удаление сохраненного вывода задания"""
+        with self._lock:
+            buffers = self._outputs.pop(job_id, None)
+        if buffers is None:
+            return False
+        for buffer in buffers.values():
+            buffer.close()
+        return True
+    
+    def shutdown(self):
+        """Отмена всех заданий, удаление сохраненного вывода и остановка пула"""
+        for job_id in self.active_jobs():
+            self.cancel(job_id)
+        self.pool.shutdown(wait=False)
+        with self._lock:
+            job_ids = list(self._outputs)
+        for job_id in job_ids:
+            self.release_output(job_id)
+    
+    def _run(self, job_id, job, timeout):
+        if job['cancelled']:
+            self._finish(job_id, job, {'output': '', 'error': 'Cancelled', 'success': False})
+            return
+        
+        started = time.perf_counter()
+        try:
+            process = subprocess.Popen(
+                job['command'],
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=sys.platform != 'win32'
+            )
+            with self._lock:
+                job['process'] = process
+                cancelled = job['cancelled']
+            if cancelled:
+                # Отмена пришла между проверкой выше и запуском процесса
+                kill_process(process)
+            
+            on_output = job['on_output']
+            readers = start_readers(
+                process, job['buffers'],
+                (lambda name, text: on_output(job_id, name, text)) if on_output else None
+            )
+            
+            timed_out = False
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                kill_process(process)
+                process.wait()
+            
+            for reader in readers:
+                reader.join()
+            metrics.observe('subprocess', time.perf_counter() - started)
+            
+            if job['cancelled']:
+                result = output_result(job['buffers'], 'Cancelled', False)
+            elif timed_out:
+                result = output_result(job['buffers'], f'Command timeout ({timeout}s)', False)
+            else:
+                success = process.returncode == 0
+                result = output_result(job['buffers'],
+                                       None if success else f"Exit code: {process.returncode}",
+                                       success)
+            
+        except Exception as e:
+            logger.error(f"Command execution error: {e}")
+            result = {'output': '', 'error': str(e), 'success': False}
+        
+        self._finish(job_id, job, result)
+    
+    def _finish(self, job_id, job, result):
+        with self._lock:
+            if self._jobs.pop(job_id, None) is None:
+                return
+            # Усеченный вывод остается доступным по страницам
+            evicted = []
+            if result.get('truncated'):
+                self._outputs[job_id] = job['buffers']
+                while len(self._outputs) > self.retain:
+                    evicted.append(self._outputs.popitem(last=False)[1])
+            else:
+                evicted.append(job['buffers'])
+        for buffers in evicted:
+            for buffer in buffers.values():
+                buffer.close()
+        if job['on_done']:
+            try:
+                job['on_done'](job_id, result)
+            except Exception as e:
+                logger.error(f"Command completion handler error: {e}")
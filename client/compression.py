@@ -0,0 +1,265 @@
+import zlib
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Необязательные кодеки: используются, только если установлены
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+PRESET_DICTIONARY_ID = 'ui2'
+EWMA_ALPHA = 0.3
+EXPLORE_EVERY = 16  # Каждый N-й вызов адаптивный выбор пробует соседний уровень
+
+
+def _preset_dictionary():
+    """Словарь из типичных фрагментов JSON UI-дерева и дельт
+
+    Должен совпадать байт в байт на клиенте и сервере (идентификатор
+    PRESET_DICTIONARY_ID). Частые фрагменты - в конце: zlib лучше
+    находит совпадения на малых расстояниях.
+    """
+    parts = [
+        '{"op": "children", "path": "", "children": [',
+        '{"op": "set", "path": "", "props": {"name": "", "rect": {',
+        '"child_count": 0, "has_more": false, "next_cursor": ',
+        '{"ref": "", "index": 0}, "hash": "',
+    ]
+    for control_type in ('Window', 'Pane', 'Button', 'Edit', 'Text', 'List', 'ListItem',
+                         'TreeItem', 'MenuItem', 'CheckBox', 'ComboBox', 'ToolBar',
+                         'Document', 'Group', 'Hyperlink', 'Image', 'Menu', 'MenuBar',
+                         'ScrollBar', 'StatusBar', 'Tab', 'TabItem', 'TitleBar', 'Tree'):
+        parts.append(f'"class_name": "{control_type}", "name": "", '
+                     f'"control_type": "{control_type}", "automation_id": "", ')
+    parts.append('"enabled": false, "visible": false, "children": [], "rect": null, ')
+    parts.append('{"class_name": "", "name": "", "control_type": "Pane", "automation_id": "", '
+                 '"enabled": true, "visible": true, "children": [], '
+                 '"rect": {"left": 0, "top": 0, "right": 0, "bottom": 0}, "index": 0}, ')
+    return ''.join(parts).encode('utf-8')
+
+
+PRESET_DICTIONARY = _preset_dictionary()
+DICTIONARIES = {PRESET_DICTIONARY_ID: PRESET_DICTIONARY}
+
+
+class Codec:
+    """Алгоритм сжатия с фиксированным или адаптивным уровнем
+
+    При level=None уровень выбирается по замерам: для каждого уровня
+    копятся скорость сжатия и степень сжатия, для канала - пропускная
+    способность (observe_link), и выбирается уровень с минимальным
+    временем "сжать + передать".
+    """
+    name = None
+    levels = ()
+
+    def __init__(self, level=None, dictionary=None, bandwidth=1.25e6):
+        self.level = level
+        self.dictionary = dictionary  # идентификатор из DICTIONARIES
+        self.bandwidth = bandwidth  # байт/с, начальная оценка канала
+        self._stats = {}  # уровень -> (байт/с сжатия, доля размера после сжатия)
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def describe(self):
+        """Поля сообщения, нужные серверу для распаковки"""
+        return {'codec': self.name, 'dictionary': self.dictionary}
+
+    def compress(self, data):
+        level = self.level if self.level is not None else self._choose(len(data))
+        start = time.perf_counter()
+        compressed = self._compress(data, level)
+        if self.level is None and data:
+            self._observe(level, len(data), len(compressed), time.perf_counter() - start)
+        return compressed
+
+    def compress_chunks(self, chunks):
+        """Сжатие последовательности bytes без склейки исходных данных в один буфер"""
+        # Стоимость уровней линейна по размеру, так что выбор от него не зависит
+        level = self.level if self.level is not None else self._choose(1)
+        start = time.perf_counter()
+        compressor = self._compressobj(level)
+        size = 0
+        parts = []
+        for chunk in chunks:
+            size += len(chunk)
+            parts.append(compressor.compress(chunk))
+        parts.append(compressor.flush())
+        compressed = b''.join(parts)
+        if self.level is None and size:
+            self._observe(level, size, len(compressed), time.perf_counter() - start)
+        return compressed, size
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+    def observe_link(self, nbytes, seconds):
+        """Замер доставки: nbytes дошли до сервера (с подтверждением) за seconds"""
+        if nbytes <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self.bandwidth += EWMA_ALPHA * (nbytes / seconds - self.bandwidth)
+
+    def _compress(self, data, level):
+        raise NotImplementedError
+
+    def _compressobj(self, level):
+        """Потоковый компрессор: compress(bytes) -> bytes, flush() -> bytes"""
+        raise NotImplementedError
+
+    def _observe(self, level, size, compressed_size, seconds):
+        speed = size / max(seconds, 1e-6)
+        ratio = compressed_size / size
+        with self._lock:
+            stats = self._stats.get(level)
+            if stats is None:
+                self._stats[level] = (speed, ratio)
+            else:
+                self._stats[level] = (stats[0] + EWMA_ALPHA * (speed - stats[0]),
+                                      stats[1] + EWMA_ALPHA * (ratio - stats[1]))
+
+    def _choose(self, size):
+        with self._lock:
+            self._calls += 1
+            for level in self.levels:
+                if level not in self._stats:
+                    return level
+
+            def cost(level):
+                speed, ratio = self._stats[level]
+                return size / speed + size * ratio / self.bandwidth
+
+            best = min(self.levels, key=cost)
+            if self._calls % EXPLORE_EVERY == 0:
+                # Условия канала и состав дерева меняются - иногда пробуем соседа
+                i = self.levels.index(best)
+                neighbours = self.levels[max(i - 1, 0):i] + self.levels[i + 1:i + 2]
+                return neighbours[(self._calls // EXPLORE_EVERY) % len(neighbours)]
+            return best
+
+
+class ZlibCodec(Codec):
+    name = 'zlib'
+    levels = (1, 3, 6, 9)
+
+    def _compress(self, data, level):
+        if self.dictionary is None:
+            return zlib.compress(data, level)
+        compressor = self._compressobj(level)
+        return compressor.compress(data) + compressor.flush()
+
+    def _compressobj(self, level):
+        if self.dictionary is None:
+            return zlib.compressobj(level)
+        return zlib.compressobj(level, zdict=DICTIONARIES[self.dictionary])
+
+    def decompress(self, data):
+        if self.dictionary is None:
+            return zlib.decompress(data)
+        decompressor = zlib.decompressobj(zdict=DICTIONARIES[self.dictionary])
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class ZstdCodec(Codec):
+    name = 'zstd'
+    levels = (1, 3, 6, 12, 19)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dict = None
+        if self.dictionary is not None:
+            self._dict = zstandard.ZstdCompressionDict(
+                DICTIONARIES[self.dictionary], dict_type=zstandard.DICT_TYPE_RAWCONTENT
+            )
+        # Компрессоры zstandard нельзя использовать из нескольких потоков сразу
+        self._local = threading.local()
+
+    def _compressor(self, level):
+        compressors = getattr(self._local, 'compressors', None)
+        if compressors is None:
+            compressors = self._local.compressors = {}
+        compressor = compressors.get(level)
+        if compressor is None:
+            compressor = compressors[level] = zstandard.ZstdCompressor(level=level, dict_data=self._dict)
+        return compressor
+
+    def _compress(self, data, level):
+        return self._compressor(level).compress(data)
+
+    def _compressobj(self, level):
+        return self._compressor(level).compressobj()
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor(dict_data=self._dict).decompress(data)
+
+
+class Lz4Codec(Codec):
+    name = 'lz4'
+    levels = (0, 4, 9, 16)
+
+    def _compress(self, data, level):
+        return lz4_frame.compress(data, compression_level=level)
+
+    def _compressobj(self, level):
+        return _Lz4Stream(level)
+
+    def decompress(self, data):
+        return lz4_frame.decompress(data)
+
+
+class _Lz4Stream:
+    """Интерфейс compressobj поверх LZ4FrameCompressor"""
+
+    def __init__(self, level):
+        self._compressor = lz4_frame.LZ4FrameCompressor(compression_level=level)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, b''
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        return self._header + self._compressor.flush()
+
+
+CODECS = {'zlib': ZlibCodec}
+if zstandard is not None:
+    CODECS['zstd'] = ZstdCodec
+if lz4_frame is not None:
+    CODECS['lz4'] = Lz4Codec
+
+
+def available_codecs():
+    """Предложение для регистрации: кодеки, их уровни и словари"""
+    return {
+        'codecs': {name: list(codec.levels) for name, codec in CODECS.items()},
+        'dictionaries': list(DICTIONARIES),
+        'adaptive': True
+    }
+
+
+def make_codec(name='zlib', level=None, dictionary=None, bandwidth=1.25e6):
+    """Кодек по выбору сервера; level='auto' или None - адаптивный уровень
+
+    Неизвестный кодек или словарь заменяются на zlib без словаря.
+    """
+    codec = CODECS.get(name)
+    if codec is None:
+        logger.warning(f"Codec {name} is not available, falling back to zlib")
+        codec = ZlibCodec
+    if dictionary is not None and (dictionary not in DICTIONARIES or codec is Lz4Codec):
+        logger.warning(f"Dictionary {dictionary} is not supported by {codec.name}, ignoring")
+        dictionary = None
+    if level == 'auto':
+        level = None
+    return codec(level=level, dictionary=dictionary, bandwidth=bandwidth)
@@ -1,32 +1,32 @@
-import json
-import os
-
-
-class Config:
-    def __init__(self, config_file='config.json'):
-        self.config_file = config_file
-        self.config = self.load()
-    
-    def load(self):
-        """Загрузка конфигурации"""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r') as f:
-                    return json.load(f)
-            except:
-                pass
-        return {}
-    
-    def save(self):
-        """Сохранение конфигурации"""
-        try:
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
-        except Exception as e:
-            print(f"Failed to save config: {e}")
-    
-    def get(self, key, default=None):
-        return self.config.get(key, default)
-    
-    def set(self, key, value):
-        self.config[key] = value
+import json
+import os
+
+
+class Config:
+    def __init__(self, config_file='config.json'):
+        self.config_file = config_file
+        self.config = self.load()
+    
+    def load(self):
+        """Загрузка конфигурации"""
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, 'r') as f:
+                    return json.load(f)
+            except:
+                pass
+        return {}
+    
+    def save(self):
+        """Сохранение конфигурации"""
+        try:
+            with open(self.config_file, 'w') as f:
+                json.dump(self.config, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save config: {e}")
+    
+    def get(self, key, default=None):
+        return self.config.get(key, default)
+    
+    def set(self, key, value):
+        self.config[key] = value
@@ -1,173 +1,1066 @@
-import socketio
-import platform
-import socket
-import json
-import logging
-from client.ui_capture import UITreeCapture
-from client.command_executor import CommandExecutor
-from client.ui_interaction import UIInteraction
-
-logger = logging.getLogger(__name__)
-
-
-class ClientConnection:
-    def __init__(self, server_url, status_callback=None):
-        self.server_url = server_url
-        self.status_callback = status_callback
-        self.client_id = None
-        
-        self.sio = socketio.Client(
-            logger=False,
-            engineio_logger=False,
-            reconnection=True,
-            reconnection_attempts=5,
-            reconnection_delay=10,  # Увеличено
-            reconnection_delay_max=30,
-            request_timeout=120  # Добавлено - ждем 2 минуты
-        )
-
-        
-        self.ui_capture = UITreeCapture()
-        self.command_executor = CommandExecutor()
-        self.ui_interaction = UIInteraction()
-        
-        self.setup_handlers()
-    
-    def update_status(self, message):
-        """Обновление статуса"""
-        logger.info(message)
-        if self.status_callback:
-            self.status_callback.emit(message)
-    
-    def setup_handlers(self):
-        """Настройка обработчиков событий"""
-        
-        @self.sio.event
-        def connect():
-            self.update_status("Connected to server!")
-            
-            # Регистрация клиента
-            info = {
-                'hostname': socket.gethostname(),
-                'platform': platform.platform(),
-                'python_version': platform.python_version(),
-                'capabilities': ['commands', 'ui_tree', 'ui_interaction']
-            }
-            
-            self.sio.emit('register_client', {
-                'client_id': None,
-                'info': info
-            })
-        
-        @self.sio.event
-        def registered(data):
-            self.client_id = data.get('client_id')
-            self.update_status(f"Registered as: {self.client_id}")
-        
-        @self.sio.event
-        def execute_command(data):
-            """Выполнение команды"""
-            command = data.get('command')
-            controller_sid = data.get('controller_sid')
-            
-            self.update_status(f"Executing: {command[:50]}...")
-            
-            result = self.command_executor.execute(command)
-            
-            self.sio.emit('command_result', {
-                'client_id': self.client_id,
-                'controller_sid': controller_sid,
-                'output': result['output'],
-                'error': result['error'],
-                'success': result['success']
-            })
-            
-            self.update_status(f"Command completed: {'SUCCESS' if result['success'] else 'FAILED'}")
-        
-        @self.sio.event
-        def capture_ui_tree(data):
-            """Захват UI-дерева"""
-            controller_sid = data.get('controller_sid')
-            full = data.get('full', True)
-            element_path = data.get('element_path')
-            
-            self.update_status("Capturing UI tree...")
-            
-            try:
-                ui_tree = self.ui_capture.capture(
-                    full=full,
-                    element_path=element_path
-                )
-                
-                compressed_data = self.ui_capture.compress(ui_tree)
-                
-                self.sio.emit('ui_tree_update', {
-                    'client_id': self.client_id,
-                    'ui_tree': compressed_data,
-                    'compressed': True,
-                    'delta': not full,
-                    'timestamp': time.time()
-                })
-                
-                self.update_status(f"UI tree sent ({len(compressed_data)} bytes compressed)")
-                
-            except Exception as e:
-                logger.error(f"UI capture error: {e}")
-                self.update_status(f"UI capture failed: {e}")
-        
-        @self.sio.event
-        def ui_interact(data):
-            """Взаимодействие с UI элементом"""
-            controller_sid = data.get('controller_sid')
-            element_path = data.get('element_path')
-            action = data.get('action')
-            params = data.get('params', {})
-            
-            self.update_status(f"UI interaction: {action} on {element_path}")
-            
-            try:
-                result = self.ui_interaction.interact(element_path, action, params)
-                
-                self.sio.emit('command_result', {
-                    'client_id': self.client_id,
-                    'controller_sid': controller_sid,
-                    'output': json.dumps(result),
-                    'error': None,
-                    'success': True
-                })
-                
-                self.update_status("UI interaction completed")
-                
-            except Exception as e:
-                logger.error(f"UI interaction error: {e}")
-                self.sio.emit('command_result', {
-                    'client_id': self.client_id,
-                    'controller_sid': controller_sid,
-                    'output': '',
-                    'error': str(e),
-                    'success': False
-                })
-        
-        @self.sio.event
-        def disconnect():
-            self.update_status("Disconnected from server")
-        
-        @self.sio.event
-        def connect_error(data):
-            self.update_status(f"Connection error: {data}")
-    
-    def connect(self):
-        """Подключение к серверу"""
-        try:
-            self.sio.connect(self.server_url)
-            self.update_status("Connection established")
-        except Exception as e:
-            logger.error(f"Failed to connect: {e}")
-            raise
-    
-    def disconnect(self):
-        """Отключение от сервера"""
-        if self.sio.connected:
-            self.sio.disconnect()
-        self.update_status("Disconnected")
-
+import socketio
+import asyncio
+import platform
+import socket
+import json
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from client.ui_hash import HashIndex, forget
+from client.endpoints import EndpointPool, parse_endpoints
+from client.outbound import OutboundQueue, LANE_BULK
+from client.compression import available_codecs, make_codec
+from client.command_executor import CommandExecutor, CommandJobExecutor
+from client.config import Config
+from client.metrics import metrics, payload_size
+
+logger = logging.getLogger(__name__)
+
+
+def _delivery_timer(codec, size):
+    """Callback подтверждения: замыкает только кодек, размер и время, но не само сообщение"""
+    started = time.perf_counter()
+    
+    def acknowledged(*args):
+        codec.observe_link(size, time.perf_counter() - started)
+    
+    return acknowledged
+
+
+class ClientConnection:
+    def __init__(self, server_url, status_callback=None, config=None, ui_backend=None):
+        self.status_callback = status_callback
+        self.config = config or Config()
+        # Один адрес или список: тогда подключение к самому быстрому из доступных,
+        # резервное подключение ко второму и переключение при обрыве
+        self.endpoints = EndpointPool(parse_endpoints(server_url),
+                                      probe_timeout=self.config.get('probe_timeout', 3.0))
+        self.server_url = self.endpoints.urls[0] if self.endpoints.urls else server_url
+        self.standby = None
+        self.standby_url = None
+        self._handlers = {}
+        self._failing_over = None
+        self._standby_check = None
+        # Сохраненная сессия: при переподключении сервер продолжает ее
+        self.client_id = self.config.get('client_id')
+        self.resume_token = self.config.get('resume_token')
+        self.server_capabilities = set()
+        self.ui_watch = None
+        self.ui_events = None
+        # Стек UI-автоматизации создается при первом UI-событии (см. _load_ui);
+        # согласованные с сервером кодек и индекс хэшей передаются ему тогда же
+        self._ui_backend = ui_backend
+        self._ui_capture = None
+        self._ui_interaction = None
+        self._ui_lock = threading.Lock()
+        self.codec = None
+        self.hash_index = None
+        
+        self.loop = None
+        self._stop_event = None
+        self._stop_requested = False
+        self._tasks = set()
+        self._outbound_ready = None
+        self._registered = None
+        # Все исходящие события идут через очередь с приоритетами
+        self.outbound = OutboundQueue(
+            max_bytes=self.config.get('outbound_max_bytes', 16 * 2 ** 20),
+            on_drop=self._outbound_dropped
+        )
+        self.outbound_block_timeout = self.config.get('outbound_block_timeout', 5.0)
+        # Захват, взаимодействие и прочая блокирующая работа - вне цикла событий
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.config.get('handler_workers', 8),
+            thread_name_prefix='handler'
+        )
+        
+        # Вывод команд: в памяти начало и конец, полностью - во временном файле
+        output_limits = {
+            'head_bytes': self.config.get('output_head_bytes', 64 * 1024),
+            'tail_bytes': self.config.get('output_tail_bytes', 64 * 1024),
+            'max_spill_bytes': self.config.get('output_spill_bytes', 256 * 2 ** 20)
+        }
+        self.command_executor = CommandExecutor(**output_limits)
+        self.command_jobs = CommandJobExecutor(
+            max_workers=self.config.get('command_workers', 4),
+            timeout=self.config.get('command_timeout', 30),
+            retain=self.config.get('output_retain_jobs', 16),
+            **output_limits
+        )
+        
+        self.setup_handlers()
+        self.sio = self._new_client()
+    
+    @property
+    def failover(self):
+        """Несколько серверов: переподключением управляет клиент, а не socket.io"""
+        return len(self.endpoints) > 1
+    
+    def _new_client(self):
+        """Клиент socket.io с обработчиками из setup_handlers"""
+        client = socketio.AsyncClient(
+            logger=False,
+            engineio_logger=False,
+            # С одним сервером переподключается сам socket.io: экспоненциальная
+            # задержка со случайным разбросом - быстро после коротких обрывов,
+            # без одновременного наплыва клиентов после длинных
+            reconnection=not self.failover,
+            reconnection_attempts=self.config.get('reconnect_attempts', 0),
+            reconnection_delay=self.config.get('reconnect_delay', 1),
+            reconnection_delay_max=self.config.get('reconnect_delay_max', 30),
+            randomization_factor=0.5,
+            request_timeout=120  # Добавлено - ждем 2 минуты
+        )
+        for name, func in self._handlers.items():
+            client.on(name, self._dispatcher(client, func))
+        return client
+    
+    def _dispatcher(self, client, func):
+        """Вызов обработчика только для активного подключения, с учетом трафика"""
+        async def wrapper(*args):
+            if client is not self.sio:
+                # Резервное подключение ничего не обрабатывает, важен только его обрыв
+                if func.__name__ == 'disconnect' and client is self.standby:
+                    self.standby = None
+                    logger.info(f"Standby connection to {self.standby_url} lost")
+                    self._standby_check.set()
+                return
+            metrics.inc('events_in')
+            if args:
+                metrics.inc('bytes_in', payload_size(args[0]))
+            return await func(*args)
+        return wrapper
+    
+    @property
+    def ui_backend(self):
+        self._load_ui()
+        return self._ui_backend
+    
+    @property
+    def ui_capture(self):
+        self._load_ui()
+        return self._ui_capture
+    
+    @property
+    def ui_interaction(self):
+        self._load_ui()
+        return self._ui_interaction
+    
+    @property
+    def ui_loaded(self):
+        return self._ui_capture is not None
+    
+    def _load_ui(self):
+        """Импорт и создание стека UI-автоматизации (один раз, из любого потока)
+        
+        Сессии, в которых приходят только команды, его не загружают вовсе.
+        """
+        if self._ui_capture is not None:
+            return
+        with self._ui_lock:
+            if self._ui_capture is not None:
+                return
+            from client.ui_backend import PywinautoBackend
+            from client.ui_capture import UITreeCapture
+            from client.ui_interaction import UIInteraction
+            from client.ui_paths import PathResolver
+            
+            started = time.perf_counter()
+            backend = self._ui_backend or PywinautoBackend()
+            resolver = PathResolver(backend)
+            capture = UITreeCapture(
+                backend=backend,
+                batched=True,
+                resolver=resolver,
+                workers=self.config.get('capture_workers', 4),
+                window_budget=self.config.get('window_budget', 5.0),
+                compression_level=self.config.get('compression_level', 6)
+            )
+            if self.config.get('screen_signatures', True):
+                from client.ui_signature import ScreenSignatures
+                capture.signatures = ScreenSignatures(max_age=self.config.get('signature_max_age', 60.0))
+            capture.hash_index = self.hash_index
+            if self.codec is not None:
+                capture.codec = self.codec
+            
+            self._ui_backend = backend
+            self._ui_interaction = UIInteraction(backend=backend, resolver=resolver)
+            self._ui_capture = capture
+            self._start_ui_events(backend, resolver)
+            metrics.observe('ui_load', time.perf_counter() - started)
+            logger.info("UI automation stack loaded")
+    
+    def _start_ui_events(self, backend, resolver):
+        """Подписка на изменения UI на все время работы стека UI
+        
+        События нужны кэшу путей (без них он не доверяет закэшированным
+        элементам внутри окон) и подписке на дерево (ui_watch).
+        """
+        if not self.config.get('ui_events', True):
+            return
+        source = backend.event_source()
+        if source is None:
+            return
+        
+        def changed(window_id):
+            resolver.changed(window_id)
+            watch = self.ui_watch
+            if watch is not None:
+                watch.notify(window_id)
+        
+        try:
+            source.start(changed)
+        except Exception as e:
+            # Без событий кэш путей проходит пути по живым детям, а подписка -
+            # только контрольными проходами
+            logger.error(f"UI event subscription failed: {e}")
+            return
+        resolver.tracking = True
+        self.ui_events = source
+    
+    def _stop_ui_events(self):
+        source, self.ui_events = self.ui_events, None
+        if source is not None:
+            source.stop()
+            if self._ui_interaction is not None:
+                self._ui_interaction.resolver.tracking = False
+                self._ui_interaction.resolver.invalidate()
+    
+    def update_status(self, message):
+        """Обновление статуса"""
+        logger.info(message)
+        if self.status_callback:
+            self.status_callback.emit(message)
+    
+    def emit(self, event, data, group=None, replace=False, on_sent=None):
+        """Постановка события в очередь отправки (можно вызывать из любого потока)
+        
+        group/replace - см. OutboundQueue: например, полное дерево заменяет
+        еще не отправленные дерево и дельты. on_sent() вызывается в цикле
+        событий, когда сообщение отправлено (вытесненное - не вызывается).
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        
+        # Рабочие потоки ждут места в очереди, пока есть связь; цикл событий - никогда
+        connected = self._registered is not None and self._registered.is_set()
+        timeout = self.outbound_block_timeout if running is None and connected else 0
+        self.outbound.put(event, data, group=group, replace=replace, timeout=timeout, on_sent=on_sent)
+        
+        if self.loop is not None and not self.loop.is_closed():
+            if running is self.loop:
+                self._outbound_ready.set()
+            else:
+                self.loop.call_soon_threadsafe(self._outbound_ready.set)
+    
+    def _outbound_dropped(self, item):
+        """Вытесненная из очереди дельта ломает цепочку - нужна полная пересылка"""
+        if item.group == 'ui_tree':
+            self.ui_capture.reset_base()
+    
+    async def _drain(self):
+        """Отправка очереди по мере появления сообщений и наличия связи"""
+        while True:
+            await self._registered.wait()
+            item = self.outbound.get()
+            if item is None:
+                self._outbound_ready.clear()
+                item = self.outbound.get()
+                if item is None:
+                    await self._outbound_ready.wait()
+                    continue
+            
+            if not self._registered.is_set():
+                self.outbound.requeue(item)
+                continue
+            
+            try:
+                await self._emit(item.event, item.data, callback=self._link_probe(item))
+            except asyncio.CancelledError:
+                self.outbound.requeue(item)
+                raise
+            except Exception as e:
+                logger.warning(f"Emit '{item.event}' failed, will retry: {e}")
+                self.outbound.requeue(item)
+                await asyncio.sleep(1)
+                continue
+            
+            if item.on_sent is not None:
+                try:
+                    item.on_sent()
+                except Exception as e:
+                    logger.error(f"Post-send hook for '{item.event}' failed: {e}")
+    
+    def _link_probe(self, item):
+        """Callback подтверждения крупной отправки: оценка канала для выбора уровня сжатия
+        
+        emit() возвращается, как только пакет поставлен в очередь engine.io,
+        поэтому канал оценивается по времени до подтверждения сервером.
+        Только для серверов с возможностью event_ack: python-socketio держит
+        callback до подтверждения, и без него они копились бы до конца связи.
+        """
+        # Только деревья: их сжимает этот кодек. Через _ui_capture, а не свойство -
+        # страницы вывода команд не должны загружать стек UI
+        capture = self._ui_capture
+        if capture is None or 'event_ack' not in self.server_capabilities or \
+                not item.event.startswith('ui_tree') or \
+                item.lane != LANE_BULK or item.size < 16384:
+            return None
+        return _delivery_timer(capture.codec, item.size)
+    
+    async def _emit(self, event, data, callback=None):
+        metrics.inc('events_out')
+        metrics.inc('bytes_out', payload_size(data))
+        with metrics.timer('emit'):
+            await self.sio.emit(event, data, callback=callback)
+    
+    def handler(self, func):
+        """Регистрация обработчика события сервера (для всех клиентов socket.io)"""
+        self._handlers[func.__name__] = func
+        return func
+    
+    def spawn(self, coro):
+        """Запуск задачи в цикле событий с учетом для отмены при остановке"""
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    def offload(self, func, *args):
+        """Выполнение блокирующей функции в пуле, не задерживая другие события"""
+        received = time.perf_counter()
+        
+        def timed():
+            # receive - ожидание свободного потока, handler.* - сама работа
+            metrics.observe('receive', time.perf_counter() - received)
+            with metrics.timer(f'handler.{func.__name__}'):
+                func(*args)
+        
+        async def run():
+            try:
+                await self.loop.run_in_executor(self.executor, timed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Handler error in {func.__name__}: {e}")
+        
+        return self.spawn(run())
+    
+    async def _register(self):
+        """Регистрация на сервере (с токеном - продолжение прежней сессии)"""
+        info = {
+            'hostname': socket.gethostname(),
+            'platform': platform.platform(),
+            'python_version': platform.python_version(),
+            'capabilities': ['commands', 'ui_tree', 'ui_interaction', 'ui_tree_delta',
+                             'ui_tree_stream', 'ui_tree_binary',
+                             'ui_tree_subscribe', 'ui_tree_lazy', 'ui_interact_batch',
+                             'client_metrics', 'ui_tree_dedup', 'session_resume',
+                             'compression_negotiation', 'ui_query', 'command_output_paging',
+                             'command_started'],
+            'hash_index_size': self.config.get('hash_index_size', 4096),
+            'compression': available_codecs()
+        }
+        
+        # С токеном сервер продолжает прежнюю сессию: тот же client_id,
+        # состояние контроллеров и база дерева
+        await self._emit('register_client', {
+            'client_id': self.client_id,
+            'resume_token': self.resume_token,
+            'resume': {
+                'seq': self._ui_capture.seq if self.ui_loaded else 0,
+                'jobs': self.command_jobs.active_jobs()
+            },
+            'info': info
+        })
+    
+    def setup_handlers(self):
+        """Настройка обработчиков событий"""
+        
+        @self.handler
+        async def connect():
+            self.update_status(f"Connected to server {self.server_url}")
+            await self._register()
+        
+        @self.handler
+        async def registered(data):
+            resumed = bool(data.get('resumed')) and data.get('client_id') == self.client_id
+            self.client_id = data.get('client_id')
+            self.server_capabilities = set(data.get('capabilities') or [])
+            
+            if data.get('resume_token') and data['resume_token'] != self.resume_token:
+                self.resume_token = data['resume_token']
+                self.config.set('client_id', self.client_id)
+                self.config.set('resume_token', self.resume_token)
+                await self.loop.run_in_executor(None, self.config.save)
+            
+            if 'ui_tree_dedup' not in self.server_capabilities:
+                self.hash_index = None
+            elif not resumed or self.hash_index is None:
+                # Новая сессия - неизвестно, какие поддеревья сохранил сервер
+                self.hash_index = HashIndex(self.config.get('hash_index_size', 4096))
+            
+            # Кодек и уровень выбирает сервер; без выбора - прежний zlib
+            compression = data.get('compression')
+            if compression:
+                previous = self._ui_capture.codec if self.ui_loaded else self.codec
+                self.codec = make_codec(
+                    compression.get('codec', 'zlib'),
+                    compression.get('level'),
+                    compression.get('dictionary'),
+                    bandwidth=previous.bandwidth if previous else 1.25e6
+                )
+            
+            if self.ui_loaded:
+                self._ui_capture.hash_index = self.hash_index
+                if self.codec is not None:
+                    self._ui_capture.codec = self.codec
+            
+            if resumed:
+                # Досылаем дельту от версии, которая есть у сервера
+                if data.get('seq') is not None and self.ui_loaded:
+                    self.offload(self.resync_ui_tree, data['seq'])
+            else:
+                # Очередь дерева адресована прошлой сессии
+                self.outbound.discard('ui_tree')
+                if self.ui_loaded:
+                    self._ui_capture.reset_base()
+            
+            self._registered.set()
+            self.update_status(f"{'Resumed' if resumed else 'Registered'} as: {self.client_id}")
+        
+        @self.handler
+        async def ui_tree_ack(data):
+            """Сервер применил версию дерева seq"""
+            if self.ui_loaded:
+                self._ui_capture.acknowledge(data.get('seq', 0))
+        
+        @self.handler
+        async def execute_command(data):
+            """Выполнение команды (в пуле, без блокировки обработчика)"""
+            self.execute_command(data)
+        
+        @self.handler
+        async def cancel_command(data):
+            """Отмена выполняющейся команды"""
+            self.offload(self.cancel_command, data)
+        
+        @self.handler
+        async def get_command_output(data):
+            """Страница полного вывода задания"""
+            self.offload(self.get_command_output, data)
+        
+        @self.handler
+        async def release_command_output(data):
+            """Сохраненный вывод задания больше не нужен"""
+            self.command_jobs.release_output(data.get('job_id'))
+        
+        @self.handler
+        async def capture_ui_tree(data):
+            """Захват UI-дерева"""
+            self.offload(self.capture_ui_tree, data)
+        
+        @self.handler
+        async def subscribe_ui_tree(data):
+            """Подписка на дельты UI-дерева по событиям"""
+            self.offload(self.start_ui_watch,
+                         data.get('debounce', 0.3),
+                         data.get('heartbeat_min', 5.0),
+                         data.get('heartbeat_max', 60.0))
+        
+        @self.handler
+        async def unsubscribe_ui_tree(data):
+            """Отмена подписки на дельты UI-дерева"""
+            self.offload(self.stop_ui_watch)
+        
+        @self.handler
+        async def ui_interact(data):
+            """Взаимодействие с UI элементом"""
+            self.offload(self.ui_interact, data)
+        
+        @self.handler
+        async def ui_interact_batch(data):
+            """Пакет действий с UI за один запрос"""
+            self.offload(self.ui_interact_batch, data)
+        
+        @self.handler
+        async def ui_query(data):
+            """Поиск элементов по свойствам без пересылки дерева"""
+            self.offload(self.ui_query, data)
+        
+        @self.handler
+        async def ui_hash_miss(data):
+            """Сервер не нашел поддеревья по хэшам - повторная отправка целиком"""
+            self.offload(self.resend_ui_tree, data)
+        
+        @self.handler
+        async def disconnect():
+            self._registered.clear()
+            self.update_status("Disconnected from server")
+            if self.failover and not self._stop_requested and self._failing_over is None:
+                self._failing_over = self.spawn(self._failover())
+        
+        @self.handler
+        async def connect_error(data):
+            self.update_status(f"Connection error: {data}")
+    
+    def execute_command(self, data):
+        """Постановка команды в пул заданий"""
+        command = data.get('command')
+        controller_sid = data.get('controller_sid')
+        stream = data.get('stream', False)
+        
+        self.update_status(f"Executing: {command[:50]}...")
+        
+        def on_output(job_id, stream_name, text):
+            self.emit('command_output', {
+                'client_id': self.client_id,
+                'controller_sid': controller_sid,
+                'job_id': job_id,
+                'stream': stream_name,
+                'data': text
+            }, group=f'command:{job_id}')
+        
+        def on_done(job_id, result):
+            message = {
+                'client_id': self.client_id,
+                'controller_sid': controller_sid,
+                'job_id': job_id,
+                'error': result['error'],
+                'success': result['success']
+            }
+            # При потоковой передаче вывод уже отправлен частями
+            if 'command_output_paging' in self.server_capabilities:
+                # Потоки раздельно; усеченный вывод дочитывается через get_command_output
+                message.update({
+                    'stdout': '' if stream else result.get('stdout', ''),
+                    'stderr': '' if stream else result.get('stderr', ''),
+                    'truncated': result.get('truncated', False),
+                    'output_bytes': result.get('output_bytes')
+                })
+            else:
+                message['output'] = '' if stream else result['output']
+            # Группа задания: результат не обгонит вывод, стоящий в очереди
+            self.emit('command_result', message, group=f'command:{job_id}')
+            
+            self.update_status(f"Command completed: {'SUCCESS' if result['success'] else 'FAILED'}")
+        
+        # Идентификатор задания сообщается сразу, чтобы контроллер мог отменить
+        # команду до ее завершения (command_started уходит раньше command_result)
+        job_id = data.get('job_id') or uuid.uuid4().hex
+        self.emit('command_started', {
+            'client_id': self.client_id,
+            'controller_sid': controller_sid,
+            'job_id': job_id,
+            'command': command
+        })
+        self.command_jobs.submit(
+            command,
+            on_output=on_output if stream else None,
+            on_done=on_done,
+            job_id=job_id,
+            timeout=data.get('timeout')
+        )
+    
+    def cancel_command(self, data):
+        """Отмена задания (выполняется в пуле: завершение дерева процессов блокирует)"""
+        job_id = data.get('job_id')
+        if self.command_jobs.cancel(job_id):
+            self.update_status(f"Command cancelled: {job_id}")
+        else:
+            self.update_status(f"Cancel failed, no such job: {job_id}")
+    
+    def get_command_output(self, data):
+        """Отправка страницы полного вывода задания (выполняется в пуле)"""
+        message = {
+            'client_id': self.client_id,
+            'controller_sid': data.get('controller_sid'),
+            'job_id': data.get('job_id'),
+            'stream': data.get('stream', 'stdout')
+        }
+        try:
+            page = self.command_jobs.read_output(
+                data.get('job_id'),
+                message['stream'],
+                offset=data.get('offset', 0),
+                limit=data.get('limit', 256 * 1024)
+            )
+            if page is None:
+                message['error'] = 'Output not found'
+            else:
+                message.update(page)
+        except Exception as e:
+            logger.error(f"Command output read error: {e}")
+            message['error'] = str(e)
+        self.emit('command_output_page', message)
+    
+    def capture_ui_tree(self, data):
+        """Захват и отправка UI-дерева (выполняется в пуле)"""
+        controller_sid = data.get('controller_sid')
+        full = data.get('full', True)
+        element_path = data.get('element_path')
+        
+        self.update_status("Capturing UI tree...")
+        
+        try:
+            if data.get('lazy'):
+                # Неглубокое дерево, глубже контроллер раскрывает по путям
+                ui_tree = self.ui_capture.expand(
+                    element_path,
+                    depth=data.get('depth', 1),
+                    offset=data.get('cursor') or 0,
+                    limit=data.get('page_size', 100)
+                )
+                self.send_ui_tree(ui_tree, False, self.ui_capture.seq, data.get('encoding'),
+                                  extra={'lazy': True, 'element_path': element_path})
+                return
+            
+            if data.get('stream') and not element_path and full:
+                self.stream_ui_tree(controller_sid)
+                return
+            
+            if full or element_path:
+                ui_tree = self.ui_capture.capture(
+                    full=full,
+                    element_path=element_path
+                )
+                delta = False
+                seq = self.ui_capture.seq
+            else:
+                # Дельта относительно снимка, который есть у контроллера
+                update = self.ui_capture.capture_delta(data.get('base_seq'))
+                delta = update.get('delta', False)
+                seq = update.get('seq', self.ui_capture.seq)
+                ui_tree = update if delta else update.get('tree', update)
+            
+            self.send_ui_tree(ui_tree, delta, seq, data.get('encoding'),
+                              extra={'element_path': element_path} if element_path else None)
+            
+        except Exception as e:
+            logger.error(f"UI capture error: {e}")
+            self.update_status(f"UI capture failed: {e}")
+    
+    def ui_interact(self, data):
+        """Действие над UI элементом (выполняется в пуле)"""
+        controller_sid = data.get('controller_sid')
+        element_path = data.get('element_path')
+        action = data.get('action')
+        params = data.get('params', {})
+        
+        self.update_status(f"UI interaction: {action} on {element_path}")
+        
+        try:
+            result = self.ui_interaction.interact(element_path, action, params, data.get('handle'))
+            
+            self.emit('command_result', {
+                'client_id': self.client_id,
+                'controller_sid': controller_sid,
+                'output': json.dumps(result),
+                'error': None,
+                'success': True
+            })
+            
+            self.update_status("UI interaction completed")
+            
+        except Exception as e:
+            logger.error(f"UI interaction error: {e}")
+            self.emit('command_result', {
+                'client_id': self.client_id,
+                'controller_sid': controller_sid,
+                'output': '',
+                'error': str(e),
+                'success': False
+            })
+    
+    def ui_query(self, data):
+        """Поиск элементов по индексу снимка (выполняется в пуле)
+        
+        Ответ содержит совпадения с element_path и ручками (handle), которые
+        можно передать в ui_interact вместо пути.
+        """
+        controller_sid = data.get('controller_sid')
+        
+        try:
+            result = self.ui_capture.query(
+                data.get('query'),
+                limit=data.get('limit', 100),
+                refresh=data.get('refresh', False)
+            )
+            result['success'] = True
+        except Exception as e:
+            logger.error(f"UI query error: {e}")
+            result = {'success': False, 'error': str(e), 'matches': []}
+        
+        result.update({
+            'client_id': self.client_id,
+            'controller_sid': controller_sid,
+            'query_id': data.get('query_id')
+        })
+        self.emit('ui_query_result', result)
+    
+    def ui_interact_batch(self, data):
+        """Выполнение пакета действий с UI (выполняется в пуле)"""
+        controller_sid = data.get('controller_sid')
+        steps = data.get('steps') or []
+        
+        self.update_status(f"UI batch: {len(steps)} steps")
+        
+        try:
+            result = self.ui_interaction.run_batch(steps, data.get('stop_on_error', True))
+            
+            self.emit('command_result', {
+                'client_id': self.client_id,
+                'controller_sid': controller_sid,
+                'batch_id': data.get('batch_id'),
+                'output': json.dumps(result),
+                'error': None if result['success'] else 'Batch step failed',
+                'success': result['success']
+            })
+            
+            self.update_status(f"UI batch completed in {result['elapsed_ms']} ms")
+            
+        except Exception as e:
+            logger.error(f"UI batch error: {e}")
+            self.emit('command_result', {
+                'client_id': self.client_id,
+                'controller_sid': controller_sid,
+                'batch_id': data.get('batch_id'),
+                'output': '',
+                'error': str(e),
+                'success': False
+            })
+    
+    def send_ui_tree(self, ui_tree, delta, seq, encoding=None, extra=None, supersede=False):
+        """Сжатие и отправка дерева или дельты"""
+        # Бинарный формат - только для целых деревьев и если сервер его принял
+        # (маркеры ленивого захвата в нем не передаются)
+        encoding = encoding or ('binary' if 'ui_tree_binary' in self.server_capabilities else 'json')
+        lazy = bool(extra and extra.get('lazy'))
+        whole = bool(not delta and not lazy and ui_tree and 'error' not in ui_tree)
+        # Ссылки на поддеревья есть только в JSON, а экономят они больше бинарного формата
+        index = self.ui_capture.hash_index
+        dedup = whole and index is not None
+        codec = self.ui_capture.codec
+        # Новые хэши - в индекс только после отправки: замененное
+        # или вытесненное из очереди дерево сервер не получит
+        sent = []
+        if dedup:
+            encoding = 'json'
+            compressed_data = self.ui_capture.compress(self.ui_capture.dedup(ui_tree, sent), codec)
+        elif encoding == 'binary' and whole:
+            compressed_data = self.ui_capture.compress_binary(ui_tree, codec)
+        else:
+            encoding = 'json'
+            compressed_data = self.ui_capture.compress(ui_tree, codec)
+        
+        message = {
+            'client_id': self.client_id,
+            'ui_tree': compressed_data,
+            'compressed': True,
+            'encoding': encoding,
+            'delta': delta,
+            'dedup': dedup,
+            'seq': seq,
+            'timestamp': time.time()
+        }
+        message.update(codec.describe())
+        if extra:
+            message.update(extra)
+        
+        # Снимки рабочего стола и дельты - одна цепочка версий: новый снимок
+        # заменяет неотправленные, а потеря любого звена требует полной пересылки
+        chain = bool(ui_tree and 'error' not in ui_tree and not lazy
+                     and not (extra and extra.get('element_path')))
+        
+        def delivered():
+            for digest in sent:
+                index.add(digest)
+        
+        self.emit('ui_tree_update', message,
+                  group='ui_tree' if chain else None, replace=chain and (supersede or not delta),
+                  on_sent=delivered if sent else None)
+        
+        self.update_status(f"UI tree sent ({len(compressed_data)} bytes compressed)")
+    
+    def resync_ui_tree(self, server_seq):
+        """Дельта от версии дерева, которая есть у сервера, до текущего состояния"""
+        if self.ui_capture.last_tree is None:
+            return
+        
+        update = self.ui_capture.capture_delta(base_seq=server_seq)
+        if 'error' in update or (update['delta'] and not update['ops']
+                                 and update['base_seq'] == update['seq']):
+            return
+        
+        # Дельта от серверной версии заменяет всю неотправленную цепочку
+        if update['delta']:
+            self.send_ui_tree(update, True, update['seq'], supersede=True)
+        else:
+            self.send_ui_tree(update['tree'], False, update['seq'])
+    
+    def resend_ui_tree(self, data):
+        """Повторная отправка последнего снимка без ссылок на потерянные хэши"""
+        with self.ui_capture._lock:
+            snapshot = self.ui_capture.last_tree
+            seq = self.ui_capture.seq
+        if snapshot is None:
+            return
+        ui_tree = snapshot.to_dict()
+        
+        index = self.ui_capture.hash_index
+        if index is not None:
+            forget(ui_tree, index, data.get('hashes') or [])
+        self.send_ui_tree(ui_tree, False, seq, extra={'resend': True})
+    
+    def start_ui_watch(self, debounce=0.3, heartbeat_min=5.0, heartbeat_max=60.0):
+        """Запуск отправки дельт по событиям UI"""
+        from client.ui_watch import CaptureScheduler
+        self.stop_ui_watch()
+        
+        # События UI (если бэкенд их дает) подписаны при загрузке стека UI;
+        # без них остается только контрольный проход
+        self._load_ui()
+        self.ui_watch = CaptureScheduler(
+            self.push_ui_changes,
+            debounce=debounce,
+            heartbeat_min=heartbeat_min,
+            heartbeat_max=heartbeat_max
+        )
+        self.ui_watch.start()
+        self.update_status("UI tree subscription started")
+    
+    def stop_ui_watch(self):
+        """Остановка отправки дельт по событиям UI"""
+        if self.ui_watch:
+            self.ui_watch.stop()
+            self.ui_watch = None
+            self.update_status("UI tree subscription stopped")
+    
+    def push_ui_changes(self, dirty):
+        """Захват и отправка изменений (dirty=None - полный контрольный проход)"""
+        if dirty is None:
+            update = self.ui_capture.capture_delta()
+        else:
+            update = self.ui_capture.refresh(dirty)
+        
+        if 'error' in update:
+            return False
+        
+        if update['delta'] and not update['ops']:
+            self.emit('ui_tree_heartbeat', {
+                'client_id': self.client_id,
+                'seq': update['seq'],
+                'timestamp': time.time()
+            }, group='heartbeat', replace=True)
+            return False
+        
+        if update['delta']:
+            self.send_ui_tree(update, True, update['seq'])
+        else:
+            self.send_ui_tree(update['tree'], False, update['seq'])
+        return True
+    
+    def stream_ui_tree(self, controller_sid):
+        """Потоковая отправка полного UI-дерева бинарными блоками"""
+        from client.ui_stream import iter_chunks
+        stream_id = uuid.uuid4().hex
+        total = 0
+        
+        for index, chunk, final in iter_chunks(self.ui_capture.iter_json(full=True)):
+            message = {
+                'client_id': self.client_id,
+                'controller_sid': controller_sid,
+                'stream_id': stream_id,
+                'index': index,
+                'data': chunk,
+                'final': final
+            }
+            if final:
+                message['seq'] = self.ui_capture.seq
+                message['timestamp'] = time.time()
+            self.emit('ui_tree_chunk', message, group=f'stream:{stream_id}')
+            total += len(chunk)
+        
+        self.update_status(f"UI tree streamed ({total} bytes in {index + 1} chunks)")
+    
+    async def run(self):
+        """Подключение и работа до вызова stop()"""
+        self._stop_event = asyncio.Event()
+        self._outbound_ready = asyncio.Event()
+        self._registered = asyncio.Event()
+        self._standby_check = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        if self._stop_requested:
+            self._stop_event.set()
+        
+        try:
+            await self._connect()
+            self.update_status("Connection established")
+        except Exception as e:
+            logger.error(f"Failed to connect: {e}")
+            await self._shutdown()
+            raise
+        
+        reporter = self.spawn(self._report_metrics())
+        sender = self.spawn(self._drain())
+        if self.failover:
+            self.spawn(self._keep_standby())
+        if len(self.outbound):
+            self._outbound_ready.set()
+        try:
+            await self._stop_event.wait()
+        finally:
+            reporter.cancel()
+            sender.cancel()
+            await self._shutdown()
+    
+    async def _connect(self):
+        """Подключение к серверу; из нескольких - к самому быстрому доступному"""
+        if not self.failover:
+            await self.sio.connect(self.server_url)
+            return
+        
+        errors = []
+        for url in await self.endpoints.rank():
+            # Обработчики принимают события только от self.sio - назначаем до connect
+            self.sio, self.server_url = self._new_client(), url
+            try:
+                await self.sio.connect(url)
+                return
+            except Exception as e:
+                self.endpoints.mark_failed(url)
+                errors.append(f"{url}: {e}")
+        raise ConnectionError(f"No server available ({'; '.join(errors) or 'all probes failed'})")
+    
+    async def _failover(self):
+        """Переход на резервный или другой доступный сервер после обрыва
+        
+        Регистрация идет с resume_token, так что сервер продолжает ту же
+        сессию (client_id, задания, база дерева), как при переподключении
+        к прежнему серверу.
+        """
+        self.endpoints.mark_failed(self.server_url)
+        delay = self.config.get('reconnect_delay', 1)
+        delay_max = self.config.get('reconnect_delay_max', 30)
+        try:
+            while not self._stop_requested:
+                standby = self.standby
+                if standby is not None and standby.connected:
+                    # Резервное подключение уже установлено - остается только регистрация
+                    self.standby = None
+                    self.sio, self.server_url = standby, self.standby_url
+                    try:
+                        await self._register()
+                        metrics.inc('failovers')
+                        self.update_status(f"Switched to standby server {self.server_url}")
+                        return
+                    except Exception as e:
+                        logger.warning(f"Standby server {self.server_url} failed: {e}")
+                        self.endpoints.mark_failed(self.server_url)
+                        continue
+                
+                try:
+                    await self._connect()
+                    metrics.inc('failovers')
+                    return
+                except Exception as e:
+                    logger.warning(f"Reconnect failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, delay_max)
+        finally:
+            self._failing_over = None
+            self._standby_check.set()
+    
+    async def _keep_standby(self):
+        """Резервное подключение (без регистрации) к лучшему из остальных серверов"""
+        interval = self.config.get('standby_interval', 30)
+        while True:
+            try:
+                if self._failing_over is None:
+                    await self._check_standby()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Standby check error: {e}")
+            
+            try:
+                await asyncio.wait_for(self._standby_check.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._standby_check.clear()
+    
+    async def _check_standby(self):
+        """Новое резервное подключение, если прежнего нет или оно оборвалось
+        
+        Живое подключение само подтверждает доступность сервера (engine.io
+        обменивается ping/pong), поэтому серверы опрашиваются только при
+        выборе нового резервного.
+        """
+        standby = self.standby
+        if standby is not None and standby.connected and self.standby_url != self.server_url:
+            return
+        
+        self.standby = None
+        if standby is not None and standby.connected:
+            await standby.disconnect()
+        ranked = [url for url in await self.endpoints.rank() if url != self.server_url]
+        if not ranked:
+            return
+        
+        client = self._new_client()
+        self.standby, self.standby_url = client, ranked[0]
+        try:
+            await client.connect(ranked[0])
+            logger.info(f"Standby connection to {ranked[0]} established")
+        except Exception as e:
+            logger.warning(f"Standby connection to {ranked[0]} failed: {e}")
+            self.endpoints.mark_failed(ranked[0])
+            if self.standby is client:
+                self.standby = None
+    
+    async def _report_metrics(self):
+        """Периодическая отправка метрик и запись их в файл Prometheus"""
+        interval = self.config.get('metrics_interval', 60)
+        metrics_file = self.config.get('metrics_file')
+        while True:
+            await asyncio.sleep(interval)
+            if self._registered.is_set():
+                self.emit('client_metrics', {
+                    'client_id': self.client_id,
+                    'metrics': metrics.snapshot(),
+                    'timestamp': time.time()
+                }, group='metrics', replace=True)
+            if metrics_file:
+                await self.loop.run_in_executor(None, metrics.write_prometheus, metrics_file)
+    
+    def stop(self):
+        """Запрос остановки (можно вызывать из любого потока)"""
+        self._stop_requested = True
+        if self.loop is not None and self._stop_event is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+    
+    async def _shutdown(self):
+        """Отмена незавершенных задач и отключение"""
+        self._stop_requested = True  # Обрыв при отключении не должен запускать переключение
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        
+        await self.loop.run_in_executor(None, self.stop_ui_watch)
+        await self.loop.run_in_executor(None, self._stop_ui_events)
+        self.command_jobs.shutdown()
+        if self.ui_loaded:
+            self._ui_capture.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        
+        # Фоновые попытки переподключения отменит завершение цикла событий
+        if self.standby is not None and self.standby.connected:
+            await self.standby.disconnect()
+        if self.sio.connected:
+            await self.sio.disconnect()
+        self.update_status("Disconnected")
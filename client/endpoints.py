@@ -0,0 +1,100 @@
+import json
+import time
+import asyncio
+import logging
+from client.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.3
+
+
+def parse_endpoints(value):
+    """Список адресов серверов из строки 'url1, url2' или списка"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace(';', ',').split(',')
+    return [url.strip().rstrip('/') for url in value if url and url.strip()]
+
+
+class EndpointPool:
+    """Адреса серверов с оценкой задержки и доступности
+
+    rank() опрашивает все адреса одновременно (рукопожатие engine.io по
+    HTTP, открытая им сессия сразу закрывается) и возвращает доступные по
+    возрастанию сглаженной задержки. Опрос нужен только при выборе
+    сервера: на каждом сервере он ненадолго создает сессию.
+    Адрес, к которому не удалось подключиться, помечается недоступным до
+    следующего успешного опроса.
+    """
+
+    def __init__(self, urls, probe_timeout=3.0):
+        self.urls = list(urls)
+        self.probe_timeout = probe_timeout
+        self.latency = {}  # адрес -> сглаженная задержка, с
+        self.failed = set()
+
+    def __len__(self):
+        return len(self.urls)
+
+    async def rank(self):
+        """Доступные адреса, лучшие первыми"""
+        if len(self.urls) == 1:
+            return list(self.urls)
+
+        import aiohttp
+        timeout = aiohttp.ClientTimeout(total=self.probe_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            results = await asyncio.gather(*(self._probe(session, url) for url in self.urls))
+
+        for url, latency in zip(self.urls, results):
+            if latency is None:
+                self.failed.add(url)
+                continue
+            self.failed.discard(url)
+            previous = self.latency.get(url)
+            self.latency[url] = latency if previous is None else \
+                previous + EWMA_ALPHA * (latency - previous)
+
+        healthy = [url for url in self.urls if url not in self.failed]
+        ranked = sorted(healthy, key=lambda url: self.latency[url])
+        logger.debug("Endpoints: " + ', '.join(
+            f"{url} {'down' if url in self.failed else f'{self.latency[url] * 1000:.0f} ms'}"
+            for url in self.urls
+        ))
+        return ranked
+
+    def mark_failed(self, url):
+        self.failed.add(url)
+
+    async def _probe(self, session, url):
+        """Время рукопожатия engine.io или None, если сервер не отвечает"""
+        started = time.perf_counter()
+        try:
+            async with session.get(f"{url}/socket.io/",
+                                   params={'EIO': '4', 'transport': 'polling'}) as response:
+                body = await response.text()
+                if response.status != 200:
+                    return None
+        except Exception as e:
+            logger.debug(f"Endpoint {url} probe failed: {e}")
+            return None
+        latency = time.perf_counter() - started
+        metrics.observe('endpoint_probe', latency)
+        await self._close_session(session, url, body)
+        return latency
+
+    async def _close_session(self, session, url, body):
+        """Пакет close для сессии рукопожатия, иначе сервер держит ее до ping timeout"""
+        try:
+            # Ответ рукопожатия: '0{"sid": ...}' (пакеты разделены \x1e)
+            packet = body.split('\x1e', 1)[0]
+            if not packet.startswith('0'):
+                return
+            sid = json.loads(packet[1:])['sid']
+            async with session.post(f"{url}/socket.io/", data='1',
+                                    params={'EIO': '4', 'transport': 'polling', 'sid': sid}) as response:
+                await response.read()
+        except Exception as e:
+            logger.debug(f"Endpoint {url} probe session not closed: {e}")
@@ -0,0 +1,110 @@
+"""Клиент без графического интерфейса (службы, тонкие VDI-сессии)
+
+Запуск:
+    python -m client.headless [--server URL[,URL...]] [--config config.json] [--log-file client.log]
+
+Адреса серверов берутся из аргумента или из server_urls / server_url
+в конфигурации.
+PyQt5 не импортируется, стек UI-автоматизации загружается при первом
+UI-событии от сервера.
+"""
+import sys
+import signal
+import asyncio
+import argparse
+import logging
+from client.config import Config
+from client.connection import ClientConnection
+from client.utils import is_admin, setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class HeadlessClient:
+    """Подключение до остановки с повтором первичного подключения
+
+    Переподключение после обрыва выполняет сам socket.io; здесь повторяется
+    только неудачная первая попытка (сервер еще не поднялся и т.п.).
+    """
+
+    def __init__(self, server_url, config):
+        self.server_url = server_url
+        self.config = config
+        self.client = None
+        self.stopped = False
+        self._wake = None
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        delay = self.config.get('reconnect_delay', 1)
+        delay_max = self.config.get('reconnect_delay_max', 30)
+        while not self.stopped:
+            self.client = ClientConnection(self.server_url, config=self.config)
+            try:
+                await self.client.run()
+                return
+            except Exception as e:
+                if self.stopped:
+                    return
+                logger.warning(f"Connection failed, retrying in {delay}s: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, delay_max)
+
+    def stop(self):
+        """Остановка (вызывается в цикле событий, в том числе по сигналу)"""
+        self.stopped = True
+        if self._wake is not None:
+            self._wake.set()
+        if self.client:
+            self.client.stop()
+
+
+async def _serve(headless):
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, headless.stop)
+        except (NotImplementedError, RuntimeError):
+            # Windows: обработчик сигнала вызывается между шагами цикла
+            signal.signal(signum, lambda *args: loop.call_soon_threadsafe(headless.stop))
+    await headless.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Remote Access Client (headless)')
+    parser.add_argument('--server', help='server URL or comma-separated URLs '
+                                         '(default: server_urls / server_url from config)')
+    parser.add_argument('--config', default='config.json', help='config file')
+    parser.add_argument('--log-file', default='client.log', help="log file ('' - console only)")
+    parser.add_argument('--log-level', default='INFO', help='logging level')
+    parser.add_argument('--log-max-bytes', type=int, default=5 * 2 ** 20,
+                        help='log file size before rotation')
+    parser.add_argument('--log-backups', type=int, default=3, help='rotated log files to keep')
+    args = parser.parse_args(argv)
+
+    setup_logging(args.log_file or None, getattr(logging, args.log_level.upper(), logging.INFO),
+                  max_bytes=args.log_max_bytes, backup_count=args.log_backups)
+
+    config = Config(args.config)
+    server_url = args.server or config.get('server_urls') or config.get('server_url')
+    if not server_url:
+        logger.error("No server URL: pass --server or set server_urls in config")
+        return 2
+
+    if sys.platform == 'win32' and not is_admin():
+        logger.warning("Not running as administrator, elevated windows will not be accessible")
+
+    logger.info(f"Starting Remote Access Client (headless), server {server_url}")
+    headless = HeadlessClient(server_url, config)
+    try:
+        asyncio.run(_serve(headless))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
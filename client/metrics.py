@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: от 0.1 мс до ~105 с, удвоением
+BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+
+
+class Histogram:
+    """Гистограмма длительностей (секунды) с фиксированными корзинами"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя - больше верхней границы
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (target - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Реестр счетчиков и гистограмм задержек по этапам"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Замер длительности блока в гистограмму этапа"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """Текущие значения: счетчики и p50/p95/p99 по этапам (в миллисекундах)"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'latency_ms': {
+                    stage: {
+                        'count': h.count,
+                        'sum': round(h.sum * 1000, 3),
+                        'p50': round(h.percentile(0.50) * 1000, 3),
+                        'p95': round(h.percentile(0.95) * 1000, 3),
+                        'p99': round(h.percentile(0.99) * 1000, 3)
+                    }
+                    for stage, h in self.histograms.items()
+                }
+            }
+
+    def to_prometheus(self, prefix='remote_client'):
+        """Текстовый формат Prometheus"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+
+            if self.histograms:
+                lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for stage, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Запись в файл (для node_exporter textfile collector и т.п.)"""
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to write metrics file: {e}")
+
+
+def payload_size(data):
+    """Приблизительный размер сообщения: сумма длин строк и bytes"""
+    if isinstance(data, (str, bytes, bytearray)):
+        return len(data)
+    if isinstance(data, dict):
+        return sum(payload_size(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return sum(payload_size(value) for value in data)
+    return 8
+
+
+# Общий реестр клиента
+metrics = Metrics()
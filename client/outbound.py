@@ -0,0 +1,165 @@
+import threading
+import itertools
+import logging
+from collections import deque
+from client.metrics import metrics, payload_size
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: меньше - раньше (и вытесняется позже)
+LANE_INTERACTIVE = 0
+LANE_STREAM = 1
+LANE_STATUS = 2
+LANE_BULK = 3
+
+EVENT_LANES = {
+    'register_client': LANE_INTERACTIVE,
+    'command_started': LANE_INTERACTIVE,
+    'command_result': LANE_INTERACTIVE,
+    'command_output': LANE_STREAM,
+    'ui_query_result': LANE_INTERACTIVE,
+    'ui_tree_heartbeat': LANE_STATUS,
+    'client_metrics': LANE_STATUS,
+    'ui_tree_update': LANE_BULK,
+    'ui_tree_chunk': LANE_BULK,
+    'command_output_page': LANE_BULK,
+}
+
+
+class OutboundItem:
+    """Сообщение в очереди отправки"""
+    __slots__ = ('event', 'data', 'lane', 'size', 'group', 'on_sent', 'seq')
+
+    def __init__(self, event, data, lane, size, group=None, on_sent=None, seq=0):
+        self.event = event
+        self.data = data
+        self.lane = lane
+        self.size = size
+        self.group = group
+        self.on_sent = on_sent  # Вызывается после отправки (не после вытеснения)
+        self.seq = seq  # Порядок постановки в очередь
+
+
+class OutboundQueue:
+    """Очередь отправки с полосами приоритета и ограничением по байтам
+
+    get() отдает сообщения по полосам (интерактивные ответы раньше деревьев),
+    внутри полосы - по порядку. Сообщения группы (например, цепочка дельт
+    дерева, блоки одного потока или вывод и результат одной команды)
+    имеют смысл только вместе:
+      - сообщение не обгоняет более старые сообщения своей группы из низших
+        полос (результат команды уходит после ее потокового вывода);
+      - put(..., replace=True) выбрасывает из очереди устаревшие сообщения
+        своей группы (новое полное дерево заменяет прежние дерево и дельты);
+      - при переполнении вытесняются самые старые сообщения низшей полосы,
+        и вместе с ними их группа в этой полосе (потоковый вывод команды
+        уходит целиком, ее результат остается); on_drop(item) вызывается для каждого.
+    """
+
+    def __init__(self, max_bytes=16 * 2 ** 20, on_drop=None):
+        self.max_bytes = max_bytes
+        self.on_drop = on_drop
+        self.lanes = [deque() for _ in range(LANE_BULK + 1)]
+        self.bytes = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def put(self, event, data, lane=None, group=None, replace=False, timeout=0, on_sent=None):
+        """Постановка сообщения; timeout - сколько ждать освобождения места
+
+        Возвращает False, если сообщение сразу было вытеснено.
+        """
+        lane = EVENT_LANES.get(event, LANE_STATUS) if lane is None else lane
+        item = OutboundItem(event, data, lane, payload_size(data), group, on_sent, next(self._seq))
+
+        with self._cond:
+            if timeout and self.bytes + item.size > self.max_bytes:
+                # Пока есть что отправлять, производитель ждет (но не вечно)
+                self._cond.wait_for(
+                    lambda: not self.bytes or self.bytes + item.size <= self.max_bytes,
+                    timeout
+                )
+
+            if replace and group is not None:
+                superseded = self._remove_group(group)
+                if superseded:
+                    metrics.inc('outbound_coalesced', len(superseded))
+
+            self.lanes[lane].append(item)
+            self.bytes += item.size
+
+            dropped = []
+            while self.bytes > self.max_bytes:
+                victim = next(queue for queue in reversed(self.lanes) if queue)[0]
+                if victim.group is not None:
+                    dropped.extend(self._remove_group(victim.group, self.lanes[victim.lane]))
+                else:
+                    self._remove(victim)
+                    dropped.append(victim)
+
+        if dropped:
+            metrics.inc('outbound_dropped', len(dropped))
+            logger.warning(f"Outbound queue full, dropped {len(dropped)} message(s)")
+            if self.on_drop:
+                for victim in dropped:
+                    self.on_drop(victim)
+        return item not in dropped
+
+    def get(self):
+        """Следующее сообщение или None"""
+        with self._cond:
+            for index, lane in enumerate(self.lanes):
+                if lane:
+                    item = lane[0]
+                    if item.group is not None:
+                        item = self._oldest_in_group(item, self.lanes[index + 1:])
+                    self._remove(item)
+                    return item
+        return None
+
+    def requeue(self, item):
+        """Возврат неотправленного сообщения в начало его полосы"""
+        with self._cond:
+            self.lanes[item.lane].appendleft(item)
+            self.bytes += item.size
+
+    def discard(self, group):
+        """Удаление сообщений группы без вызова on_drop"""
+        with self._cond:
+            return len(self._remove_group(group))
+    
+    def clear(self):
+        with self._cond:
+            for lane in self.lanes:
+                lane.clear()
+            self.bytes = 0
+            self._cond.notify_all()
+
+    def _remove(self, item):
+        self.lanes[item.lane].remove(item)
+        self.bytes -= item.size
+        self._cond.notify_all()
+
+    @staticmethod
+    def _oldest_in_group(item, lanes):
+        """Самое старое сообщение группы item среди item и полос lanes"""
+        for lane in lanes:
+            other = next((other for other in lane if other.group == item.group), None)
+            if other is not None and other.seq < item.seq:
+                item = other
+        return item
+
+    def _remove_group(self, group, within=None):
+        """Удаление сообщений группы из всех полос или только из полосы within"""
+        removed = []
+        for lane in self.lanes if within is None else (within,):
+            for item in [item for item in lane if item.group == group]:
+                lane.remove(item)
+                self.bytes -= item.size
+                removed.append(item)
+        if removed:
+            self._cond.notify_all()
+        return removed
@@ -0,0 +1,152 @@
+import tempfile
+import threading
+import logging
+from collections import deque
+from client.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TRUNCATION_MARK = '\n... [{omitted} bytes omitted, {total} total] ...\n'
+
+
+class OutputBuffer:
+    """Вывод одного потока команды с ограничением памяти
+
+    В памяти - не больше head_bytes начала и tail_bytes конца (кольцо).
+    Пока вывод в них помещается, он хранится целиком; дальше весь вывод
+    пишется во временный файл (до max_spill_bytes), откуда его можно
+    прочитать страницами через read(). Размеры - в байтах UTF-8.
+    """
+
+    def __init__(self, head_bytes=64 * 1024, tail_bytes=64 * 1024, max_spill_bytes=256 * 2 ** 20):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.total = 0  # Байт записано всего
+        self.spilled = 0  # Байт во временном файле
+        self._head = bytearray()
+        self._tail = deque()
+        self._tail_size = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def truncated(self):
+        """Вывод не помещается в head + tail и показывается с пропуском"""
+        return self.total > self.head_bytes + self.tail_bytes
+
+    @property
+    def complete(self):
+        """Полный вывод доступен через read() (файл не уперся в max_spill_bytes)"""
+        if self._file is None:
+            return not self.truncated
+        return self.spilled == self.total
+
+    def write(self, text):
+        data = raw = text.encode('utf-8')
+        if not data:
+            return
+        with self._lock:
+            if self.total + len(data) > self.head_bytes + self.tail_bytes and self._file is None:
+                self._spill(self._contents())
+            self.total += len(data)
+
+            room = self.head_bytes - len(self._head)
+            if room > 0:
+                self._head += data[:room]
+                data = data[room:]
+            if data:
+                self._tail.append(data)
+                self._tail_size += len(data)
+                while self._tail_size - len(self._tail[0]) >= self.tail_bytes:
+                    self._tail_size -= len(self._tail.popleft())
+
+            if self._file is not None:
+                self._spill(raw)
+
+    def text(self):
+        """Вывод для результата команды: целиком или начало и конец с пометкой о пропуске"""
+        with self._lock:
+            if not self.truncated:
+                return self._contents().decode('utf-8', errors='replace')
+            tail = b''.join(self._tail)[-self.tail_bytes:]
+            omitted = self.total - len(self._head) - len(tail)
+            # Края могут разрезать многобайтовый символ - обрезки отбрасываются
+            return (self._head.decode('utf-8', errors='ignore')
+                    + TRUNCATION_MARK.format(omitted=omitted, total=self.total)
+                    + tail.decode('utf-8', errors='ignore'))
+
+    def read(self, offset=0, limit=256 * 1024):
+        """Страница полного вывода: {'data', 'offset', 'next_offset', 'total', 'eof', 'complete'}
+
+        Смещения - в байтах; граница страницы сдвигается к началу символа,
+        так что страницы склеиваются без потерь. complete=False - вывод
+        сохранен только до max_spill_bytes, и eof наступает раньше total.
+        """
+        with self._lock:
+            if self._file is None:
+                data = self._contents()[offset:offset + limit]
+                available = self.total
+            else:
+                self._file.flush()
+                self._file.seek(offset)
+                data = self._file.read(limit)
+                available = self.spilled
+            complete = self.complete
+
+        end = offset + len(data)
+        if end < available:
+            data = _cut_incomplete(data)
+            end = offset + len(data)
+        return {
+            'data': data.decode('utf-8', errors='replace'),
+            'offset': offset,
+            'next_offset': end,
+            'total': self.total,
+            'eof': end >= available,
+            'complete': complete
+        }
+
+    def close(self):
+        """Удаление временного файла"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _contents(self):
+        # Пока файла нет, head и tail вместе содержат весь вывод без пропусков
+        return bytes(self._head) + b''.join(self._tail)
+
+    def _spill(self, data):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='cmd-output-')
+        room = self.max_spill_bytes - self.spilled
+        if room <= 0:
+            return
+        if len(data) > room:
+            logger.warning(f"Command output exceeds {self.max_spill_bytes} bytes, "
+                           f"the rest is kept only as tail")
+            data = data[:room]
+        self._file.seek(0, 2)  # read() мог сдвинуть позицию
+        self._file.write(data)
+        self.spilled += len(data)
+        metrics.inc('output_spilled_bytes', len(data))
+
+
+def _cut_incomplete(data):
+    """Отбрасывание неполного многобайтового символа UTF-8 в конце"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue  # Байт продолжения - ищем начало символа
+        if byte < 0x80:
+            length = 1
+        elif byte >= 0xF0:
+            length = 4
+        elif byte >= 0xE0:
+            length = 3
+        else:
+            length = 2
+        return data if length <= back else data[:-back]
+    return data
@@ -0,0 +1,411 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Свойства, которые бэкенд отдает для каждого элемента
+STRING_PROPS = ('class_name', 'name', 'control_type', 'automation_id')
+BOOL_PROPS = ('enabled', 'visible')
+
+# Поддерживаемые действия над элементами
+ACTIONS = ('click', 'double_click', 'right_click', 'type', 'set_text', 'select')
+
+
+class UIBackend:
+    """Интерфейс бэкенда UI-автоматизации"""
+
+    def root(self):
+        """Корневой элемент (рабочий стол)"""
+        raise NotImplementedError
+
+    def children(self, element):
+        """Список дочерних элементов"""
+        raise NotImplementedError
+
+    def properties(self, element):
+        """Словарь свойств STRING_PROPS + BOOL_PROPS"""
+        raise NotImplementedError
+
+    def rectangle(self, element):
+        """Координаты (left, top, right, bottom) или None"""
+        raise NotImplementedError
+
+    def perform(self, element, action, params):
+        """Выполнение действия из ACTIONS"""
+        raise NotImplementedError
+
+    def identity(self, element):
+        """Стабильный идентификатор элемента (исключение, если элемента больше нет)"""
+        raise NotImplementedError
+
+    def parent(self, element):
+        """Родитель элемента (для окна верхнего уровня - корень)"""
+        raise NotImplementedError
+
+    def detach(self, element):
+        """Представление элемента, которое можно передать в другой поток"""
+        return element
+
+    def attach(self, token):
+        """Элемент из detach() в текущем потоке"""
+        return token
+
+    def thread_init(self):
+        """Подготовка рабочего потока (инициализация COM и т.п.)"""
+        pass
+
+    def foreground(self):
+        """Идентификатор окна на переднем плане или None"""
+        return None
+
+    def screen_frame(self):
+        """Уменьшенный кадр экрана (ui_signature.Frame) или None, если снять нельзя"""
+        return None
+
+    def event_source(self):
+        """Источник событий изменения UI или None, если бэкенд их не поддерживает
+
+        Источник имеет методы start(callback) и stop(); callback(window_id)
+        вызывается с идентификатором окна верхнего уровня, в котором что-то изменилось.
+        """
+        return None
+
+    def prefetch(self, element, max_depth, max_children=None):
+        """Пакетная выборка поддерева: (бэкенд над локальными данными, корень)
+
+        Выбираются max_depth уровней под element и не больше max_children
+        детей у каждого узла. Базовая реализация обходит поддерево обычными вызовами.
+        """
+        def fetch(current, depth):
+            cached = CachedElement(self.properties(current), self.rectangle(current),
+                                   identity=element_identity(self, current))
+            if depth < max_depth:
+                cached.children = [fetch(child, depth + 1)
+                                   for child in self.children(current)[:max_children]]
+            return cached
+
+        return CachedBackend(), fetch(element, 0)
+
+
+def element_identity(backend, element):
+    """Идентификатор элемента или None, если бэкенд его не дает"""
+    try:
+        return backend.identity(element)
+    except Exception:
+        return None
+
+
+class CachedElement:
+    """Элемент с заранее выбранными свойствами"""
+    __slots__ = ('props', 'rect', 'children', 'identity')
+
+    def __init__(self, props, rect=None, children=None, identity=None):
+        self.props = props
+        self.rect = rect
+        self.children = children if children is not None else []
+        self.identity = identity
+
+
+class CachedBackend(UIBackend):
+    """Чтение свойств из CachedElement без обращений к приложениям"""
+
+    def children(self, element):
+        return element.children
+
+    def properties(self, element):
+        return dict(element.props)
+
+    def rectangle(self, element):
+        return element.rect
+
+    def identity(self, element):
+        if element.identity is None:
+            raise LookupError('Element identity was not prefetched')
+        return element.identity
+
+
+class PywinautoBackend(UIBackend):
+    """Бэкенд на pywinauto (UIA)"""
+
+    def root(self):
+        # pywinauto импортируется только при первом обращении к UI
+        from pywinauto.uia_element_info import UIAElementInfo
+        from pywinauto.controls.uiawrapper import UIAWrapper
+        return UIAWrapper(UIAElementInfo())
+
+    def children(self, element):
+        return element.children()
+
+    def properties(self, element):
+        return {
+            'class_name': element.class_name(),
+            'name': element.window_text(),
+            'control_type': str(element.element_info.control_type),
+            'automation_id': element.element_info.automation_id,
+            'enabled': element.is_enabled(),
+            'visible': element.is_visible()
+        }
+
+    def rectangle(self, element):
+        rect = element.rectangle()
+        return (rect.left, rect.top, rect.right, rect.bottom)
+
+    def identity(self, element):
+        return tuple(element.element_info.runtime_id)
+
+    def parent(self, element):
+        return element.parent()
+
+    def detach(self, element):
+        # Окна верхнего уровня передаются между потоками по hwnd
+        handle = element.element_info.handle
+        return handle if handle else element
+
+    def attach(self, token):
+        if isinstance(token, int):
+            from pywinauto.uia_element_info import UIAElementInfo
+            from pywinauto.controls.uiawrapper import UIAWrapper
+            return UIAWrapper(UIAElementInfo(token))
+        return token
+
+    def thread_init(self):
+        import comtypes
+        comtypes.CoInitializeEx(comtypes.COINIT_MULTITHREADED)
+
+    def foreground(self):
+        import ctypes
+        hwnd = ctypes.windll.user32.GetForegroundWindow()
+        if not hwnd:
+            return None
+        from pywinauto.uia_element_info import UIAElementInfo
+        return tuple(UIAElementInfo(hwnd).runtime_id)
+
+    def screen_frame(self, scale=8):
+        return grab_screen(scale)
+
+    def event_source(self):
+        return UIAEventSource()
+
+    def perform(self, element, action, params):
+        if action == 'click':
+            element.click_input()
+        elif action == 'double_click':
+            element.double_click_input()
+        elif action == 'right_click':
+            element.right_click_input()
+        elif action == 'type':
+            text = params.get('text', '')
+            element.type_keys(text)
+        elif action == 'set_text':
+            text = params.get('text', '')
+            element.set_edit_text(text)
+        elif action == 'select':
+            element.select()
+        else:
+            raise ValueError(f'Unknown action: {action}')
+
+    def prefetch(self, element, max_depth, max_children=None):
+        # CacheRequest на элемент с детьми: свойства уровня за один вызов.
+        # TreeScope_Subtree выбрал бы окно целиком, без учета max_depth и
+        # max_children, поэтому раскрываются только узлы, которые попадут в захват
+        from pywinauto.uia_defines import IUIA
+        iuia = IUIA()
+        uia = iuia.UIA_dll
+
+        request = iuia.iuia.CreateCacheRequest()
+        for property_id in (uia.UIA_ClassNamePropertyId,
+                            uia.UIA_NamePropertyId,
+                            uia.UIA_ControlTypePropertyId,
+                            uia.UIA_AutomationIdPropertyId,
+                            uia.UIA_IsEnabledPropertyId,
+                            uia.UIA_IsOffscreenPropertyId,
+                            uia.UIA_BoundingRectanglePropertyId,
+                            uia.UIA_RuntimeIdPropertyId):
+            request.AddProperty(property_id)
+        request.TreeScope = iuia.tree_scope['element'] | iuia.tree_scope['children']
+        request.TreeFilter = iuia.true_condition
+        # Полные ссылки нужны, чтобы раскрыть детей следующим запросом
+        request.AutomationElementMode = uia.AutomationElementMode_Full
+
+        cache = UIACacheBackend(iuia)
+
+        def load(live):
+            return CachedElement(cache.properties(live), cache.rectangle(live),
+                                 identity=element_identity(cache, live))
+
+        top = element.element_info.element.BuildUpdatedCache(request)
+        root = load(top)
+        level = [(top, root)]
+        for depth in range(1, max_depth + 1):
+            next_level = []
+            for live, cached in level:
+                for child in cache.children(live)[:max_children]:
+                    if depth < max_depth:
+                        try:
+                            # Свойства ребенка вместе с его детьми
+                            child = child.BuildUpdatedCache(request)
+                        except Exception as e:
+                            # Элемент исчез - остается листом с уже выбранными свойствами
+                            logger.debug(f"Prefetch of child failed: {e}")
+                    child_cached = load(child)
+                    cached.children.append(child_cached)
+                    next_level.append((child, child_cached))
+            level = next_level
+        return CachedBackend(), root
+
+
+def grab_screen(scale=8):
+    """Кадр всего виртуального экрана, уменьшенный в scale раз (GDI StretchBlt)"""
+    import ctypes
+    from ctypes import wintypes
+    from client.ui_signature import Frame
+
+    class BITMAPINFOHEADER(ctypes.Structure):
+        _fields_ = [('biSize', wintypes.DWORD), ('biWidth', wintypes.LONG),
+                    ('biHeight', wintypes.LONG), ('biPlanes', wintypes.WORD),
+                    ('biBitCount', wintypes.WORD), ('biCompression', wintypes.DWORD),
+                    ('biSizeImage', wintypes.DWORD), ('biXPelsPerMeter', wintypes.LONG),
+                    ('biYPelsPerMeter', wintypes.LONG), ('biClrUsed', wintypes.DWORD),
+                    ('biClrImportant', wintypes.DWORD)]
+
+    user32, gdi32 = ctypes.windll.user32, ctypes.windll.gdi32
+    user32.GetDC.restype = wintypes.HDC
+    user32.ReleaseDC.argtypes = (wintypes.HWND, wintypes.HDC)
+    gdi32.CreateCompatibleDC.restype = wintypes.HDC
+    gdi32.CreateCompatibleDC.argtypes = (wintypes.HDC,)
+    gdi32.CreateCompatibleBitmap.restype = wintypes.HBITMAP
+    gdi32.CreateCompatibleBitmap.argtypes = (wintypes.HDC, ctypes.c_int, ctypes.c_int)
+    gdi32.SelectObject.restype = wintypes.HGDIOBJ
+    gdi32.SelectObject.argtypes = (wintypes.HDC, wintypes.HGDIOBJ)
+    gdi32.SetStretchBltMode.argtypes = (wintypes.HDC, ctypes.c_int)
+    gdi32.StretchBlt.argtypes = (wintypes.HDC,) + (ctypes.c_int,) * 4 + \
+        (wintypes.HDC,) + (ctypes.c_int,) * 4 + (wintypes.DWORD,)
+    gdi32.GetDIBits.argtypes = (wintypes.HDC, wintypes.HBITMAP, wintypes.UINT, wintypes.UINT,
+                                ctypes.c_void_p, ctypes.c_void_p, wintypes.UINT)
+    gdi32.DeleteObject.argtypes = (wintypes.HGDIOBJ,)
+    gdi32.DeleteDC.argtypes = (wintypes.HDC,)
+
+    # SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN
+    left, top, width, height = (user32.GetSystemMetrics(index) for index in (76, 77, 78, 79))
+    frame_width, frame_height = max(width // scale, 1), max(height // scale, 1)
+
+    screen_dc = user32.GetDC(None)
+    memory_dc = gdi32.CreateCompatibleDC(screen_dc)
+    bitmap = gdi32.CreateCompatibleBitmap(screen_dc, frame_width, frame_height)
+    try:
+        previous = gdi32.SelectObject(memory_dc, bitmap)
+        gdi32.SetStretchBltMode(memory_dc, 4)  # HALFTONE: усреднение, а не выборка пикселей
+        gdi32.StretchBlt(memory_dc, 0, 0, frame_width, frame_height,
+                         screen_dc, left, top, width, height, 0x00CC0020)  # SRCCOPY
+        gdi32.SelectObject(memory_dc, previous)
+
+        header = BITMAPINFOHEADER(biSize=ctypes.sizeof(BITMAPINFOHEADER), biWidth=frame_width,
+                                  biHeight=-frame_height,  # строки сверху вниз
+                                  biPlanes=1, biBitCount=32, biCompression=0)
+        buffer = ctypes.create_string_buffer(frame_width * frame_height * 4)
+        if not gdi32.GetDIBits(memory_dc, bitmap, 0, frame_height, buffer,
+                               ctypes.byref(header), 0):
+            return None
+    finally:
+        gdi32.DeleteObject(bitmap)
+        gdi32.DeleteDC(memory_dc)
+        user32.ReleaseDC(None, screen_dc)
+
+    return Frame(frame_width, frame_height, buffer.raw, bpp=4, scale=scale, left=left, top=top)
+
+
+class UIACacheBackend(UIBackend):
+    """Чтение кэшированных свойств IUIAutomationElement (без COM-вызовов в приложение)"""
+
+    def __init__(self, iuia):
+        self.iuia = iuia
+
+    def children(self, element):
+        children = element.GetCachedChildren()
+        if not children:
+            return []
+        return [children.GetElement(i) for i in range(children.Length)]
+
+    def properties(self, element):
+        control_type = element.CachedControlType
+        return {
+            'class_name': element.CachedClassName,
+            'name': element.CachedName,
+            'control_type': str(self.iuia.known_control_type_ids.get(control_type, control_type)),
+            'automation_id': element.CachedAutomationId,
+            'enabled': bool(element.CachedIsEnabled),
+            'visible': not element.CachedIsOffscreen
+        }
+
+    def rectangle(self, element):
+        rect = element.CachedBoundingRectangle
+        return (rect.left, rect.top, rect.right, rect.bottom)
+
+    def identity(self, element):
+        runtime_id = element.GetCachedPropertyValue(self.iuia.UIA_dll.UIA_RuntimeIdPropertyId)
+        if not runtime_id:
+            raise LookupError('Element has no cached runtime id')
+        return tuple(runtime_id)
+
+
+class UIAEventSource:
+    """Подписка на структурные изменения и изменения свойств UIA по всему рабочему столу"""
+
+    WATCHED_PROPERTIES = ('UIA_NamePropertyId', 'UIA_IsEnabledPropertyId',
+                          'UIA_IsOffscreenPropertyId', 'UIA_BoundingRectanglePropertyId')
+
+    def __init__(self):
+        self._iuia = None
+        self._handler = None
+        self._callback = None
+
+    def start(self, callback):
+        import comtypes
+        from pywinauto.uia_defines import IUIA
+        iuia = IUIA()
+        uia = iuia.UIA_dll
+        source = self
+
+        class Handler(comtypes.COMObject):
+            _com_interfaces_ = [uia.IUIAutomationStructureChangedEventHandler,
+                                uia.IUIAutomationPropertyChangedEventHandler]
+
+            def IUIAutomationStructureChangedEventHandler_HandleStructureChangedEvent(
+                    self, sender, change_type, runtime_id):
+                source._dispatch(sender)
+
+            def IUIAutomationPropertyChangedEventHandler_HandlePropertyChangedEvent(
+                    self, sender, property_id, new_value):
+                source._dispatch(sender)
+
+        self._iuia = iuia
+        self._callback = callback
+        self._handler = Handler()
+        scope = iuia.tree_scope['subtree']
+        iuia.iuia.AddStructureChangedEventHandler(iuia.root, scope, None, self._handler)
+        iuia.iuia.AddPropertyChangedEventHandler(
+            iuia.root, scope, None, self._handler,
+            [getattr(uia, name) for name in self.WATCHED_PROPERTIES]
+        )
+
+    def stop(self):
+        if self._iuia is not None:
+            try:
+                self._iuia.iuia.RemoveAllEventHandlers()
+            except Exception as e:
+                logger.error(f"Failed to remove UIA event handlers: {e}")
+        self._iuia = None
+        self._handler = None
+
+    def _dispatch(self, sender):
+        """Поиск окна верхнего уровня, в котором произошло событие"""
+        try:
+            iuia = self._iuia
+            walker = iuia.iuia.RawViewWalker
+            element = sender
+            parent = walker.GetParentElement(element)
+            while parent and not iuia.iuia.CompareElements(parent, iuia.root):
+                element = parent
+                parent = walker.GetParentElement(element)
+            self._callback(tuple(element.GetRuntimeId()))
+        except Exception as e:
+            logger.debug(f"UIA event dispatch error: {e}")
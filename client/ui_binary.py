@@ -0,0 +1,148 @@
+import struct
+import sys
+import logging
+from array import array
+from client.ui_backend import STRING_PROPS, BOOL_PROPS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'UIT1'
+HEADER = struct.Struct('<4sBBII')  # magic, строковых полей, булевых полей, строк, узлов
+
+FLAG_RECT = 0x40
+FLAG_INDEX = 0x80
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_column(typecode, data, offset, count):
+    column = array(typecode)
+    size = column.itemsize * count
+    column.frombytes(data[offset:offset + size])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column, offset + size
+
+
+def encode_tree(tree):
+    """Компактная бинарная форма UI-дерева
+
+    Формат (little-endian): заголовок, таблица строк (длина uint32 + UTF-8),
+    затем столбцы по узлам в прямом порядке обхода: индексы строк для
+    STRING_PROPS (uint32), флаги (uint8: BOOL_PROPS, FLAG_RECT, FLAG_INDEX),
+    index (int32), число детей (uint32), rect (4 x int32).
+    """
+    strings = {}
+    columns = [[] for _ in STRING_PROPS]
+    flags = []
+    indexes = []
+    child_counts = []
+    rects = []
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+
+        for column, key in zip(columns, STRING_PROPS):
+            value = node.get(key) or ''
+            idx = strings.get(value)
+            if idx is None:
+                idx = strings[value] = len(strings)
+            column.append(idx)
+
+        flag = 0
+        for bit, key in enumerate(BOOL_PROPS):
+            if node.get(key):
+                flag |= 1 << bit
+
+        rect = node.get('rect')
+        if rect:
+            flag |= FLAG_RECT
+            rects.extend((rect['left'], rect['top'], rect['right'], rect['bottom']))
+        else:
+            rects.extend((0, 0, 0, 0))
+
+        index = node.get('index')
+        if index is not None:
+            flag |= FLAG_INDEX
+        indexes.append(index if index is not None else -1)
+        flags.append(flag)
+
+        children = node.get('children') or []
+        child_counts.append(len(children))
+        stack.extend(reversed(children))
+
+    parts = [HEADER.pack(MAGIC, len(STRING_PROPS), len(BOOL_PROPS), len(strings), len(flags))]
+    for value in strings:
+        encoded = value.encode('utf-8')
+        parts.append(struct.pack('<I', len(encoded)))
+        parts.append(encoded)
+    for column in columns:
+        parts.append(_column('I', column))
+    parts.append(bytes(flags))
+    parts.append(_column('i', indexes))
+    parts.append(_column('I', child_counts))
+    parts.append(_column('i', rects))
+    return b''.join(parts)
+
+
+def decode_tree(data):
+    """Восстановление UI-дерева из бинарной формы"""
+    magic, string_props, bool_props, string_count, node_count = HEADER.unpack_from(data)
+    if magic != MAGIC or string_props != len(STRING_PROPS) or bool_props != len(BOOL_PROPS):
+        raise ValueError("Unsupported binary UI tree format")
+
+    offset = HEADER.size
+    strings = []
+    for _ in range(string_count):
+        (size,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        strings.append(bytes(data[offset:offset + size]).decode('utf-8'))
+        offset += size
+
+    columns = []
+    for _ in STRING_PROPS:
+        column, offset = _read_column('I', data, offset, node_count)
+        columns.append(column)
+    flags = data[offset:offset + node_count]
+    offset += node_count
+    indexes, offset = _read_column('i', data, offset, node_count)
+    child_counts, offset = _read_column('I', data, offset, node_count)
+    rects, offset = _read_column('i', data, offset, node_count * 4)
+
+    nodes = []
+    for i in range(node_count):
+        node = {key: strings[column[i]] for key, column in zip(STRING_PROPS, columns)}
+        flag = flags[i]
+        for bit, key in enumerate(BOOL_PROPS):
+            node[key] = bool(flag & (1 << bit))
+        node['children'] = []
+        node['rect'] = {
+            'left': rects[i * 4],
+            'top': rects[i * 4 + 1],
+            'right': rects[i * 4 + 2],
+            'bottom': rects[i * 4 + 3]
+        } if flag & FLAG_RECT else None
+        if flag & FLAG_INDEX:
+            node['index'] = indexes[i]
+        nodes.append(node)
+
+    # Восстановление вложенности по числу детей в прямом порядке
+    stack = []
+    for i, node in enumerate(nodes):
+        if stack:
+            parent, remaining = stack[-1]
+            parent['children'].append(node)
+            if remaining == 1:
+                stack.pop()
+            else:
+                stack[-1] = (parent, remaining - 1)
+        if child_counts[i]:
+            stack.append((node, child_counts[i]))
+
+    return nodes[0] if nodes else None
@@ -1,116 +1,539 @@
-import json
-import zlib
-import base64
-import logging
-from pywinauto import Desktop
-from pywinauto.application import Application
-
-logger = logging.getLogger(__name__)
-
-
-class UITreeCapture:
-    def __init__(self, max_depth=8):
-        self.max_depth = max_depth
-        self.last_tree = None
-    
-    def capture(self, full=True, element_path=None):
-        """Захват UI-дерева"""
-        try:
-            desktop = Desktop(backend="uia")
-            
-            if element_path:
-                # Захват конкретного элемента
-                element = self._find_element_by_path(desktop, element_path)
-                if element:
-                    return self._element_to_dict(element, depth=0)
-                else:
-                    return {'error': 'Element not found'}
-            else:
-                # Захват всего рабочего стола
-                tree = self._element_to_dict(desktop, depth=0)
-                
-                if full:
-                    self.last_tree = tree
-                
-                return tree
-                
-        except Exception as e:
-            logger.error(f"UI capture error: {e}")
-            return {'error': str(e)}
-    
-    def _element_to_dict(self, element, depth=0):
-        """Конвертация элемента в словарь"""
-        if depth > self.max_depth:
-            return None
-        
-        try:
-            elem_dict = {
-                'class_name': element.class_name() if hasattr(element, 'class_name') else '',
-                'name': element.window_text() if hasattr(element, 'window_text') else '',
-                'control_type': str(element.element_info.control_type) if hasattr(element, 'element_info') else '',
-                'enabled': element.is_enabled() if hasattr(element, 'is_enabled') else False,
-                'visible': element.is_visible() if hasattr(element, 'is_visible') else False,
-                'children': []
-            }
-            
-            # Координаты
-            try:
-                rect = element.rectangle()
-                elem_dict['rect'] = {
-                    'left': rect.left,
-                    'top': rect.top,
-                    'right': rect.right,
-                    'bottom': rect.bottom
-                }
-            except:
-                elem_dict['rect'] = None
-            
-            # Дочерние элементы (ограничиваем количество)
-            try:
-                children = element.children()
-                for i, child in enumerate(children[:30]):  # Максимум 30 детей
-                    child_dict = self._element_to_dict(child, depth + 1)
-                    if child_dict:
-                        child_dict['index'] = i
-                        elem_dict['children'].append(child_dict)
-            except:
-                pass
-            
-            return elem_dict
-            
-        except Exception as e:
-            logger.error(f"Element conversion error: {e}")
-            return None
-    
-    def _find_element_by_path(self, root, path):
-        """Поиск элемента по пути (например, '0.1.3')"""
-        try:
-            indices = [int(x) for x in path.split('.')]
-            current = root
-            
-            for idx in indices:
-                children = current.children()
-                if idx < len(children):
-                    current = children[idx]
-                else:
-                    return None
-            
-            return current
-        except:
-            return None
-    
-    def compress(self, ui_tree):
-        """Сжатие UI-дерева"""
-        try:
-            json_str = json.dumps(ui_tree, ensure_ascii=False)
-            json_bytes = json_str.encode('utf-8')
-            compressed = zlib.compress(json_bytes, level=6)
-            compressed_base64 = base64.b64encode(compressed).decode('ascii')
-            
-            logger.info(f"Compressed: {len(json_bytes)} -> {len(compressed)} bytes "
-                       f"({(1 - len(compressed)/len(json_bytes))*100:.1f}% reduction)")
-            
-            return compressed_base64
-        except Exception as e:
-            logger.error(f"Compression error: {e}")
-            return None
+import json
+import base64
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from client.ui_backend import PywinautoBackend, element_identity
+from client.ui_binary import encode_tree
+from client.ui_delta import diff_trees
+from client.ui_hash import dedup_tree
+from client.ui_snapshot import Snapshot, NodeView, NodeDict, SubtreeDict
+from client.ui_query import ElementIndex, validate_query
+from client.compression import ZlibCodec
+from client.metrics import metrics
+from client.ui_paths import PathResolver
+
+logger = logging.getLogger(__name__)
+
+
+class UITreeCapture:
+    def __init__(self, max_depth=8, backend=None, batched=False, resolver=None, max_children=30,
+                 workers=0, window_budget=5.0, compression_level=6):
+        self.max_depth = max_depth
+        self.codec = ZlibCodec(level=compression_level)  # Заменяется по согласованию с сервером
+        self.hash_index = None  # HashIndex поддеревьев, известных серверу
+        self.dedup_min_nodes = 16
+        self.max_children = max_children  # Ограничение детей на узел при полном захвате
+        self.workers = workers  # Потоков для параллельного обхода окон (0 - последовательно)
+        self.window_budget = window_budget  # Секунд на обход одного окна
+        self._pool = None
+        self._inflight = {}
+        self.backend = backend or PywinautoBackend()
+        self.resolver = resolver or PathResolver(self.backend)
+        self.batched = batched  # Пакетная выборка свойств поддерева
+        self.last_tree = None  # Snapshot последнего снимка
+        self.seq = 0
+        self._windows = {}  # Окна верхнего уровня: идентификатор -> NodeView в last_tree
+        self.history_size = 4
+        self._history = OrderedDict()  # seq -> Snapshot: базы, которые может иметь сервер
+        self.index = ElementIndex()  # Поиск элементов по последнему снимку
+        self.signatures = None  # ScreenSignatures: пропуск обхода окон без видимых изменений
+        self._lock = threading.RLock()
+    
+    def capture(self, full=True, element_path=None):
+        """Захват UI-дерева
+        
+        Явный захват рабочего стола обходит все окна, не полагаясь на подписи
+        экрана: так контроллер всегда может получить актуальное дерево.
+        """
+        try:
+            if element_path:
+                # Захват конкретного элемента
+                element = self.resolver.resolve(element_path)
+                if element:
+                    with metrics.timer('tree_walk'):
+                        return self._capture_subtree(element)
+                else:
+                    return {'error': 'Element not found'}
+            else:
+                # Захват всего рабочего стола
+                with self._lock, metrics.timer('tree_walk'):
+                    tree, windows, signatures = self._capture_desktop(_walk_all)
+                    
+                    if full:
+                        self._remember(tree, windows, signatures)
+                
+                return tree
+                
+        except Exception as e:
+            logger.error(f"UI capture error: {e}")
+            return {'error': str(e)}
+    
+    def capture_delta(self, base_seq=None, reuse=None):
+        """Захват изменений относительно снимка base_seq (по умолчанию последнего)
+        
+        Хранятся history_size последних снимков, так что после переподключения
+        дельта строится от версии, которую подтвердил сервер.
+        reuse(window_id) разрешает взять поддерево окна из прошлого снимка
+        без повторного обхода.
+        """
+        with self._lock:
+            try:
+                with metrics.timer('tree_walk'):
+                    tree, windows, signatures = self._capture_desktop(reuse)
+            except Exception as e:
+                logger.error(f"UI capture error: {e}")
+                return {'error': str(e)}
+            
+            # Дельта от версии, которая есть у контроллера (по умолчанию - последней);
+            # если такой версии уже нет - полная пересылка
+            if base_seq is None:
+                base_seq = self.seq
+            base = self._history.get(base_seq)
+            if base is None:
+                self._remember(tree, windows, signatures)
+                return {'delta': False, 'seq': self.seq, 'tree': tree}
+            
+            with metrics.timer('diff'):
+                ops = diff_trees(base.root(), tree)
+            if ops or base_seq != self.seq:
+                self._remember(tree, windows, signatures)
+            elif signatures is not None:
+                # Дерево совпало с последним снимком - подписи описывают его
+                self.signatures.commit(signatures, windows)
+            
+            return {'delta': True, 'base_seq': base_seq, 'seq': self.seq, 'ops': ops}
+    
+    def refresh(self, dirty):
+        """Дельта с повторным обходом только измененных окон верхнего уровня"""
+        return self.capture_delta(reuse=lambda window_id: window_id not in dirty)
+    
+    def reset_base(self):
+        """Сервер не получит текущую базу - следующий захват будет полным"""
+        with self._lock:
+            self.last_tree = None
+            self._windows = {}
+            self._history.clear()
+            if self.signatures is not None:
+                self.signatures.reset()
+    
+    def acknowledge(self, seq):
+        """Сервер подтвердил версию seq - более старые базы не понадобятся"""
+        with self._lock:
+            while self._history and next(iter(self._history)) < seq:
+                self._history.popitem(last=False)
+    
+    def _remember(self, tree, windows, signatures=None):
+        """Сохранение снимка как базы для следующей дельты (в компактном виде)
+        
+        signatures - SignaturePass обхода, давшего tree.
+        """
+        snapshot = Snapshot(tree)
+        positions = {id(child): pos for child, pos in zip(tree['children'], snapshot.children(0))}
+        self.last_tree = snapshot
+        self._windows = {
+            window_id: NodeView(snapshot, positions[id(window_dict)])
+            for window_id, window_dict in windows.items()
+        }
+        self.seq += 1
+        self._history[self.seq] = snapshot
+        while len(self._history) > self.history_size:
+            self._history.popitem(last=False)
+        self._update_index(snapshot, tree, windows)
+        if self.signatures is not None:
+            if signatures is not None:
+                self.signatures.commit(signatures, windows)
+            else:
+                self.signatures.reset()
+    
+    def _update_index(self, snapshot, tree, windows):
+        """Обновление индекса поиска: перестраиваются только заново обойденные окна"""
+        ids = {id(window_dict): window_id for window_id, window_dict in windows.items()}
+        with metrics.timer('index'):
+            self.index.update(snapshot, [
+                (pos, ids.get(id(child)), getattr(child, 'origin', None))
+                for child, pos in zip(tree['children'], snapshot.children(0))
+            ])
+    
+    def query(self, query, limit=100, refresh=False):
+        """Поиск элементов по индексу без обхода UI
+        
+        Если снимка еще нет или refresh=True, рабочий стол обходится заново.
+        Новый снимок не становится базой дельт - сервер его не получал.
+        """
+        validate_query(query)
+        if refresh or self.index.snapshot is None:
+            with self._lock, metrics.timer('tree_walk'):
+                tree, windows, _ = self._capture_desktop()
+                self._update_index(Snapshot(tree), tree, windows)
+        
+        with metrics.timer('query'):
+            total, matches = self.index.query(query, limit)
+        return {'matches': matches, 'total': total, 'truncated': total > len(matches)}
+    
+    def _capture_desktop(self, reuse=None):
+        """Захват рабочего стола: (дерево, {идентификатор окна: поддерево}, SignaturePass или None)"""
+        root = self.backend.root()
+        tree = self._node_dict(root, self.backend)
+        windows = {}
+        signatures = self._begin_signatures()
+        for window_id, window_dict in self._iter_windows(root, reuse, signatures):
+            tree['children'].append(window_dict)
+            if window_id is not None:
+                windows[window_id] = window_dict
+        return tree, windows, signatures
+    
+    def _begin_signatures(self):
+        return self.signatures.begin(self.backend) if self.signatures is not None else None
+    
+    def _iter_windows(self, root, reuse=None, signatures=None):
+        """Окна верхнего уровня по одному: (идентификатор, поддерево)
+        
+        signatures - SignaturePass этого обхода (подписи окон копятся в нем).
+        """
+        try:
+            windows = self.backend.children(root)
+        except Exception as e:
+            logger.error(f"UI capture error: {e}")
+            windows = []
+        
+        plan = []
+        for i, window in enumerate(windows[:self.max_children]):
+            try:
+                window_id = self.backend.identity(window)
+            except Exception:
+                window_id = None
+            
+            cached = self._windows.get(window_id) if window_id is not None else None
+            # Подписи считаются для всех окон, но решают только без явного reuse:
+            # окна, о которых пришли события, обходятся в любом случае
+            unchanged = signatures is not None and window_id is not None and \
+                signatures.unchanged(self.backend, window, window_id, i)
+            if cached is not None and (reuse(window_id) if reuse else unchanged):
+                metrics.inc('windows_reused')
+                plan.append((i, window_id, None, cached.to_dict()))
+            else:
+                if signatures is not None and window_id is not None:
+                    signatures.walked(window_id)
+                plan.append((i, window_id, window, None))
+        
+        # Окна, которые надо обойти, параллельно уходят в пул
+        walks = [item for item in plan if item[2] is not None]
+        if self.workers > 0 and len(walks) > 1:
+            # Потоковый захват идет без общей блокировки - _inflight общий
+            with self._lock:
+                futures = self._submit_walks(walks)
+        else:
+            futures = {}
+        
+        for i, window_id, window, window_dict in plan:
+            if i in futures:
+                window_dict = self._await_walk(futures[i], window_id, len(walks))
+                if signatures is not None and isinstance(window_dict, SubtreeDict):
+                    # Вместо зависшего окна взято прошлое поддерево - подпись к нему не относится
+                    signatures.discard(window_id)
+            elif window is not None:
+                window_dict = self._capture_subtree(window, depth=1)
+            
+            if window_dict:
+                window_dict['index'] = i
+                yield window_id, window_dict
+    
+    def _submit_walks(self, walks):
+        """Запуск обхода окон в пуле: {номер окна: (future, время постановки, старт)}"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='ui-capture',
+                initializer=self.backend.thread_init
+            )
+        
+        futures = {}
+        for i, window_id, window, _ in walks:
+            inflight = self._inflight.get(window_id)
+            if inflight is not None and not inflight.done():
+                # Прошлый обход этого окна еще висит - не занимаем новый поток
+                futures[i] = (inflight, 0, {})
+                continue
+            
+            started = {}
+            future = self._pool.submit(self._walk_detached, self.backend.detach(window), started)
+            futures[i] = (future, time.monotonic(), started)
+            if window_id is not None:
+                self._inflight[window_id] = future
+        return futures
+    
+    def _walk_detached(self, token, started):
+        """Обход окна в потоке пула"""
+        started['at'] = time.monotonic()
+        return self._capture_subtree(self.backend.attach(token), depth=1)
+    
+    def _await_walk(self, entry, window_id, total):
+        """Результат обхода окна с бюджетом времени; при превышении - прошлое поддерево"""
+        future, submitted_at, started = entry
+        # Пока задача в очереди, ждем с учетом числа окон на поток
+        queue_limit = submitted_at + self.window_budget * (total // self.workers + 1)
+        
+        while True:
+            limit = started['at'] + self.window_budget if 'at' in started else queue_limit
+            remaining = limit - time.monotonic()
+            if remaining <= 0 or not submitted_at:
+                break
+            try:
+                return future.result(timeout=min(remaining, 0.1))
+            except FutureTimeout:
+                continue
+            except Exception as e:
+                logger.error(f"Window capture error: {e}")
+                return None
+        
+        if future.done() and not future.exception():
+            return future.result()
+        
+        stale = self._windows.get(window_id)
+        logger.warning(f"Window {window_id} not responding, "
+                       f"{'reusing previous subtree' if stale else 'skipped'}")
+        return stale.to_dict() if stale else None
+    
+    def close(self):
+        """Остановка пула обхода окон"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+    
+    def iter_json(self, full=True):
+        """Захват рабочего стола по частям: фрагменты JSON по одному окну верхнего уровня
+        
+        Как и capture(), обходит все окна заново.
+        """
+        root = self.backend.root()
+        tree = self._node_dict(root, self.backend)
+        windows = {}
+        signatures = self._begin_signatures()
+        
+        header = {key: value for key, value in tree.items() if key != 'children'}
+        yield json.dumps(header, ensure_ascii=False)[:-1] + ', "children": ['
+        
+        for window_id, window_dict in self._iter_windows(root, _walk_all, signatures):
+            yield (', ' if tree['children'] else '') + json.dumps(window_dict, ensure_ascii=False)
+            tree['children'].append(window_dict)
+            if window_id is not None:
+                windows[window_id] = window_dict
+        
+        yield ']}'
+        
+        if full:
+            with self._lock:
+                self._remember(tree, windows, signatures)
+    
+    def expand(self, element_path=None, depth=1, offset=0, limit=100):
+        """Ленивый захват: поддерево глубиной depth с постраничной выдачей детей
+        
+        Каждый узел получает child_count; если показаны не все дети,
+        has_more=True и next_cursor - смещение следующей страницы.
+        offset относится к детям запрошенного элемента.
+        """
+        try:
+            if element_path:
+                element = self.resolver.resolve(element_path)
+                if not element:
+                    return {'error': 'Element not found'}
+            else:
+                element = self.backend.root()
+            
+            with metrics.timer('tree_walk'):
+                return self._lazy_dict(element, depth, offset, limit)
+            
+        except Exception as e:
+            logger.error(f"UI expand error: {e}")
+            return {'error': str(e)}
+    
+    def _lazy_dict(self, element, depth, offset, limit):
+        """Узел с одной страницей детей до заданной глубины"""
+        elem_dict = self._node_dict(element, self.backend)
+        
+        try:
+            children = self.backend.children(element)
+        except:
+            children = []
+        
+        end = offset
+        if depth > 0:
+            for i, child in enumerate(children[offset:offset + limit], offset):
+                try:
+                    child_dict = self._lazy_dict(child, depth - 1, 0, limit)
+                except Exception as e:
+                    logger.error(f"Element conversion error: {e}")
+                    continue
+                child_dict['index'] = i
+                elem_dict['children'].append(child_dict)
+            end = min(offset + limit, len(children))
+        
+        elem_dict['child_count'] = len(children)
+        elem_dict['has_more'] = end < len(children)
+        if elem_dict['has_more']:
+            elem_dict['next_cursor'] = end
+        
+        return elem_dict
+    
+    def _capture_subtree(self, element, depth=0):
+        """Захват элемента вместе с поддеревом"""
+        if self.batched:
+            try:
+                backend, cached = self.backend.prefetch(element, self.max_depth - depth,
+                                                        self.max_children)
+                return self._element_to_dict(cached, depth=depth, backend=backend)
+            except Exception as e:
+                logger.warning(f"Batched fetch failed, falling back to live walk: {e}")
+        
+        return self._element_to_dict(element, depth=depth)
+    
+    def _node_dict(self, element, backend):
+        """Свойства и координаты элемента без дочерних"""
+        metrics.inc('elements_visited')
+        elem_dict = NodeDict(backend.properties(element))
+        elem_dict.identity = element_identity(backend, element)
+        elem_dict['children'] = []
+        
+        # Координаты
+        try:
+            rect = backend.rectangle(element)
+            elem_dict['rect'] = {
+                'left': rect[0],
+                'top': rect[1],
+                'right': rect[2],
+                'bottom': rect[3]
+            } if rect else None
+        except:
+            elem_dict['rect'] = None
+        
+        return elem_dict
+    
+    def _element_to_dict(self, element, depth=0, backend=None):
+        """Конвертация элемента в словарь"""
+        if depth > self.max_depth:
+            return None
+        
+        backend = backend or self.backend
+        
+        try:
+            elem_dict = self._node_dict(element, backend)
+            
+            # Дочерние элементы (ограничиваем количество)
+            try:
+                children = backend.children(element)
+                for i, child in enumerate(children[:self.max_children]):
+                    child_dict = self._element_to_dict(child, depth + 1, backend)
+                    if child_dict:
+                        child_dict['index'] = i
+                        elem_dict['children'].append(child_dict)
+            except:
+                pass
+            
+            return elem_dict
+            
+        except Exception as e:
+            logger.error(f"Element conversion error: {e}")
+            return None
+    
+    def dedup(self, ui_tree, sent=None):
+        """Дерево для отправки со ссылками на поддеревья, которые уже есть у сервера
+        
+        sent - см. dedup_tree: список для хэшей, которые надо внести в индекс после отправки.
+        """
+        index = self.hash_index
+        if index is None:
+            return ui_tree
+        with metrics.timer('hash'):
+            tree, refs = dedup_tree(ui_tree, index, self.dedup_min_nodes, sent)
+        metrics.inc('subtrees_deduped', refs)
+        return tree
+    
+    def compress(self, ui_tree, codec=None):
+        """Сжатие UI-дерева
+        
+        JSON подается в кодек частями по мере сериализации, без промежуточных
+        полной строки и полного буфера bytes.
+        """
+        try:
+            serialise = [0.0]
+            start = time.perf_counter()
+            compressed, size = (codec or self.codec).compress_chunks(
+                _json_chunks(ui_tree, serialise)
+            )
+            metrics.observe('serialise', serialise[0])
+            metrics.observe('compress', time.perf_counter() - start - serialise[0])
+            compressed_base64 = base64.b64encode(compressed).decode('ascii')
+            
+            logger.info(f"Compressed: {size} -> {len(compressed)} bytes "
+                       f"({(1 - len(compressed)/max(size, 1))*100:.1f}% reduction)")
+            
+            return compressed_base64
+        except Exception as e:
+            logger.error(f"Compression error: {e}")
+            return None
+    
+    def compress_binary(self, ui_tree, codec=None):
+        """Сжатие UI-дерева в бинарном формате (bytes, без base64)"""
+        try:
+            with metrics.timer('serialise'):
+                encoded = encode_tree(ui_tree)
+            with metrics.timer('compress'):
+                compressed = (codec or self.codec).compress(encoded)
+            
+            logger.info(f"Compressed binary: {len(encoded)} -> {len(compressed)} bytes")
+            
+            return compressed
+        except Exception as e:
+            logger.error(f"Binary compression error: {e}")
+            return None
+
+
+def _walk_all(window_id):
+    """reuse для явных захватов: ни одно окно не берется из прошлого снимка"""
+    return False
+
+
+def _json_chunks(obj, elapsed, chunk_size=64 * 1024):
+    """JSON объекта частями в UTF-8 (примерно по chunk_size символов)
+
+    Списки верхнего уровня (окна дерева, операции дельты) сериализуются
+    поэлементно, так что в памяти нет полной строки всего дерева. Результат
+    совпадает с json.dumps(obj, ensure_ascii=False). elapsed[0] накапливает
+    время сериализации.
+    """
+    start = time.perf_counter()
+    if not isinstance(obj, dict):
+        chunk = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        elapsed[0] += time.perf_counter() - start
+        yield chunk
+        return
+    
+    pending = ['{']
+    pending_size = 1
+    for n, (key, value) in enumerate(obj.items()):
+        pending.append((', ' if n else '') + json.dumps(key, ensure_ascii=False) + ': ')
+        if not isinstance(value, list):
+            pending.append(json.dumps(value, ensure_ascii=False))
+            continue
+        
+        pending.append('[')
+        for i, item in enumerate(value):
+            piece = (', ' if i else '') + json.dumps(item, ensure_ascii=False)
+            pending.append(piece)
+            pending_size += len(piece)
+            if pending_size >= chunk_size:
+                chunk = ''.join(pending).encode('utf-8')
+                pending = []
+                pending_size = 0
+                elapsed[0] += time.perf_counter() - start
+                yield chunk
+                start = time.perf_counter()
+        pending.append(']')
+    pending.append('}')
+    
+    chunk = ''.join(pending).encode('utf-8')
+    elapsed[0] += time.perf_counter() - start
+    yield chunk
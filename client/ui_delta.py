@@ -0,0 +1,125 @@
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Свойства узла, изменения которых попадают в патч
+NODE_PROPS = ('class_name', 'name', 'control_type', 'automation_id', 'enabled', 'visible', 'rect', 'index')
+# У детей index меняется вместе с составом и передается в операции children
+CHILD_PROPS = tuple(key for key in NODE_PROPS if key != 'index')
+
+
+def _child_keys(children):
+    """Ключи для сопоставления детей между захватами
+
+    Идентификатор элемента (NodeDict.identity), если он есть и не повторяется
+    среди соседей; иначе тип, класс и порядковый номер среди таких же.
+    """
+    seen = {}
+    identities = set()
+    keys = []
+    for child in children:
+        identity = getattr(child, 'identity', None)
+        if identity is not None and identity not in identities:
+            identities.add(identity)
+            keys.append(('identity', identity))
+            continue
+        kind = (child.get('control_type'), child.get('class_name'))
+        ordinal = seen.get(kind, 0)
+        seen[kind] = ordinal + 1
+        keys.append(kind + (ordinal,))
+    return keys
+
+
+def _format_path(path):
+    return '.'.join(str(i) for i in path)
+
+
+def diff_trees(old, new):
+    """Список операций, превращающих дерево old в дерево new
+
+    Операции адресуются путями в базовом дереве (позиции в списках children):
+      {'op': 'set', 'path': '0.1', 'props': {...}} - изменившиеся свойства узла
+      {'op': 'children', 'path': '0', 'children': [1, {...}, [0, 2]]} - новый
+          состав детей: число - индекс ребенка в базовом дереве, пара [индекс,
+          index] - он же с новым значением поля index, словарь - новый узел
+    """
+    ops = []
+    _diff_node(old, new, [], ops, NODE_PROPS)
+    return ops
+
+
+def _same_subtree(old, new):
+    # Поддерево, восстановленное из снимка (ui_snapshot), против узла того же снимка
+    origin = getattr(new, 'origin', None)
+    if origin is not None:
+        return origin == getattr(old, 'origin', None)
+    return isinstance(old, dict) and old.get('children') is new.get('children') is not None
+
+
+def _diff_node(old, new, path, ops, keys):
+    props = {key: new.get(key) for key in keys if old.get(key) != new.get(key)}
+    if props:
+        ops.append({'op': 'set', 'path': _format_path(path), 'props': props})
+
+    if _same_subtree(old, new):
+        # Поддерево взято из прошлого снимка без изменений
+        return
+    old_children = old.get('children') or []
+    new_children = new.get('children') or []
+    old_positions = {key: i for i, key in enumerate(_child_keys(old_children))}
+
+    layout = []
+    matched = []
+    for key, child in zip(_child_keys(new_children), new_children):
+        i = old_positions.get(key)
+        if i is None:
+            layout.append(child)
+        else:
+            index = child.get('index')
+            layout.append(i if old_children[i].get('index') == index else [i, index])
+            matched.append((i, child))
+
+    if layout != list(range(len(old_children))):
+        ops.append({'op': 'children', 'path': _format_path(path), 'children': layout})
+
+    for i, child in matched:
+        _diff_node(old_children[i], child, path + [i], ops, CHILD_PROPS)
+
+
+def _resolve(tree, path):
+    node = tree
+    if path:
+        for idx in path.split('.'):
+            node = node['children'][int(idx)]
+    return node
+
+
+def apply_patch(tree, ops):
+    """Применение патча к копии базового дерева"""
+    result = copy.deepcopy(tree)
+
+    # Сначала находим все узлы по путям базового дерева, затем меняем
+    targets = []
+    for op in ops:
+        node = _resolve(result, op['path'])
+        targets.append((op, node, list(node.get('children') or [])))
+
+    for op, node, old_children in targets:
+        if op['op'] == 'set':
+            node.update(op['props'])
+        elif op['op'] == 'children':
+            children = []
+            for item in op['children']:
+                if isinstance(item, int):
+                    item = old_children[item]
+                elif isinstance(item, list):
+                    i, index = item
+                    item = old_children[i]
+                    item['index'] = index
+                children.append(item)
+            node['children'] = children
+        else:
+            raise ValueError(f"Unknown patch op: {op['op']}")
+
+    return result
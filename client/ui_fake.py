@@ -0,0 +1,209 @@
+import random
+import time
+import zlib
+import struct
+import logging
+from collections import Counter
+from client.ui_backend import UIBackend, CachedBackend, CachedElement, ACTIONS
+from client.ui_signature import Frame
+
+logger = logging.getLogger(__name__)
+
+CONTROL_TYPES = ('Window', 'Pane', 'Button', 'Edit', 'Text', 'List', 'ListItem',
+                 'TreeItem', 'MenuItem', 'CheckBox', 'ComboBox', 'ToolBar')
+
+
+class FakeElement:
+    """Элемент синтетического рабочего стола"""
+    __slots__ = ('uid', 'props', 'rect', 'children', 'parent')
+
+    def __init__(self, uid, props, rect=None, children=None, parent=None):
+        self.uid = uid
+        self.props = props
+        self.rect = rect
+        self.children = children if children is not None else []
+        self.parent = parent
+
+    def __repr__(self):
+        return f"<FakeElement {self.uid} {self.props['control_type']} {self.props['name']!r}>"
+
+
+class FakeBackend(UIBackend):
+    """Бэкенд поверх синтетического дерева в памяти (для тестов и бенчмарков)"""
+
+    def __init__(self, root, seed=0):
+        self._root = root
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.actions = []
+        self.delays = {}  # uid -> задержка чтения свойств (имитация зависшего окна)
+        self.foreground_uid = None
+        self.frame = None  # Кадр экрана из render_frame()
+
+    def root(self):
+        self.calls['root'] += 1
+        return self._root
+
+    def children(self, element):
+        self.calls['children'] += 1
+        return list(element.children)
+
+    def properties(self, element):
+        self.calls['properties'] += 1
+        self._delay(element)
+        return dict(element.props)
+
+    def rectangle(self, element):
+        self.calls['rectangle'] += 1
+        return element.rect
+
+    def identity(self, element):
+        self.calls['identity'] += 1
+        return element.uid
+
+    def parent(self, element):
+        self.calls['parent'] += 1
+        if element.parent is None and element is not self._root:
+            # Элемент вставлен тестом без ссылки на родителя
+            return next((candidate for candidate in self.elements()
+                         if any(child is element for child in candidate.children)), None)
+        return element.parent
+
+    def perform(self, element, action, params):
+        self.calls['perform'] += 1
+        if action not in ACTIONS:
+            raise ValueError(f'Unknown action: {action}')
+        self.actions.append((element.uid, action, params))
+        if action == 'set_text':
+            element.props['name'] = params.get('text', '')
+
+    def event_source(self):
+        return FakeEventSource()
+
+    def foreground(self):
+        self.calls['foreground'] += 1
+        return self.foreground_uid
+
+    def screen_frame(self):
+        self.calls['screen_frame'] += 1
+        return self.frame
+
+    def render_frame(self, scale=8):
+        """Синтетический кадр экрана по текущему дереву
+
+        Видимые элементы закрашиваются в прямом порядке обхода (дети поверх
+        родителей) цветом, зависящим от их свойств, так что изменение
+        видимого элемента меняет пиксели его области. Кадр сохраняется
+        в self.frame и возвращается.
+        """
+        left, top, right, bottom = self._root.rect
+        width, height = max((right - left) // scale, 1), max((bottom - top) // scale, 1)
+        data = bytearray(width * height * 4)
+        for element in self.elements():
+            if not element.rect or not element.props.get('visible', True):
+                continue
+            color = struct.pack('<I', zlib.crc32(repr(sorted(element.props.items())).encode()))
+            x0 = min(max((element.rect[0] - left) // scale, 0), width)
+            x1 = min(max(-(-(element.rect[2] - left) // scale), x0), width)
+            y0 = min(max((element.rect[1] - top) // scale, 0), height)
+            y1 = min(max(-(-(element.rect[3] - top) // scale), y0), height)
+            fill = color * (x1 - x0)
+            for y in range(y0, y1):
+                offset = (y * width + x0) * 4
+                data[offset:offset + len(fill)] = fill
+        self.frame = Frame(width, height, bytes(data), bpp=4, scale=scale, left=left, top=top)
+        return self.frame
+
+    def prefetch(self, element, max_depth, max_children=None):
+        # Имитация одного пакетного запроса на поддерево
+        self.calls['prefetch'] += 1
+        self._delay(element)
+
+        def snapshot(current, depth):
+            cached = CachedElement(dict(current.props), current.rect, identity=current.uid)
+            if depth < max_depth:
+                cached.children = [snapshot(child, depth + 1)
+                                   for child in current.children[:max_children]]
+            return cached
+
+        return CachedBackend(), snapshot(element, 0)
+
+    def _delay(self, element):
+        delay = self.delays.get(element.uid)
+        if delay:
+            time.sleep(delay)
+
+    def elements(self):
+        """Обход всех элементов в прямом порядке"""
+        stack = [self._root]
+        while stack:
+            element = stack.pop()
+            yield element
+            stack.extend(reversed(element.children))
+
+    def churn(self, rate=0.01):
+        """Изменение свойств случайной доли элементов, возвращает их число"""
+        changed = 0
+        for element in self.elements():
+            if element is self._root or self.rng.random() >= rate:
+                continue
+            kind = self.rng.randrange(3)
+            if kind == 0:
+                element.props['name'] = f"{element.props['control_type']} {self.rng.randrange(10 ** 6)}"
+            elif kind == 1:
+                element.props['enabled'] = not element.props['enabled']
+            elif element.rect:
+                dx = self.rng.randint(-20, 20)
+                left, top, right, bottom = element.rect
+                element.rect = (left + dx, top, right + dx, bottom)
+            changed += 1
+        return changed
+
+
+class FakeEventSource:
+    """Источник событий, которые тест вызывает сам через fire()"""
+
+    def __init__(self):
+        self.callback = None
+
+    def start(self, callback):
+        self.callback = callback
+
+    def stop(self):
+        self.callback = None
+
+    def fire(self, window_id):
+        if self.callback:
+            self.callback(window_id)
+
+
+def generate_desktop(depth=4, fanout=5, seed=0):
+    """Генерация синтетического рабочего стола: depth уровней по fanout детей"""
+    rng = random.Random(seed)
+    counter = [0]
+
+    def make(level, left, top, width, height):
+        counter[0] += 1
+        control_type = 'Window' if level == 1 else rng.choice(CONTROL_TYPES)
+        props = {
+            'class_name': f"{control_type}Class{rng.randrange(4)}",
+            'name': f"{control_type} {counter[0]}",
+            'control_type': control_type,
+            # Как в реальных приложениях: у статических элементов AutomationId обычно нет
+            'automation_id': '' if control_type in ('Pane', 'Text') else f"{control_type}_{counter[0]}",
+            'enabled': rng.random() > 0.1,
+            'visible': rng.random() > 0.05
+        }
+        element = FakeElement(counter[0], props, (left, top, left + width, top + height))
+        if level < depth:
+            child_height = max(height // fanout, 1)
+            for i in range(fanout):
+                child = make(level + 1, left, top + i * child_height, width, child_height)
+                child.parent = element
+                element.children.append(child)
+        return element
+
+    root = make(0, 0, 0, 1920, 1080)
+    root.props.update({'class_name': '#32769', 'name': 'Desktop', 'control_type': 'Pane',
+                       'automation_id': ''})
+    return root
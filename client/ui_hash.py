@@ -0,0 +1,169 @@
+import copy
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from client.ui_delta import NODE_PROPS
+
+logger = logging.getLogger(__name__)
+
+# index - позиция у родителя, в хэш узла не входит (учитывается родителем),
+# поэтому одно и то же окно дает тот же хэш при смене z-порядка
+HASH_PROPS = tuple(key for key in NODE_PROPS if key not in ('index', 'rect'))
+DIGEST_SIZE = 12
+
+
+def hash_tree(tree):
+    """Хэши всех поддеревьев (по типу дерева Меркла): {id(узла): (хэш, число узлов)}"""
+    hashes = {}
+
+    def visit(node):
+        h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        rect = node.get('rect')
+        props = tuple(node.get(key) for key in HASH_PROPS)
+        rect = (rect['left'], rect['top'], rect['right'], rect['bottom']) if rect else None
+        h.update(repr((props, rect)).encode('utf-8'))
+
+        size = 1
+        for child in node.get('children') or []:
+            digest, count = visit(child)
+            h.update(f"|{child.get('index')}:{digest}".encode('ascii'))
+            size += count
+
+        result = hashes[id(node)] = (h.hexdigest(), size)
+        return result
+
+    visit(tree)
+    return hashes
+
+
+class HashIndex:
+    """Хэши поддеревьев, которые уже есть у сервера (LRU)
+
+    Сервер хранит не меньше max_entries последних присланных поддеревьев
+    (размер сообщается при регистрации); если он что-то потерял раньше,
+    то присылает ui_hash_miss и хэш удаляется из индекса.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, digest):
+        with self._lock:
+            if digest in self._hashes:
+                self._hashes.move_to_end(digest)
+                return True
+            return False
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, digest):
+        with self._lock:
+            self._hashes[digest] = True
+            self._hashes.move_to_end(digest)
+            while len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+
+    def discard(self, digest):
+        with self._lock:
+            self._hashes.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._hashes.clear()
+
+
+def dedup_tree(tree, index, min_nodes=16, sent=None):
+    """Дерево для отправки: (дерево, число ссылок)
+
+    Поддеревья от min_nodes узлов, известные серверу, заменяются на
+    {'ref': хэш, 'index': i}; остальные такие поддеревья отправляются целиком
+    с полем 'hash', чтобы сервер их запомнил.
+    Если передан список sent, новые хэши добавляются в него, а не в индекс:
+    вызывающий вносит их в индекс сам, когда сообщение действительно ушло.
+    """
+    hashes = hash_tree(tree)
+    pending, digests = sent, []
+    refs = 0
+
+    def visit(node):
+        nonlocal refs
+        digest, size = hashes[id(node)]
+        if size >= min_nodes:
+            if digest in index:
+                refs += 1
+                ref = {'ref': digest}
+                if 'index' in node:
+                    ref['index'] = node['index']
+                return ref
+            digests.append(digest)
+
+        result = {key: value for key, value in node.items() if key != 'children'}
+        if size >= min_nodes:
+            result['hash'] = digest
+        result['children'] = [visit(child) for child in node.get('children') or []]
+        return result
+
+    result = visit(tree)
+    if pending is not None:
+        pending.extend(digests)
+        return result, refs
+    # В индекс - только после обхода: повторы внутри одного дерева идут целиком
+    for digest in digests:
+        index.add(digest)
+    return result, refs
+
+
+def forget(tree, index, digests):
+    """Удаление из индекса потерянных сервером хэшей, а также хэшей их предков
+    и потомков в tree: следующая отправка восстановит эти ветки за один раз
+    """
+    digests = set(digests)
+    hashes = hash_tree(tree)
+
+    def visit(node, inside):
+        digest = hashes[id(node)][0]
+        inside = inside or digest in digests
+        lost = inside
+        for child in node.get('children') or []:
+            lost = visit(child, inside) or lost
+        if lost:
+            index.discard(digest)
+        return lost
+
+    visit(tree, False)
+    for digest in digests:
+        index.discard(digest)
+
+
+def expand_tree(tree, store):
+    """Обратная операция (сторона сервера): (дерево, список неизвестных хэшей)
+
+    store - словарь хэш -> поддерево, пополняется поддеревьями с полем 'hash'
+    (кроме тех, в которых есть неизвестные ссылки).
+    """
+    missing = []
+
+    def visit(node):
+        if 'ref' in node:
+            body = store.get(node['ref'])
+            if body is None:
+                missing.append(node['ref'])
+                return None
+            body = copy.deepcopy(body)
+            if 'index' in node:
+                body['index'] = node['index']
+            return body
+
+        missed = len(missing)
+        result = {key: value for key, value in node.items() if key not in ('children', 'hash')}
+        result['children'] = [child for child in map(visit, node.get('children') or [])
+                              if child is not None]
+        if 'hash' in node and len(missing) == missed:
+            store[node['hash']] = result
+        return result
+
+    return visit(tree), missing
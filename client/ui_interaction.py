@@ -1,56 +1,116 @@
-import logging
-from pywinauto import Desktop
-
-logger = logging.getLogger(__name__)
-
-
-class UIInteraction:
-    def interact(self, element_path, action, params):
-        """Взаимодействие с UI элементом"""
-        try:
-            desktop = Desktop(backend="uia")
-            element = self._find_element_by_path(desktop, element_path)
-            
-            if not element:
-                return {'success': False, 'error': 'Element not found'}
-            
-            # Выполнение действия
-            if action == 'click':
-                element.click_input()
-            elif action == 'double_click':
-                element.double_click_input()
-            elif action == 'right_click':
-                element.right_click_input()
-            elif action == 'type':
-                text = params.get('text', '')
-                element.type_keys(text)
-            elif action == 'set_text':
-                text = params.get('text', '')
-                element.set_edit_text(text)
-            elif action == 'select':
-                element.select()
-            else:
-                return {'success': False, 'error': f'Unknown action: {action}'}
-            
-            return {'success': True, 'action': action}
-            
-        except Exception as e:
-            logger.error(f"UI interaction error: {e}")
-            return {'success': False, 'error': str(e)}
-    
-    def _find_element_by_path(self, root, path):
-        """Поиск элемента по пути"""
-        try:
-            indices = [int(x) for x in path.split('.')]
-            current = root
-            
-            for idx in indices:
-                children = current.children()
-                if idx < len(children):
-                    current = children[idx]
-                else:
-                    return None
-            
-            return current
-        except:
-            return None
+import time
+import logging
+from client.ui_backend import PywinautoBackend, ACTIONS
+from client.ui_paths import PathResolver
+
+logger = logging.getLogger(__name__)
+
+# Состояния элемента, которых можно ждать между шагами пакета
+WAIT_STATES = ('exists', 'gone', 'enabled', 'visible')
+
+
+class UIInteraction:
+    def __init__(self, backend=None, resolver=None):
+        self.backend = backend or PywinautoBackend()
+        self.resolver = resolver or PathResolver(self.backend)
+    
+    def interact(self, element_path, action, params, handle=None):
+        """Взаимодействие с UI элементом (по пути или по ручке из ui_query)"""
+        try:
+            element = self._locate(element_path, handle)
+            
+            if not element:
+                return {'success': False, 'error': 'Element not found'}
+            
+            if action not in ACTIONS:
+                return {'success': False, 'error': f'Unknown action: {action}'}
+            
+            # Выполнение действия
+            self.backend.perform(element, action, params)
+            
+            return {'success': True, 'action': action}
+            
+        except Exception as e:
+            logger.error(f"UI interaction error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    def run_batch(self, steps, stop_on_error=True):
+        """Выполнение последовательности действий за один запрос
+        
+        Шаг: {'action', 'element_path' или 'handle', 'params', 'wait_for', 'delay'}.
+        wait_for = {'element_path' или 'handle', 'state', 'timeout', 'interval'} проверяется
+        перед действием; action='wait' - только ожидание; delay - пауза после.
+        Элементы берутся через общий кэш путей: пока приходят события
+        изменений UI, повторные шаги по одному диалогу проверяют элемент из
+        кэша, не перечисляя детей по пути от окна.
+        """
+        results = []
+        batch_start = time.perf_counter()
+        
+        for i, step in enumerate(steps):
+            step_start = time.perf_counter()
+            action = step.get('action')
+            element_path = step.get('element_path')
+            
+            try:
+                condition = step.get('wait_for')
+                if condition and not self._wait_for(condition):
+                    result = {'success': False, 'error': f"Timeout waiting for {condition.get('state', 'exists')}"}
+                elif action == 'wait':
+                    result = {'success': True, 'action': action}
+                else:
+                    result = self.interact(element_path, action, step.get('params', {}),
+                                           step.get('handle'))
+                
+                delay = step.get('delay')
+                if delay and result['success']:
+                    time.sleep(delay)
+                    
+            except Exception as e:
+                logger.error(f"UI batch step {i} error: {e}")
+                result = {'success': False, 'error': str(e)}
+            
+            result.update({
+                'step': i,
+                'action': action,
+                'element_path': element_path,
+                'elapsed_ms': round((time.perf_counter() - step_start) * 1000, 1)
+            })
+            results.append(result)
+            
+            if not result['success'] and stop_on_error:
+                break
+        
+        return {
+            'success': len(results) == len(steps) and all(r['success'] for r in results),
+            'steps': results,
+            'elapsed_ms': round((time.perf_counter() - batch_start) * 1000, 1)
+        }
+    
+    def _locate(self, element_path, handle=None):
+        """Элемент по ручке, если она есть, иначе по пути"""
+        if handle is not None:
+            return self.resolver.resolve_handle(handle)
+        return self.resolver.resolve(element_path)
+    
+    def _wait_for(self, condition):
+        """Ожидание состояния элемента с опросом"""
+        state = condition.get('state', 'exists')
+        if state not in WAIT_STATES:
+            raise ValueError(f'Unknown wait state: {state}')
+        
+        deadline = time.monotonic() + condition.get('timeout', 5.0)
+        interval = condition.get('interval', 0.1)
+        
+        while True:
+            element = self._locate(condition.get('element_path'), condition.get('handle'))
+            if state == 'gone':
+                if element is None:
+                    return True
+            elif element is not None:
+                if state == 'exists' or self.backend.properties(element).get(state):
+                    return True
+            
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
@@ -0,0 +1,207 @@
+import threading
+import logging
+from collections import OrderedDict, deque
+from client.metrics import metrics
+from client.ui_query import handle_matches
+
+logger = logging.getLogger(__name__)
+
+
+def parse_path(path):
+    """Разбор пути вида '0.1.3' в кортеж индексов (None, если путь некорректен)"""
+    try:
+        indices = tuple(int(x) for x in path.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    if any(i < 0 for i in indices):
+        return None
+    return indices
+
+
+class PathResolver:
+    """Поиск элементов по пути '0.1.3' с кэшем найденных элементов и их предков
+
+    Окно верхнего уровня сверяется всегда (z-порядок меняется часто, а
+    событий о нем UIA не присылает). Внутри окна элемент из кэша
+    проверяется сам по себе, без перечисления детей: жив ли он, тот ли у
+    него идентификатор и те ли предки (через backend.parent). Перестановку
+    соседей так не увидеть, поэтому кэшу внутри окон доверяется только
+    при tracking=True - когда о структурных изменениях сообщает источник
+    событий бэкенда через changed(). Без него путь проходится по живым
+    детям, а кэш лишь обновляется по дороге.
+    """
+
+    def __init__(self, backend, max_entries=256):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.tracking = False  # Изменения окон приходят в changed()
+        self._cache = OrderedDict()  # индексы -> (элемент, идентификатор)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, path):
+        """Элемент по пути или None"""
+        indices = parse_path(path)
+        if not indices:
+            return None
+
+        with self._lock, metrics.timer('path_resolve'):
+            try:
+                return self._resolve(indices)
+            except Exception as e:
+                # Элемент из кэша умер - пробуем пройти путь заново
+                logger.debug(f"Cached path {path} is stale: {e}")
+                self._evict(indices[:1])
+            try:
+                return self._resolve(indices)
+            except Exception as e:
+                logger.debug(f"Path {path} resolution failed: {e}")
+                return None
+
+    def resolve_handle(self, handle, max_nodes=5000):
+        """Элемент по ручке из результата поиска или None
+
+        Окно ищется по идентификатору, поэтому смена порядка окон не мешает.
+        Внутри окна сначала проверяется сохраненный путь; если там уже
+        другой элемент (порядок соседей поменялся), окно обходится в ширину
+        до первого элемента с теми же типом и automation_id (или именем).
+        """
+        if not isinstance(handle, dict):
+            return None
+
+        with metrics.timer('path_resolve'):
+            try:
+                window = self._find_window(handle.get('window'))
+                if window is None:
+                    return None
+
+                path = handle.get('path') or ''
+                indices = parse_path(path) if path else ()
+                if indices is not None:
+                    element = window
+                    for i in indices:
+                        children = self.backend.children(element)
+                        if i >= len(children):
+                            element = None
+                            break
+                        element = children[i]
+                    if element is not None and handle_matches(handle, self.backend.properties(element)):
+                        self.hits += 1
+                        return element
+
+                self.misses += 1
+                queue = deque([window])
+                visited = 0
+                while queue and visited < max_nodes:
+                    element = queue.popleft()
+                    visited += 1
+                    if handle_matches(handle, self.backend.properties(element)):
+                        return element
+                    queue.extend(self.backend.children(element))
+                return None
+            except Exception as e:
+                logger.debug(f"Handle resolution failed: {e}")
+                return None
+
+    def _find_window(self, window_id):
+        """Окно верхнего уровня по идентификатору (в JSON кортеж приходит списком)"""
+        if window_id is None:
+            return None
+        if isinstance(window_id, list):
+            window_id = tuple(window_id)
+        backend = self.backend
+        for window in backend.children(backend.root()):
+            try:
+                if backend.identity(window) == window_id:
+                    return window
+            except Exception:
+                continue
+        return None
+
+    def changed(self, window_id):
+        """Событие изменения в окне верхнего уровня: его ветке кэша больше нельзя доверять"""
+        with self._lock:
+            for key in [key for key, (_, identity) in self._cache.items()
+                        if len(key) == 1 and identity == window_id]:
+                self._evict(key)
+
+    def invalidate(self, path=None):
+        """Сброс кэша целиком или ветки по пути"""
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                indices = parse_path(path)
+                if indices:
+                    self._evict(indices)
+
+    def _resolve(self, indices):
+        backend = self.backend
+
+        # Окно верхнего уровня сверяем всегда: порядок окон меняется часто
+        top_key = indices[:1]
+        windows = backend.children(backend.root())
+        if indices[0] >= len(windows):
+            self._evict(top_key)
+            return None
+        window = windows[indices[0]]
+        window_id = backend.identity(window)
+        cached = self._cache.get(top_key)
+        if cached is None or cached[1] != window_id:
+            self._evict(top_key)
+            self._cache[top_key] = (window, window_id)
+        elif self.tracking and indices in self._cache:
+            element = self._validate(indices)
+            if element is not None:
+                self.hits += 1
+                self._touch(indices)
+                return element
+
+        # Проход по живым детям от окна; кэш обновляется по дороге
+        self.misses += 1
+        current = window
+        for d in range(1, len(indices)):
+            key = indices[:d + 1]
+            children = backend.children(current)
+            if indices[d] >= len(children):
+                self._evict(key)
+                return None
+            current = children[indices[d]]
+            identity = backend.identity(current)
+            cached = self._cache.get(key)
+            if cached is None or cached[1] != identity:
+                self._evict(key)
+                self._cache[key] = (current, identity)
+
+        self._touch(indices)
+        return current
+
+    def _validate(self, indices):
+        """Элемент из кэша, если он жив и висит на тех же закэшированных предках, иначе None"""
+        backend = self.backend
+        element = current = self._cache[indices][0]
+        try:
+            # Предки в кэше всегда есть, если есть потомок (см. _touch)
+            for depth in range(len(indices), 1, -1):
+                if backend.identity(current) != self._cache[indices[:depth]][1]:
+                    return None
+                current = backend.parent(current)
+            if backend.identity(current) != self._cache[indices[:1]][1]:
+                return None
+        except Exception as e:
+            logger.debug(f"Cached element {indices} is stale: {e}")
+            return None
+        return element
+
+    def _touch(self, indices):
+        # Предки должны быть "свежее" потомков, чтобы вытеснение не оставляло сирот
+        for depth in range(len(indices), 0, -1):
+            self._cache.move_to_end(indices[:depth])
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _evict(self, prefix):
+        size = len(prefix)
+        for key in [key for key in self._cache if key[:size] == prefix]:
+            del self._cache[key]
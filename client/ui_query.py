@@ -0,0 +1,182 @@
+import re
+import fnmatch
+import logging
+from collections import defaultdict
+from client.ui_backend import STRING_PROPS, BOOL_PROPS
+
+logger = logging.getLogger(__name__)
+
+# Свойства, по которым можно искать (значения - строки или шаблоны с * ? [])
+SEARCH_PROPS = ('name', 'class_name', 'control_type', 'automation_id')
+QUERY_KEYS = frozenset(SEARCH_PROPS + BOOL_PROPS + ('ancestor',))
+
+_WILDCARDS = re.compile(r'[*?\[]')
+
+
+def validate_query(query):
+    """Проверка запроса: ValueError с описанием, если он некорректен
+
+    Запрос - словарь {свойство: значение или шаблон, ...}; enabled/visible -
+    bool; ancestor - такой же запрос, которому должен соответствовать
+    какой-либо предок (вложенные ancestor задают цепочку предков).
+    """
+    if not isinstance(query, dict) or not query:
+        raise ValueError('Query must be a non-empty object')
+    unknown = set(query) - QUERY_KEYS
+    if unknown:
+        raise ValueError(f"Unknown query keys: {', '.join(sorted(unknown))}")
+    for key in SEARCH_PROPS:
+        if key in query and not isinstance(query[key], str):
+            raise ValueError(f'Query value for {key} must be a string')
+    if 'ancestor' in query:
+        validate_query(query['ancestor'])
+
+
+class WindowIndex:
+    """Индекс одного окна верхнего уровня: свойство -> значение -> позиции
+
+    Позиции отсчитываются от начала окна в снимке, поэтому индекс окна,
+    поддерево которого взято из прошлого снимка без изменений, переносится
+    в новый снимок как есть.
+    """
+    __slots__ = ('values', 'size')
+
+    def __init__(self, snapshot, pos):
+        self.size = snapshot.sizes[pos]
+        self.values = {}
+        strings = snapshot.strings
+        for key in SEARCH_PROPS:
+            groups = defaultdict(list)
+            column = snapshot.columns[STRING_PROPS.index(key)]
+            for rel, idx in enumerate(column[pos:pos + self.size]):
+                groups[idx].append(rel)
+            self.values[key] = {strings[idx]: tuple(rels) for idx, rels in groups.items()}
+
+    def lookup(self, key, pattern):
+        """Позиции узлов, у которых свойство key совпадает с pattern"""
+        table = self.values[key]
+        if not _WILDCARDS.search(pattern):
+            return table.get(pattern, ())
+        # Шаблон проверяется по различным значениям, а не по каждому узлу
+        match = re.compile(fnmatch.translate(pattern)).match
+        result = []
+        for value, rels in table.items():
+            if value is not None and match(value):
+                result.extend(rels)
+        return result
+
+
+class ElementIndex:
+    """Индекс элементов последнего снимка для поиска без обхода UI
+
+    update() вызывается на каждый сохраненный снимок; индексы окон,
+    которые перешли из прошлого снимка без повторного обхода, не
+    перестраиваются.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.windows = ()  # (позиция окна, идентификатор, WindowIndex)
+        self.reused = 0
+        self.rebuilt = 0
+
+    def update(self, snapshot, windows):
+        """windows: [(позиция окна, идентификатор или None, origin поддерева или None)]
+
+        origin - (снимок, позиция), откуда взято поддерево окна (SubtreeDict).
+        """
+        previous = {(self.snapshot, pos): entry for pos, _, entry in self.windows}
+        result = []
+        for pos, window_id, origin in windows:
+            entry = previous.get(origin) if origin is not None else None
+            if entry is not None and entry.size == snapshot.sizes[pos]:
+                self.reused += 1
+            else:
+                entry = WindowIndex(snapshot, pos)
+                self.rebuilt += 1
+            result.append((pos, window_id, entry))
+        # Снимок и окна меняются одним присваиванием: поиск идет без блокировки
+        self.snapshot, self.windows = snapshot, tuple(result)
+
+    def query(self, query, limit=100):
+        """Совпадения в прямом порядке обхода: (число найденных, [описание узла])"""
+        snapshot, windows = self.snapshot, self.windows
+        if snapshot is None:
+            return 0, []
+
+        total = 0
+        matches = []
+        for base, window_id, entry in windows:
+            for rel in _match(snapshot, base, entry, query):
+                total += 1
+                if len(matches) < limit:
+                    matches.append(self._describe(snapshot, base, window_id, base + rel))
+        return total, matches
+
+    def _describe(self, snapshot, base, window_id, pos):
+        """Свойства узла, путь для element_path и ручка, переживающая смену порядка"""
+        indexes = []
+        current = pos
+        while current > 0:
+            indexes.append(snapshot.indexes[current])
+            current = snapshot.parents[current]
+        indexes.reverse()
+
+        node = {key: snapshot.value(pos, key) for key in STRING_PROPS + BOOL_PROPS + ('rect',)}
+        node['element_path'] = '.'.join(map(str, indexes))
+        node['handle'] = {
+            'window': window_id,
+            'path': '.'.join(map(str, indexes[1:])),
+            'control_type': node['control_type'],
+            'name': node['name'],
+            'automation_id': node['automation_id']
+        }
+        return node
+
+
+def _match(snapshot, base, entry, query):
+    """Позиции (относительно окна) узлов окна, подходящих под запрос"""
+    candidates = None
+    for key in SEARCH_PROPS:
+        if key in query:
+            rels = entry.lookup(key, query[key])
+            candidates = set(rels) if candidates is None else candidates.intersection(rels)
+            if not candidates:
+                return []
+    candidates = range(entry.size) if candidates is None else sorted(candidates)
+
+    for bit, key in enumerate(BOOL_PROPS):
+        if key in query:
+            want = bool(query[key])
+            candidates = [rel for rel in candidates
+                          if bool(snapshot.flags[base + rel] & (1 << bit)) == want]
+
+    if 'ancestor' in query:
+        # Предки узла окна лежат в том же окне
+        ancestors = set(_match(snapshot, base, entry, query['ancestor']))
+        if not ancestors:
+            return []
+        parents = snapshot.parents
+        result = []
+        for rel in candidates:
+            parent = parents[base + rel]
+            while parent >= base:
+                if parent - base in ancestors:
+                    result.append(rel)
+                    break
+                parent = parents[parent]
+        candidates = result
+
+    return list(candidates)
+
+
+def handle_matches(handle, props):
+    """Соответствует ли элемент с props ручке из результата поиска
+
+    Если у элемента есть automation_id, сверяются он и тип; иначе тип и имя.
+    """
+    if handle.get('control_type') != props.get('control_type'):
+        return False
+    if handle.get('automation_id'):
+        return handle['automation_id'] == props.get('automation_id')
+    return handle.get('name') == props.get('name')
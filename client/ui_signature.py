@@ -0,0 +1,127 @@
+import time
+import hashlib
+import logging
+from client.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Frame:
+    """Кадр экрана в низком разрешении
+
+    data - пиксели построчно сверху вниз, по bpp байт; один пиксель кадра
+    покрывает scale x scale пикселей экрана. (left, top) - экранные
+    координаты левого верхнего угла (у нескольких мониторов бывают < 0).
+    """
+    __slots__ = ('width', 'height', 'data', 'bpp', 'scale', 'left', 'top')
+
+    def __init__(self, width, height, data, bpp=4, scale=1, left=0, top=0):
+        self.width = width
+        self.height = height
+        self.data = data
+        self.bpp = bpp
+        self.scale = scale
+        self.left = left
+        self.top = top
+
+    def region_hash(self, rect):
+        """Хэш пикселей области (left, top, right, bottom) в экранных координатах
+
+        Область за пределами кадра дает None.
+        """
+        left, top, right, bottom = rect
+        x0 = max((left - self.left) // self.scale, 0)
+        y0 = max((top - self.top) // self.scale, 0)
+        x1 = min(-(-(right - self.left) // self.scale), self.width)
+        y1 = min(-(-(bottom - self.top) // self.scale), self.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+
+        digest = hashlib.blake2b(digest_size=8)
+        data = memoryview(self.data)
+        row = self.width * self.bpp
+        for y in range(y0, y1):
+            offset = y * row
+            digest.update(data[offset + x0 * self.bpp:offset + x1 * self.bpp])
+        return digest.digest()
+
+
+class ScreenSignatures:
+    """Дешевые признаки изменения окон верхнего уровня до обхода UIA
+
+    Подпись окна - прямоугольник, место в z-порядке, передний план и хэш
+    его области на уменьшенном кадре экрана. Окно, подпись которого не
+    изменилась с сохраненного снимка, можно не обходить заново. Изменения,
+    которые не видны на экране (окно перекрыто, свойство без перерисовки),
+    подписи не замечают, поэтому окно все равно обходится раз в max_age секунд.
+
+    Каждый обход рабочего стола получает свой SignaturePass; его подписи
+    становятся опорными (committed) только вместе со снимком, который
+    сохранен как база, так что параллельные обходы друг другу не мешают.
+    """
+
+    def __init__(self, max_age=60.0):
+        self.max_age = max_age
+        self.committed = {}  # идентификатор окна -> (подпись, время обхода)
+
+    def begin(self, backend):
+        """Начало обхода: кадр экрана и окно переднего плана (по разу на обход)"""
+        with metrics.timer('screen_frame'):
+            try:
+                frame = backend.screen_frame()
+            except Exception as e:
+                logger.debug(f"Screen frame unavailable: {e}")
+                frame = None
+        try:
+            foreground = backend.foreground()
+        except Exception as e:
+            logger.debug(f"Foreground window unavailable: {e}")
+            foreground = None
+        return SignaturePass(self, frame, foreground)
+
+    def commit(self, signature_pass, window_ids):
+        """Снимок сохранен: подписи его окон из обхода signature_pass становятся опорными"""
+        pending = signature_pass.pending
+        self.committed = {window_id: pending[window_id]
+                          for window_id in window_ids if window_id in pending}
+
+    def reset(self):
+        self.committed = {}
+
+
+class SignaturePass:
+    """Подписи окон, посчитанные за один обход рабочего стола"""
+    __slots__ = ('owner', 'frame', 'foreground', 'pending')
+
+    def __init__(self, owner, frame, foreground):
+        self.owner = owner
+        self.frame = frame
+        self.foreground = foreground
+        self.pending = {}
+
+    def unchanged(self, backend, window, window_id, z_order):
+        """Подпись окна совпадает с опорной и окно обходилось не раньше max_age назад"""
+        try:
+            rect = backend.rectangle(window)
+        except Exception:
+            rect = None
+        frame_hash = self.frame.region_hash(rect) if self.frame is not None and rect else None
+        signature = (rect, z_order, window_id == self.foreground, frame_hash)
+
+        previous = self.owner.committed.get(window_id)
+        now = time.monotonic()
+        if previous is not None and previous[0] == signature:
+            self.pending[window_id] = previous
+            return frame_hash is not None and now - previous[1] < self.owner.max_age
+        self.pending[window_id] = (signature, now)
+        return False
+
+    def walked(self, window_id):
+        """Окно обойдено заново: отсчет max_age с текущего момента"""
+        entry = self.pending.get(window_id)
+        if entry is not None:
+            self.pending[window_id] = (entry[0], time.monotonic())
+
+    def discard(self, window_id):
+        """Поддерево окна не соответствует подписи (например, взято старое по таймауту)"""
+        self.pending.pop(window_id, None)
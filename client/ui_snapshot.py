@@ -0,0 +1,208 @@
+import sys
+import logging
+from array import array
+from client.ui_backend import STRING_PROPS, BOOL_PROPS
+
+logger = logging.getLogger(__name__)
+
+KNOWN_KEYS = frozenset(STRING_PROPS + BOOL_PROPS + ('rect', 'index', 'children'))
+
+FLAG_RECT = 0x40
+FLAG_INDEX = 0x80
+
+_MISSING = object()
+
+
+class Snapshot:
+    """Компактный неизменяемый снимок UI-дерева для хранения между захватами
+
+    Узлы лежат в прямом порядке обхода в параллельных массивах: индексы
+    строк (строки интернированы, 0 - None), флаги, index, размер поддерева,
+    родитель и rect (4 x int32). Узел i занимает позиции i..i+sizes[i]-1,
+    первый ребенок - i+1. Прочие поля узла (редкие) - в словаре extras,
+    идентификаторы элементов (NodeDict.identity) - в списке identities.
+    """
+    __slots__ = ('strings', 'columns', 'flags', 'indexes', 'sizes', 'parents', 'rects', 'extras',
+                 'identities')
+
+    def __init__(self, tree):
+        lookup = {None: 0}
+        self.strings = [None]
+        self.columns = [array('I') for _ in STRING_PROPS]
+        self.flags = array('B')
+        self.indexes = array('i')
+        self.parents = array('i')
+        self.rects = array('i')
+        self.extras = {}
+        self.identities = []
+
+        stack = [(tree, -1)]
+        while stack:
+            node, parent = stack.pop()
+            pos = len(self.flags)
+
+            for column, key in zip(self.columns, STRING_PROPS):
+                value = node.get(key)
+                idx = lookup.get(value)
+                if idx is None:
+                    idx = lookup[value] = len(self.strings)
+                    self.strings.append(sys.intern(value) if isinstance(value, str) else value)
+                column.append(idx)
+
+            flag = 0
+            for bit, key in enumerate(BOOL_PROPS):
+                if node.get(key):
+                    flag |= 1 << bit
+            rect = node.get('rect')
+            if rect:
+                flag |= FLAG_RECT
+                self.rects.extend((rect['left'], rect['top'], rect['right'], rect['bottom']))
+            else:
+                self.rects.extend((0, 0, 0, 0))
+            index = node.get('index')
+            if index is not None:
+                flag |= FLAG_INDEX
+            self.indexes.append(index if index is not None else -1)
+            self.flags.append(flag)
+            self.parents.append(parent)
+            self.identities.append(getattr(node, 'identity', None))
+
+            extra = {key: value for key, value in node.items() if key not in KNOWN_KEYS}
+            if extra:
+                self.extras[pos] = extra
+
+            children = node.get('children') or []
+            stack.extend((child, pos) for child in reversed(children))
+
+        # Размеры поддеревьев: потомки всегда правее предков
+        self.sizes = array('I', [1]) * len(self.flags)
+        for pos in range(len(self.flags) - 1, 0, -1):
+            self.sizes[self.parents[pos]] += self.sizes[pos]
+
+    def __len__(self):
+        return len(self.flags)
+
+    def root(self):
+        return NodeView(self, 0)
+
+    def children(self, pos):
+        """Позиции детей узла"""
+        result = []
+        child = pos + 1
+        end = pos + self.sizes[pos]
+        while child < end:
+            result.append(child)
+            child += self.sizes[child]
+        return result
+
+    def find(self, path):
+        """Узел по пути '0.1.3' (позиции в children, как в дельтах) или None"""
+        pos = 0
+        if path:
+            for step in path.split('.'):
+                children = self.children(pos)
+                step = int(step)
+                if not 0 <= step < len(children):
+                    return None
+                pos = children[step]
+        return NodeView(self, pos)
+
+    def value(self, pos, key, default=None):
+        """Значение поля узла как в словаре захвата"""
+        if key in STRING_PROPS:
+            return self.strings[self.columns[STRING_PROPS.index(key)][pos]]
+        if key in BOOL_PROPS:
+            return bool(self.flags[pos] & (1 << BOOL_PROPS.index(key)))
+        if key == 'rect':
+            if not self.flags[pos] & FLAG_RECT:
+                return None
+            left, top, right, bottom = self.rects[pos * 4:pos * 4 + 4]
+            return {'left': left, 'top': top, 'right': right, 'bottom': bottom}
+        if key == 'index':
+            return self.indexes[pos] if self.flags[pos] & FLAG_INDEX else default
+        if key == 'children':
+            return [NodeView(self, child) for child in self.children(pos)]
+        return self.extras.get(pos, {}).get(key, default)
+
+    def to_dict(self, pos=0):
+        """Восстановление поддерева в обычные словари"""
+        root = SubtreeDict(self._node_dict(pos))
+        root.identity = self.identities[pos]
+        root.origin = (self, pos)
+
+        stack = [(pos, root)]
+        while stack:
+            parent, parent_dict = stack.pop()
+            for child in self.children(parent):
+                child_dict = self._node_dict(child)
+                parent_dict['children'].append(child_dict)
+                stack.append((child, child_dict))
+        return root
+
+    def _node_dict(self, pos):
+        node = NodeDict((key, self.strings[column[pos]])
+                        for key, column in zip(STRING_PROPS, self.columns))
+        node.identity = self.identities[pos]
+        flag = self.flags[pos]
+        for bit, key in enumerate(BOOL_PROPS):
+            node[key] = bool(flag & (1 << bit))
+        node['children'] = []
+        node['rect'] = self.value(pos, 'rect')
+        if flag & FLAG_INDEX:
+            node['index'] = self.indexes[pos]
+        if pos in self.extras:
+            node.update(self.extras[pos])
+        return node
+
+
+class NodeView:
+    """Узел снимка с интерфейсом словаря для чтения (get, [], children)"""
+    __slots__ = ('snapshot', 'pos')
+
+    def __init__(self, snapshot, pos):
+        self.snapshot = snapshot
+        self.pos = pos
+
+    @property
+    def origin(self):
+        return self.snapshot, self.pos
+
+    @property
+    def identity(self):
+        return self.snapshot.identities[self.pos]
+
+    def get(self, key, default=None):
+        return self.snapshot.value(self.pos, key, default)
+
+    def __getitem__(self, key):
+        value = self.snapshot.value(self.pos, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def to_dict(self):
+        return self.snapshot.to_dict(self.pos)
+
+    def __repr__(self):
+        return f"<NodeView {self.pos} {self.get('control_type')} {self.get('name')!r}>"
+
+
+class NodeDict(dict):
+    """Узел захвата: identity - идентификатор элемента в бэкенде (None, если неизвестен)
+
+    Идентификатор не входит в словарь, поэтому не уходит на сервер и не
+    влияет на хэши; по нему дельты сопоставляют детей между захватами.
+    """
+    __slots__ = ('identity',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.identity = None
+
+
+class SubtreeDict(NodeDict):
+    """Поддерево, восстановленное из снимка: origin - (снимок, позиция)
+
+    По origin сравнение деревьев пропускает поддеревья, взятые из той же базы.
+    """
+    __slots__ = ('origin',)
@@ -0,0 +1,38 @@
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 16 * 1024
+
+
+def iter_chunks(pieces, chunk_size=DEFAULT_CHUNK_SIZE, level=6):
+    """Потоковое сжатие фрагментов JSON с нарезкой на блоки фиксированного размера
+
+    Выдает (номер блока, bytes, признак последнего блока). После каждого
+    фрагмента делается Z_SYNC_FLUSH, чтобы принимающая сторона могла
+    распаковать уже полученные окна, не дожидаясь конца захвата.
+    """
+    compressor = zlib.compressobj(level)
+    buffer = bytearray()
+    pending = None
+    index = 0
+
+    for piece in pieces:
+        buffer += compressor.compress(piece.encode('utf-8'))
+        buffer += compressor.flush(zlib.Z_SYNC_FLUSH)
+        while len(buffer) >= chunk_size:
+            if pending is not None:
+                yield index, pending, False
+                index += 1
+            pending = bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+
+    buffer += compressor.flush()
+    if pending is not None:
+        if not buffer:
+            yield index, pending, True
+            return
+        yield index, pending, False
+        index += 1
+    yield index, bytes(buffer), True
@@ -0,0 +1,116 @@
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureScheduler:
+    """Планировщик захватов по событиям UI
+
+    События от источника (notify) копятся в наборе "грязных" окон верхнего
+    уровня и сбрасываются одним захватом, когда события стихли на debounce
+    секунд (но не реже чем раз в max_delay). Если событий нет, выполняется
+    контрольный полный проход (heartbeat), интервал которого удваивается
+    от heartbeat_min до heartbeat_max, пока изменений не обнаружено.
+
+    on_flush(dirty) получает набор окон или None для контрольного прохода и
+    возвращает True, если изменения были найдены.
+    """
+
+    def __init__(self, on_flush, debounce=0.3, max_delay=2.0,
+                 heartbeat_min=5.0, heartbeat_max=60.0, clock=time.monotonic):
+        self.on_flush = on_flush
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.heartbeat_min = heartbeat_min
+        self.heartbeat_max = heartbeat_max
+        self.clock = clock
+
+        self._dirty = set()
+        self._first_event = None
+        self._last_event = None
+        self._heartbeat = heartbeat_min
+        self._next_heartbeat = clock() + heartbeat_min
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def notify(self, window_id):
+        """Изменение в окне верхнего уровня (вызывается из любого потока)"""
+        with self._cond:
+            now = self.clock()
+            if not self._dirty:
+                self._first_event = now
+            self._dirty.add(window_id)
+            self._last_event = now
+            self._cond.notify()
+
+    def poll(self, now=None):
+        """Очередное действие: ('flush', окна), ('heartbeat', None) или None"""
+        now = self.clock() if now is None else now
+        with self._cond:
+            if self._dirty:
+                if (now - self._last_event >= self.debounce
+                        or now - self._first_event >= self.max_delay):
+                    dirty = self._dirty
+                    self._dirty = set()
+                    self._reset_heartbeat(now)
+                    return 'flush', dirty
+                return None
+
+            if now >= self._next_heartbeat:
+                self._heartbeat = min(self._heartbeat * 2, self.heartbeat_max)
+                self._next_heartbeat = now + self._heartbeat
+                return 'heartbeat', None
+            return None
+
+    def next_deadline(self):
+        """Момент, раньше которого poll() ничего не вернет"""
+        with self._cond:
+            if self._dirty:
+                return min(self._last_event + self.debounce,
+                           self._first_event + self.max_delay)
+            return self._next_heartbeat
+
+    def activity(self, now=None):
+        """Изменения найдены - возвращаем частый heartbeat"""
+        now = self.clock() if now is None else now
+        with self._cond:
+            self._reset_heartbeat(now)
+
+    def _reset_heartbeat(self, now):
+        self._heartbeat = self.heartbeat_min
+        self._next_heartbeat = now + self._heartbeat
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name='ui-watch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _loop(self):
+        while self._running:
+            action = self.poll()
+            if action is None:
+                with self._cond:
+                    if self._running:
+                        self._cond.wait(timeout=max(self.next_deadline() - self.clock(), 0.01))
+                continue
+
+            kind, dirty = action
+            try:
+                if self.on_flush(dirty) and kind == 'heartbeat':
+                    self.activity()
+            except Exception as e:
+                logger.error(f"UI watch flush error: {e}")
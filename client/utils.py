@@ -1,27 +1,109 @@
-import ctypes
-import sys
-import os
-
-
-def is_admin():
-    """Проверка прав администратора"""
-    try:
-        return ctypes.windll.shell32.IsUserAnAdmin()
-    except:
-        return False
-
-
-def run_as_admin():
-    """Запуск с правами администратора"""
-    if sys.platform == 'win32':
-        try:
-            ctypes.windll.shell32.ShellExecuteW(
-                None,
-                "runas",
-                sys.executable,
-                " ".join(sys.argv),
-                None,
-                1
-            )
-        except:
-            pass
+import ctypes
+import sys
+import os
+import time
+import queue
+import atexit
+import threading
+import logging
+import logging.handlers
+from collections import deque
+
+
+def is_admin():
+    """Проверка прав администратора"""
+    try:
+        return ctypes.windll.shell32.IsUserAnAdmin()
+    except:
+        return False
+
+
+def run_as_admin():
+    """Запуск с правами администратора"""
+    if sys.platform == 'win32':
+        try:
+            ctypes.windll.shell32.ShellExecuteW(
+                None,
+                "runas",
+                sys.executable,
+                " ".join(sys.argv),
+                None,
+                1
+            )
+        except:
+            pass
+
+
+def setup_logging(log_file='client.log', level=logging.INFO, max_bytes=5 * 2 ** 20, backup_count=3):
+    """Настройка логирования: файл с ротацией и консоль
+    
+    Запись идет в отдельном потоке (QueueHandler -> QueueListener), так что
+    медленный диск не задерживает обработчики событий. Возвращает listener;
+    он останавливается (с дозаписью очереди) при выходе из процесса.
+    """
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.insert(0, logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    queue_handler = logging.handlers.QueueHandler(records)
+    # Запись форматируется окончательно в listener, здесь - только подстановка аргументов
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=level, handlers=[queue_handler])
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+
+def _stop_listener(listener):
+    if listener._thread is not None:
+        listener.stop()
+
+
+class StatusQueue:
+    """Сообщения статуса для окна: emit() из любого потока, drain() из GUI по таймеру
+    
+    Интерфейс emit() как у pyqtSignal, поэтому очередь передается в
+    ClientConnection вместо сигнала. Хранится не больше max_pending
+    сообщений (старые вытесняются и считаются), одинаковые подряд идущие
+    сообщения при выдаче склеиваются.
+    """
+    
+    def __init__(self, max_pending=500):
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._dropped = 0
+        self._lock = threading.Lock()
+    
+    def emit(self, message):
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self._dropped += 1
+            self._pending.append((time.time(), message))
+    
+    def drain(self):
+        """Накопленные строки для вывода: '[ЧЧ:ММ:СС] сообщение (xN)'"""
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        
+        entries = []  # [время, сообщение, повторы]
+        for timestamp, message in pending:
+            if entries and entries[-1][1] == message:
+                entries[-1][2] += 1
+            else:
+                entries.append([timestamp, message, 1])
+        
+        lines = [f"... {dropped} status messages skipped"] if dropped else []
+        for timestamp, message, count in entries:
+            line = f"[{time.strftime('%H:%M:%S', time.localtime(timestamp))}] {message}"
+            lines.append(f"{line} (x{count})" if count > 1 else line)
+        return lines
@@ -0,0 +1,54 @@
+import sys
+import time
+import subprocess
+import threading
+import unittest
+from unittest import mock
+from client.command_executor import CommandJobExecutor
+
+
+class CancelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = CommandJobExecutor(max_workers=1, timeout=30)
+        self.results = {}
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def on_done(self, job_id, result):
+        self.results[job_id] = result
+        self.done.set()
+
+    @unittest.skipIf(sys.platform == 'win32', 'POSIX sleep command')
+    def test_cancel_while_process_starts(self):
+        # Отмена приходит, когда _run уже проверил флаг, но процесс еще не записан в задание
+        real_popen = subprocess.Popen
+
+        def popen(*args, **kwargs):
+            self.assertTrue(self.executor.cancel('job'))
+            return real_popen(*args, **kwargs)
+
+        started = time.monotonic()
+        with mock.patch('client.command_executor.subprocess.Popen', popen):
+            self.executor.submit('sleep 20', on_done=self.on_done, job_id='job')
+            self.assertTrue(self.done.wait(10))
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(self.results['job']['error'], 'Cancelled')
+
+    def test_cancel_queued_job(self):
+        blocker = threading.Event()
+        self.executor.pool.submit(blocker.wait)
+        self.executor.submit('echo never', on_done=self.on_done, job_id='queued')
+        self.assertTrue(self.executor.cancel('queued'))
+        blocker.set()
+
+        self.assertTrue(self.done.wait(10))
+        self.assertEqual(self.results['queued']['error'], 'Cancelled')
+        self.assertFalse(self.executor.cancel('queued'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import subprocess
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые не должны загружаться до первого UI-события
+HEAVY_MODULES = ('PyQt5', 'pywinauto', 'comtypes', 'client.ui_capture', 'client.ui_interaction')
+
+PROBE = '''
+import os, sys, json
+import client.headless
+if sys.argv[1]:
+    from client.config import Config
+    from client.connection import ClientConnection
+    ClientConnection('http://127.0.0.1:1', config=Config(os.devnull))
+print(json.dumps(sorted(sys.modules)))
+'''
+
+
+def loaded_modules(construct):
+    """Модули, загруженные в чистом процессе импортом client.headless (и созданием клиента)"""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, '1' if construct else ''],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def heavy(modules):
+    return sorted(name for name in modules
+                  if name in HEAVY_MODULES or name.split('.')[0] in HEAVY_MODULES)
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def test_headless_import(self):
+        self.assertEqual(heavy(loaded_modules(construct=False)), [])
+
+    def test_idle_connection(self):
+        self.assertEqual(heavy(loaded_modules(construct=True)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from client.outbound import OutboundQueue
+
+
+class StreamLaneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dropped = []
+        self.queue = OutboundQueue(max_bytes=2000, on_drop=self.dropped.append)
+
+    def output(self, job_id, size=200):
+        self.queue.put('command_output', {'job_id': job_id, 'data': 'x' * size},
+                       group=f'command:{job_id}')
+
+    def result(self, job_id):
+        self.queue.put('command_result', {'job_id': job_id, 'stdout': 'done'},
+                       group=f'command:{job_id}')
+
+    def drain(self):
+        items = []
+        while len(self.queue):
+            item = self.queue.get()
+            items.append((item.event, item.data['job_id']))
+        return items
+
+    def test_chatty_stream_keeps_other_results(self):
+        self.result('a')
+        for _ in range(20):
+            self.output('b')
+
+        self.assertEqual({(item.event, item.data['job_id']) for item in self.dropped},
+                         {('command_output', 'b')})
+        self.assertIn(('command_result', 'a'), self.drain())
+
+    def test_result_after_own_output(self):
+        self.output('a')
+        self.output('b')
+        self.result('b')
+        self.result('a')
+        sent = self.drain()
+        for job_id in 'ab':
+            self.assertLess(sent.index(('command_output', job_id)), sent.index(('command_result', job_id)))
+        # Результаты между собой - в порядке постановки
+        self.assertLess(sent.index(('command_result', 'b')), sent.index(('command_result', 'a')))
+
+    def test_stream_dropped_as_a_whole(self):
+        self.output('a', 300)
+        self.output('a', 300)
+        self.result('a')
+        self.queue.put('command_result', {'job_id': 'c', 'data': 'r' * 1500})
+
+        self.assertEqual([item.event for item in self.dropped], ['command_output'] * 2)
+        self.assertEqual(self.drain(), [('command_result', 'a'), ('command_result', 'c')])
+
+
+if __name__ == '__main__':
+    unittest.main()
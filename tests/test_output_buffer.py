@@ -0,0 +1,50 @@
+import unittest
+from client.output_buffer import OutputBuffer
+
+
+class OutputBufferTest(unittest.TestCase):
+
+    def read_all(self, buffer, limit=7):
+        pages = []
+        offset = 0
+        while True:
+            page = buffer.read(offset, limit)
+            pages.append(page)
+            if page['eof']:
+                return pages
+            offset = page['next_offset']
+
+    def test_small_output_in_memory(self):
+        buffer = OutputBuffer(head_bytes=16, tail_bytes=16)
+        buffer.write('hello')
+        page = buffer.read()
+        self.assertEqual((page['data'], page['eof'], page['complete']), ('hello', True, True))
+
+    def test_spilled_output_pages(self):
+        buffer = OutputBuffer(head_bytes=8, tail_bytes=8)
+        text = ''.join(f'строка {i}\n' for i in range(20))
+        for i in range(0, len(text), 5):
+            buffer.write(text[i:i + 5])
+        try:
+            self.assertTrue(buffer.truncated)
+            pages = self.read_all(buffer)
+            self.assertEqual(''.join(page['data'] for page in pages), text)
+            self.assertTrue(all(page['complete'] for page in pages))
+        finally:
+            buffer.close()
+
+    def test_spill_limit_reported(self):
+        buffer = OutputBuffer(head_bytes=8, tail_bytes=8, max_spill_bytes=32)
+        buffer.write('x' * 100)
+        try:
+            pages = self.read_all(buffer, limit=64)
+            self.assertEqual(len(pages[-1]['data']), 32)
+            self.assertEqual(pages[-1]['total'], 100)
+            self.assertFalse(pages[-1]['complete'])
+            self.assertFalse(buffer.complete)
+        finally:
+            buffer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
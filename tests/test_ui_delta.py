@@ -0,0 +1,86 @@
+import copy
+import json
+import unittest
+from client.ui_capture import UITreeCapture
+from client.ui_delta import diff_trees, apply_patch
+from client.ui_fake import FakeBackend, FakeElement, generate_desktop
+
+
+def plain(tree):
+    return json.loads(json.dumps(tree))
+
+
+def element(uid, control_type, top, children=None):
+    props = {'class_name': control_type, 'name': f'{control_type} {uid}', 'control_type': control_type,
+             'automation_id': '', 'enabled': True, 'visible': True}
+    return FakeElement(uid, props, (0, top, 100, top + 10), children)
+
+
+class RoundTripTest(unittest.TestCase):
+    """Патч, примененный к базе сервера, дает то же дерево, что и новый захват"""
+
+    def setUp(self):
+        self.backend = FakeBackend(generate_desktop(depth=4, fanout=5))
+        self.capture = UITreeCapture(backend=self.backend)
+        self.base = copy.deepcopy(self.capture.capture(full=True))
+
+    def assert_round_trip(self):
+        update = self.capture.capture_delta()
+        self.assertTrue(update['delta'])
+        self.base = apply_patch(self.base, update['ops'])
+        self.assertEqual(plain(self.base), plain(self.capture.last_tree.to_dict()))
+        return update['ops']
+
+    def test_churn_inserts_and_removals(self):
+        rng = self.backend.rng
+        for step in range(30):
+            self.backend.churn(0.05)
+            parent = rng.choice([e for e in self.backend.elements() if e.children])
+            if step % 2 and len(parent.children) > 1:
+                del parent.children[rng.randrange(len(parent.children))]
+            else:
+                sibling = parent.children[0]
+                parent.children.insert(rng.randrange(len(parent.children) + 1),
+                                       FakeElement(10000 + step, dict(sibling.props), sibling.rect))
+            self.assert_round_trip()
+
+    def test_reordered_siblings(self):
+        window = self.backend.root().children[1]
+        window.children.reverse()
+        ops = self.assert_round_trip()
+        self.assertEqual([op['op'] for op in ops], ['children'])
+
+    def test_no_changes(self):
+        self.assertEqual(self.assert_round_trip(), [])
+
+
+class InsertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = element(2, 'List', 0, [element(100 + i, 'ListItem', i * 10) for i in range(20)])
+        desktop = element(0, 'Pane', 0, [element(1, 'Window', 0, [self.rows])])
+        self.capture = UITreeCapture(backend=FakeBackend(desktop))
+        self.base = copy.deepcopy(self.capture.capture(full=True))
+
+    def test_insert_at_top_is_one_op(self):
+        self.rows.children.insert(0, element(99, 'ListItem', 0))
+        ops = self.capture.capture_delta()['ops']
+
+        # Остальные строки сопоставлены по идентификатору, их index - в той же операции
+        self.assertEqual(len(ops), 1)
+        self.assertEqual(ops[0]['op'], 'children')
+        self.assertEqual(ops[0]['children'][1:], [[i, i + 1] for i in range(20)])
+        self.assertEqual(plain(apply_patch(self.base, ops)), plain(self.capture.last_tree.to_dict()))
+
+    def test_plain_dicts_match_by_ordinal(self):
+        # Узлы без идентификатора (не из захвата) сопоставляются по типу и порядковому номеру
+        old = plain(self.base)
+        new = copy.deepcopy(old)
+        new['children'][0]['children'][0]['children'][3]['name'] = 'renamed'
+        ops = diff_trees(old, new)
+        self.assertEqual(ops, [{'op': 'set', 'path': '0.0.3', 'props': {'name': 'renamed'}}])
+        self.assertEqual(apply_patch(old, ops), new)
+
+
+if __name__ == '__main__':
+    unittest.main()
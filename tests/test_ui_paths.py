@@ -0,0 +1,99 @@
+import unittest
+from client.ui_fake import FakeBackend, generate_desktop
+from client.ui_paths import PathResolver
+
+
+class PathResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeBackend(generate_desktop(depth=4, fanout=5))
+        self.resolver = PathResolver(self.backend)
+
+    def walk(self, path):
+        element = self.backend.root()
+        for i in path.split('.'):
+            element = self.backend.children(element)[int(i)]
+        return element
+
+    def test_cached_path_resolves_same_element(self):
+        for _ in range(2):
+            self.assertIs(self.resolver.resolve('0.1.2.3'), self.walk('0.1.2.3'))
+
+    def test_reordered_siblings_after_resolve(self):
+        # Кэш заполнен, затем соседи на промежуточном шаге меняются местами
+        for path in ('0.1.2', '0.1.2.3', '0.2.2.3'):
+            self.resolver.resolve(path)
+        window = self.backend.children(self.backend.root())[0]
+        window.children[1], window.children[2] = window.children[2], window.children[1]
+
+        for path in ('0.1.2', '0.1.2.3', '0.2.2.3', '0.1'):
+            self.assertIs(self.resolver.resolve(path), self.walk(path), path)
+
+    def test_reordered_windows_after_resolve(self):
+        self.resolver.resolve('1.0.1')
+        root = self.backend.root()
+        root.children[0], root.children[1] = root.children[1], root.children[0]
+        self.assertIs(self.resolver.resolve('1.0.1'), self.walk('1.0.1'))
+
+    def test_missing_path(self):
+        self.resolver.resolve('0.1.2')
+        self.backend.children(self.backend.root())[0].children[1].children.clear()
+        self.assertIsNone(self.resolver.resolve('0.1.2'))
+
+
+
+class TrackingPathResolverTest(unittest.TestCase):
+    """Кэш при событиях изменений: повторные пути без перечисления детей"""
+
+    def setUp(self):
+        self.backend = FakeBackend(generate_desktop(depth=4, fanout=5))
+        self.resolver = PathResolver(self.backend)
+        self.resolver.tracking = True
+
+    def walk(self, path):
+        element = self.backend.root()
+        for i in path.split('.'):
+            element = self.backend.children(element)[int(i)]
+        return element
+
+    def test_hit_does_not_enumerate_children(self):
+        element = self.resolver.resolve('0.1.2.3')
+        self.backend.calls.clear()
+
+        self.assertIs(self.resolver.resolve('0.1.2.3'), element)
+        # Только список окон рабочего стола; внутри окна - identity и parent
+        self.assertEqual(self.backend.calls['children'], 1)
+        self.assertEqual(self.backend.calls['identity'], 5)
+        self.assertEqual(self.backend.calls['parent'], 3)
+        self.assertEqual(self.resolver.hits, 1)
+
+    def test_reorder_reported_by_event(self):
+        self.resolver.resolve('0.1.2.3')
+        window = self.backend.children(self.backend.root())[0]
+        window.children[1], window.children[2] = window.children[2], window.children[1]
+        self.resolver.changed(window.uid)
+
+        expected = self.walk('0.1.2.3')
+        self.backend.calls.clear()
+        self.assertIs(self.resolver.resolve('0.1.2.3'), expected)
+        self.assertEqual(self.backend.calls['children'], 4)
+
+    def test_moved_element_is_not_reused(self):
+        element = self.resolver.resolve('0.1.2')
+        old_parent = element.parent
+        new_parent = self.walk('0.3')
+        old_parent.children.remove(element)
+        new_parent.children.append(element)
+        element.parent = new_parent
+
+        self.assertIs(self.resolver.resolve('0.1.2'), self.walk('0.1.2'))
+
+    def test_reordered_windows(self):
+        self.resolver.resolve('1.0.1')
+        root = self.backend.root()
+        root.children[0], root.children[1] = root.children[1], root.children[0]
+        self.assertIs(self.resolver.resolve('1.0.1'), self.walk('1.0.1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from client.ui_capture import UITreeCapture
+from client.ui_fake import FakeBackend, generate_desktop
+from client.ui_signature import Frame, ScreenSignatures
+
+
+class FrameTest(unittest.TestCase):
+
+    def setUp(self):
+        # 4 x 4 пикселя по 1 байту, каждый покрывает 2 x 2 пикселя экрана с (-8, 0)
+        self.frame = Frame(4, 4, bytes(range(16)), bpp=1, scale=2, left=-8, top=0)
+
+    def test_region_hash(self):
+        self.assertEqual(self.frame.region_hash((-8, 0, -4, 4)), self.frame.region_hash((-8, 0, -5, 3)))
+        self.assertNotEqual(self.frame.region_hash((-8, 0, -4, 4)), self.frame.region_hash((-4, 0, 0, 4)))
+
+    def test_changed_pixel(self):
+        data = bytearray(self.frame.data)
+        data[5] ^= 0xff
+        changed = Frame(4, 4, bytes(data), bpp=1, scale=2, left=-8, top=0)
+        self.assertNotEqual(changed.region_hash((-8, 0, -4, 4)), self.frame.region_hash((-8, 0, -4, 4)))
+        self.assertEqual(changed.region_hash((-4, 0, 0, 8)), self.frame.region_hash((-4, 0, 0, 8)))
+
+    def test_outside_frame(self):
+        self.assertIsNone(self.frame.region_hash((0, 0, 10, 10)))
+        self.assertIsNone(self.frame.region_hash((-20, 0, -8, 8)))
+
+
+class ScreenSignaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeBackend(generate_desktop(depth=3, fanout=4))
+        self.backend.render_frame(scale=2)
+        self.signatures = ScreenSignatures()
+        self.windows = self.backend.root().children
+
+    def unchanged(self, commit=True):
+        signature_pass = self.signatures.begin(self.backend)
+        result = [signature_pass.unchanged(self.backend, window, window.uid, z_order)
+                  for z_order, window in enumerate(self.windows)]
+        if commit:
+            self.signatures.commit(signature_pass, [window.uid for window in self.windows])
+        return result
+
+    def change(self, window):
+        leaf = window.children[-1]
+        leaf.props.update(visible=True, name='changed')
+        self.backend.render_frame(scale=2)
+
+    def test_reuse_after_commit(self):
+        self.assertEqual(self.unchanged(), [False] * 4)
+        self.assertEqual(self.unchanged(), [True] * 4)
+
+    def test_visible_change_invalidates_window(self):
+        self.unchanged()
+        self.change(self.windows[1])
+        self.assertEqual(self.unchanged(), [True, False, True, True])
+        self.assertEqual(self.unchanged(), [True] * 4)
+
+    def test_uncommitted_pass_is_not_reference(self):
+        self.unchanged()
+        self.change(self.windows[2])
+        self.unchanged(commit=False)
+        self.assertEqual(self.unchanged(), [True, True, False, True])
+
+    def test_foreground_and_z_order(self):
+        self.unchanged()
+        self.backend.foreground_uid = self.windows[0].uid
+        self.assertEqual(self.unchanged(), [False, True, True, True])
+        self.windows[2], self.windows[3] = self.windows[3], self.windows[2]
+        self.assertEqual(self.unchanged(), [True, True, False, False])
+
+    def test_max_age(self):
+        self.signatures.max_age = 0
+        self.unchanged()
+        self.assertEqual(self.unchanged(), [False] * 4)
+
+    def test_without_frame(self):
+        self.backend.frame = None
+        self.unchanged()
+        self.assertEqual(self.unchanged(), [False] * 4)
+
+
+class CaptureReuseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeBackend(generate_desktop(depth=4, fanout=5))
+        self.backend.render_frame(scale=2)
+        self.capture = UITreeCapture(backend=self.backend)
+        self.capture.signatures = ScreenSignatures()
+        self.capture.capture_delta()
+
+    def test_only_changed_window_walked(self):
+        window = self.backend.root().children[3]
+        window.children[0].props.update(visible=True, name='changed')
+        self.backend.render_frame(scale=2)
+
+        self.backend.calls.clear()
+        update = self.capture.capture_delta()
+        self.assertEqual([op['path'] for op in update['ops']], ['3.0'])
+        # Корень и обойденное окно; остальные окна взяты из снимка
+        walked = sum(1 for _ in _elements(window)) + 1
+        self.assertEqual(self.backend.calls['properties'], walked)
+
+        self.backend.calls.clear()
+        self.assertEqual(self.capture.capture_delta()['ops'], [])
+        self.assertEqual(self.backend.calls['properties'], 1)
+
+    def test_explicit_capture_walks_everything(self):
+        self.backend.calls.clear()
+        self.capture.capture(full=True)
+        self.assertEqual(self.backend.calls['properties'], sum(1 for _ in self.backend.elements()))
+
+
+def _elements(element):
+    yield element
+    for child in element.children:
+        yield from _elements(child)
+
+
+if __name__ == '__main__':
+    unittest.main()
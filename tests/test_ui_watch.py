@@ -0,0 +1,79 @@
+import unittest
+from client.ui_watch import CaptureScheduler
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class CaptureSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = CaptureScheduler(lambda dirty: False, debounce=0.25, max_delay=2.0,
+                                          heartbeat_min=5.0, heartbeat_max=20.0, clock=self.clock)
+
+    def test_debounce(self):
+        self.scheduler.notify('a')
+        self.clock.advance(0.125)
+        self.scheduler.notify('b')
+        self.assertIsNone(self.scheduler.poll())
+        self.assertEqual(self.scheduler.next_deadline(), self.clock.now + 0.25)
+
+        self.clock.advance(0.25)
+        self.assertEqual(self.scheduler.poll(), ('flush', {'a', 'b'}))
+        self.assertIsNone(self.scheduler.poll())
+
+    def test_max_delay(self):
+        # События идут чаще debounce - захват все равно не позже max_delay от первого
+        self.scheduler.notify('a')
+        for _ in range(15):
+            self.clock.advance(0.125)
+            self.scheduler.notify('b')
+            self.assertIsNone(self.scheduler.poll())
+        self.clock.advance(0.125)
+        self.scheduler.notify('c')
+        self.assertEqual(self.scheduler.poll(), ('flush', {'a', 'b', 'c'}))
+
+    def test_heartbeat_backoff(self):
+        intervals = []
+        last = self.clock.now
+        while len(intervals) < 5:
+            self.clock.now = self.scheduler.next_deadline()
+            self.assertEqual(self.scheduler.poll(), ('heartbeat', None))
+            intervals.append(self.clock.now - last)
+            last = self.clock.now
+        self.assertEqual(intervals, [5.0, 10.0, 20.0, 20.0, 20.0])
+
+    def test_activity_resets_heartbeat(self):
+        for _ in range(3):
+            self.clock.now = self.scheduler.next_deadline()
+            self.scheduler.poll()
+        self.scheduler.activity()
+        self.assertEqual(self.scheduler.next_deadline(), self.clock.now + 5.0)
+
+    def test_flush_resets_heartbeat(self):
+        for _ in range(2):
+            self.clock.now = self.scheduler.next_deadline()
+            self.scheduler.poll()
+        self.scheduler.notify('a')
+        self.clock.advance(0.25)
+        self.assertEqual(self.scheduler.poll(), ('flush', {'a'}))
+        self.assertEqual(self.scheduler.next_deadline(), self.clock.now + 5.0)
+
+    def test_no_heartbeat_while_dirty(self):
+        self.clock.now = self.scheduler.next_deadline()
+        self.scheduler.notify('a')
+        self.assertIsNone(self.scheduler.poll())
+
+
+if __name__ == '__main__':
+    unittest.main()